@@ -50,6 +50,7 @@ from bempp.api.assembly.boundary_operator import ZeroBoundaryOperator
 from bempp.api.assembly.boundary_operator import MultiplicationOperator
 from bempp.api.assembly.blocked_operator import BlockedOperator
 from bempp.api.assembly.blocked_operator import GeneralizedBlockedOperator
+from bempp.api.assembly.wideband_operator import WidebandOperator
 
 from bempp.api.fmm.fmm_assembler import clear_fmm_cache
 
@@ -111,9 +112,9 @@ def _init_logger():
     return logger
 
 
-def log(message, level="info", flush=True):
+def log(message, level="info", flush=True, extra=None):
     """Log including default flushing for IPython."""
-    LOGGER.log(LOG_LEVEL[level], message)
+    LOGGER.log(LOG_LEVEL[level], message, extra=extra)
     if flush:
         flush_log()
 
@@ -181,7 +182,11 @@ class Timer:
     def __enter__(self):
         """Enter."""
         if self.enable_log:
-            log("Start operation: " + self.message, level=self.level)
+            log(
+                "Start operation: " + self.message,
+                level=self.level,
+                extra={"operation": self.message, "interval": None},
+            )
         self.start = _time.time()
         return self
 
@@ -193,6 +198,7 @@ class Timer:
             log(
                 "Finished Operation: " + self.message + f": {self.interval}s",
                 level=self.level,
+                extra={"operation": self.message, "interval": self.interval},
             )
 
 
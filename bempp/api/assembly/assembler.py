@@ -9,6 +9,7 @@ def _create_assembler(
     from bempp.core.dense_assembler import DenseAssembler
     from bempp.core.diagonal_assembler import DiagonalAssembler
     from bempp.api.fmm.fmm_assembler import FmmAssembler
+    from bempp.core.hmat_assembler import HMatAssembler
     from bempp.api import check_for_fmm
 
     # from bempp.core.numba.dense_assembler import DenseAssembler
@@ -35,6 +36,8 @@ def _create_assembler(
                 "No compatible FMM library found. Please install Exafmm from github.com/exafmm/exafmm-t."
             )
         return FmmAssembler(domain, dual_to_range, parameters)
+    if identifier == "hmat":
+        return HMatAssembler(domain, dual_to_range, parameters)
     else:
         raise ValueError("Unknown assembler type.")
     # if identifier == "dense_evaluator":
@@ -168,6 +171,31 @@ class PotentialAssembler(object):
         else:
             return self._implementation.evaluate(x)
 
+    def evaluate_block(self, x):
+        """
+        Evaluate the potential for each column of x.
+
+        Returns an array of shape (kernel_dimension, number_of_points,
+        number_of_columns).
+        """
+        import numpy as np
+
+        if not self._is_complex and np.iscomplexobj(x):
+            return self.evaluate_block(np.real(x)) + 1j * self.evaluate_block(
+                np.imag(x)
+            )
+        if hasattr(self._implementation, "evaluate_block"):
+            return self._implementation.evaluate_block(x)
+        return np.stack(
+            [
+                self._implementation.evaluate(column).reshape(
+                    [self.kernel_dimension, -1]
+                )
+                for column in x.T
+            ],
+            axis=2,
+        )
+
 
 def select_potential_implementation(
     space, points, operator_descriptor, device_interface, assembler, parameters
@@ -24,6 +24,26 @@ class PotentialOperator(object):
         """
         return self._evaluator.evaluate(grid_fun.coefficients)
 
+    def evaluate_block(self, coefficients):
+        """
+        Apply the potential operator to several coefficient vectors.
+
+        The kernel is only evaluated once for all vectors.
+
+        Parameters
+        ----------
+        coefficients : np.ndarray
+            Coefficients of the boundary densities in the space of the
+            operator, one density per column.
+
+        Returns
+        -------
+        An array of shape (component_count, number_of_points,
+        number_of_columns).
+
+        """
+        return self._evaluator.evaluate_block(coefficients)
+
     def _is_compatible(self, other):
         """Check compatibility with other potential operator."""
         import numpy as np
@@ -114,6 +134,10 @@ class _ScaledPotentialOperator(PotentialOperator):
         """
         return self._alpha * self._op.evaluate(grid_fun)
 
+    def evaluate_block(self, coefficients):
+        """Apply the potential operator to several coefficient vectors."""
+        return self._alpha * self._op.evaluate_block(coefficients)
+
     @property
     def space(self):
         """Return the underlying function space."""
@@ -154,6 +178,12 @@ class _SumPotentialOperator(PotentialOperator):
         """
         return self._op1.evaluate(grid_fun) + self._op2.evaluate(grid_fun)
 
+    def evaluate_block(self, coefficients):
+        """Apply the potential operator to several coefficient vectors."""
+        return self._op1.evaluate_block(coefficients) + self._op2.evaluate_block(
+            coefficients
+        )
+
     @property
     def space(self):
         """Return the underlying function space."""
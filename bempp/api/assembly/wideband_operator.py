@@ -0,0 +1,305 @@
+"""Wideband interpolation of Helmholtz boundary operators in the wavenumber."""
+
+import numpy as _np
+
+from bempp.api.assembly.boundary_operator import BoundaryOperator
+
+# pylint: disable=invalid-name
+# pylint: disable=too-many-arguments
+
+
+class WidebandOperator(object):
+    """
+    Interpolate the weak form of a Helmholtz operator over a wavenumber band.
+
+    The entries of a Helmholtz operator oscillate as exp(i k r) with the
+    distance r between test and trial functions. This oscillation is
+    extracted with the distance R between the centres of the degrees of
+    freedom, and the remaining smooth part is assembled at Chebychev nodes
+    of the band. The weak form at any other wavenumber is obtained by
+    barycentric interpolation of the smooth part.
+
+    The number of nodes is doubled (reusing the nested nodes) until the
+    relative error at check wavenumbers, between the interpolated and the
+    assembled matrices, is below the tolerance. If the maximum order is
+    reached, the band is split in two.
+
+    Memory: (order + 1) dense matrices are stored per band.
+
+    """
+
+    def __init__(
+        self,
+        operator_factory,
+        k_min,
+        k_max,
+        tol=1e-6,
+        order=4,
+        max_order=32,
+        max_depth=4,
+    ):
+        """
+        Construct a wideband operator.
+
+        Parameters
+        ----------
+        operator_factory : callable
+            Function that returns the BoundaryOperator at a given wavenumber.
+        k_min : float
+            Lower bound of the band.
+        k_max : float
+            Upper bound of the band.
+        tol : float
+            Target relative error (Frobenius norm) of the interpolated weak
+            forms.
+        order : int
+            Initial order of the interpolation.
+        max_order : int
+            Maximum order in a band before the band is split.
+        max_depth : int
+            Maximum number of band splits.
+
+        """
+        import bempp.api
+
+        if k_min > k_max:
+            k_min, k_max = k_max, k_min
+
+        self._operator_factory = operator_factory
+        self._tol = tol
+        self._order = max(order, 1)
+        self._max_order = max_order
+        self._max_depth = max_depth
+        self._assembly_count = 0
+        self._bands = []
+
+        reference = operator_factory(k_min)
+        self._domain = reference.domain
+        self._range = reference.range
+        self._dual_to_range = reference.dual_to_range
+        self._parameters = reference.parameters
+
+        rows = _dof_centers(self._dual_to_range)
+        cols = _dof_centers(self._domain)
+        if rows is None or cols is None:
+            self._distances = None
+        else:
+            self._distances = _np.linalg.norm(
+                rows[:, _np.newaxis, :] - cols[_np.newaxis, :, :], axis=2
+            )
+
+        with bempp.api.Timer(message="Wideband operator construction"):
+            if k_min == k_max:
+                self._build_single(k_min)
+            else:
+                self._build_band(k_min, k_max, 0)
+
+    @property
+    def bands(self):
+        """Return the (k_min, k_max, order, error) of each band."""
+        return [
+            (band["k_min"], band["k_max"], band["order"], band["error"])
+            for band in self._bands
+        ]
+
+    @property
+    def error_estimate(self):
+        """Return the largest a-posteriori error estimate of the bands."""
+        return max(band["error"] for band in self._bands)
+
+    @property
+    def assembly_count(self):
+        """Return the number of dense assemblies done during construction."""
+        return self._assembly_count
+
+    def at(self, k):
+        """Return the interpolated boundary operator at wavenumber k."""
+        return InterpolatedBoundaryOperator(self, k)
+
+    def matrix(self, k):
+        """Return the interpolated weak form at wavenumber k as dense matrix."""
+        band = self._find_band(k)
+        interp = band["interpolation"]
+        x = _to_reference(k, band["k_min"], band["k_max"])
+        coefficients = interp.barycentric_coefficients(x)
+        smooth = _np.tensordot(coefficients, band["values"], axes=1)
+        return self._add_phase(smooth, k)
+
+    def estimate_error(self, k):
+        """
+        Return the relative error of the interpolated weak form at k.
+
+        This assembles the operator at k, so it is as expensive as a
+        standard assembly.
+        """
+        return _relative_error(self.matrix(k), self._assemble(k))
+
+    def _assemble(self, k):
+        """Assemble the weak form at k as a dense matrix."""
+        from bempp.api import as_matrix
+
+        self._assembly_count += 1
+        return as_matrix(self._operator_factory(k).weak_form())
+
+    def _add_phase(self, mat, k):
+        """Multiply by the oscillating phase."""
+        if self._distances is None:
+            return mat
+        return mat * _np.exp(1j * k * self._distances)
+
+    def _smooth_part(self, k):
+        """Return the phase-extracted weak form at k."""
+        if self._distances is None:
+            return self._assemble(k)
+        return self._assemble(k) * _np.exp(-1j * k * self._distances)
+
+    def _find_band(self, k):
+        """Return the band containing k."""
+        for band in self._bands:
+            width = band["k_max"] - band["k_min"]
+            if band["k_min"] - 1e-10 * width <= k <= band["k_max"] + 1e-10 * width:
+                return band
+        raise ValueError(f"Wavenumber {k} is outside of the interpolation band.")
+
+    def _build_single(self, k):
+        """Store a band reduced to one wavenumber."""
+        from bempp.api.utils.interpolation import ChebychevInterpolation
+
+        self._bands.append(
+            {
+                "k_min": k,
+                "k_max": k,
+                "order": 0,
+                "error": 0.0,
+                "interpolation": ChebychevInterpolation(0),
+                "values": self._smooth_part(k)[_np.newaxis],
+            }
+        )
+
+    def _build_band(self, k_min, k_max, depth):
+        """Build the interpolation of a band, split if needed."""
+        import bempp.api
+        from bempp.api.utils.interpolation import ChebychevInterpolation
+
+        cache = {}
+        order = self._order
+        while True:
+            interp = ChebychevInterpolation(order)
+            nodes_k = _from_reference(interp.nodes, k_min, k_max)
+            for k in nodes_k:
+                if k not in cache:
+                    cache[k] = self._smooth_part(k)
+            values = _np.array([cache[k] for k in nodes_k])
+
+            # check in the middle of the outer node intervals, where the
+            # interpolation error is largest
+            error = 0.0
+            for x in _np.cos(_np.pi * _np.array([0.5, order - 0.5]) / order):
+                k = _from_reference(x, k_min, k_max)
+                coefficients = interp.barycentric_coefficients(x)
+                smooth = _np.tensordot(coefficients, values, axes=1)
+                error = max(
+                    error,
+                    _relative_error(self._add_phase(smooth, k), self._assemble(k)),
+                )
+
+            bempp.api.log(
+                f"Wideband band [{k_min}, {k_max}], order {order}: error {error:.2E}"
+            )
+            if error <= self._tol or 2 * order > self._max_order:
+                break
+            order *= 2
+
+        if error > self._tol and depth < self._max_depth:
+            del cache, values
+            k_mid = 0.5 * (k_min + k_max)
+            self._build_band(k_min, k_mid, depth + 1)
+            self._build_band(k_mid, k_max, depth + 1)
+            return
+
+        if error > self._tol:
+            bempp.api.log(
+                f"Wideband band [{k_min}, {k_max}] did not reach the tolerance: "
+                + f"error {error:.2E}",
+                "warning",
+            )
+
+        self._bands.append(
+            {
+                "k_min": k_min,
+                "k_max": k_max,
+                "order": order,
+                "error": error,
+                "interpolation": interp,
+                "values": values,
+            }
+        )
+
+
+class InterpolatedBoundaryOperator(BoundaryOperator):
+    """Boundary operator whose weak form is interpolated by a WidebandOperator."""
+
+    def __init__(self, wideband_operator, k):
+        """Construct the operator at wavenumber k."""
+        super().__init__(
+            wideband_operator._domain,
+            wideband_operator._range,
+            wideband_operator._dual_to_range,
+            wideband_operator._parameters,
+        )
+        self._wideband_operator = wideband_operator
+        self._wavenumber = k
+
+    def _assemble(self):
+        """Interpolate the weak form."""
+        from bempp.api.assembly.discrete_boundary_operator import (
+            DenseDiscreteBoundaryOperator,
+        )
+
+        return DenseDiscreteBoundaryOperator(
+            self._wideband_operator.matrix(self._wavenumber)
+        )
+
+
+def _to_reference(k, k_min, k_max):
+    """Map a wavenumber to [-1, 1]."""
+    if k_max == k_min:
+        return 0.0
+    return 2 * (k - k_min) / (k_max - k_min) - 1
+
+
+def _from_reference(x, k_min, k_max):
+    """Map [-1, 1] to the band."""
+    return k_min + 0.5 * (x + 1) * (k_max - k_min)
+
+
+def _relative_error(approximation, reference):
+    """Relative error in Frobenius norm."""
+    norm = _np.linalg.norm(reference)
+    if norm == 0:
+        return _np.linalg.norm(approximation)
+    return _np.linalg.norm(approximation - reference) / norm
+
+
+def _dof_centers(space):
+    """
+    Return the centre of each global dof as the mean of the centroids of
+    the elements it is attached to. Return None for spaces requiring a dof
+    transformation.
+    """
+    if space.requires_dof_transformation:
+        return None
+
+    elements = space.support_elements
+    local2global = space.local2global[elements]
+    multipliers = space.local_multipliers[elements]
+    centroids = space.grid.centroids[elements]
+
+    centers = _np.zeros((space.global_dof_count, 3), dtype="float64")
+    count = _np.zeros(space.global_dof_count, dtype="float64")
+    for local_index in range(local2global.shape[1]):
+        active = multipliers[:, local_index] != 0
+        _np.add.at(centers, local2global[active, local_index], centroids[active])
+        _np.add.at(count, local2global[active, local_index], 1)
+    count[count == 0] = 1
+    return centers / count[:, _np.newaxis]
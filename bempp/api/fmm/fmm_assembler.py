@@ -39,6 +39,7 @@ def get_fmm_interface(
         mode,
         wavenumber,
         parameters.fmm.expansion_order,
+        parameters.fmm.depth,
         parameters.fmm.ncrit,
     )
 
@@ -62,31 +63,42 @@ def get_fmm_interface(
     return interface
 
 
-def get_fmm_potential_interface(space, points, mode, wavenumber):
+def get_fmm_potential_interface(space, points, mode, wavenumber, parameters=None):
     """Get an Fmm potential instance."""
     import bempp.api
 
     global _FMM_POTENTIAL_CACHE
 
+    parameters = bempp.api.assign_parameters(parameters)
+
     points_hash = hash(points.data.tobytes())
 
-    key = (space.grid.id, points_hash, mode, wavenumber)
+    key = (
+        space.grid.id,
+        points_hash,
+        mode,
+        wavenumber,
+        parameters.quadrature.regular,
+        parameters.fmm.expansion_order,
+        parameters.fmm.depth,
+        parameters.fmm.ncrit,
+    )
 
     interface = _FMM_POTENTIAL_CACHE.get(key, None)
 
     if interface is None:
         from bempp.api.fmm.exafmm import ExafmmInterface
 
-        quadrature_order = bempp.api.GLOBAL_PARAMETERS.quadrature.regular
+        quadrature_order = parameters.quadrature.regular
 
         interface = ExafmmInterface(
             space.grid.map_to_point_cloud(quadrature_order, precision="double"),
             points.T,
             mode,
             wavenumber,
-            bempp.api.GLOBAL_PARAMETERS.fmm.depth,
-            bempp.api.GLOBAL_PARAMETERS.fmm.expansion_order,
-            bempp.api.GLOBAL_PARAMETERS.fmm.ncrit,
+            parameters.fmm.depth,
+            parameters.fmm.expansion_order,
+            parameters.fmm.ncrit,
         )
         _FMM_POTENTIAL_CACHE[key] = interface
     else:
@@ -154,7 +166,7 @@ class FmmPotentialAssembler(object):
             raise ValueError(f"Unknown value {mode} for `mode`.")
 
         fmm_potential_interface = get_fmm_potential_interface(
-            space, points, mode, wavenumber
+            space, points, mode, wavenumber, parameters
         )
         self._evaluator = create_potential_evaluator(
             operator_descriptor, fmm_potential_interface, space, parameters
@@ -1509,8 +1509,7 @@ def _grid_scatter_worker(grid_id, array_proxies):
 
     vertices, elements, domain_indices = pool.from_buffer(array_proxies)
 
-    # if not pool.has_key(grid_id):
-    if grid_id not in pool:
+    if not pool.has_key(grid_id):
         pool.insert_data(
             grid_id,
             Grid(vertices.copy(), elements.copy(), domain_indices.copy(), grid_id),
@@ -6,4 +6,5 @@ can be found at https://bempp.com/handbook/api/solvers.html
 
 from .iterative_solvers import gmres
 from .iterative_solvers import cg
+from .iterative_solvers import FrequencyContinuationSolver
 from .direct_solvers import lu
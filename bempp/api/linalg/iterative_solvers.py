@@ -23,15 +23,21 @@ class IterationCounter(object):
         from bempp.api import log
 
         self._count += 1
+        residual = None
+        if not self._iteration_is_cg:
+            # legacy GMRES callback: x is the residual norm
+            residual = _np.linalg.norm(x)
+        elif self._store_residuals:
+            residual = _np.linalg.norm(self._rhs - self._operator * x)
         if self._store_residuals:
-            if self._iteration_is_cg:
-                res = self._rhs - self._operator * x
-            else:
-                res = x
-            self._residuals.append(_np.linalg.norm(res))
-            log(f"GMRES Iteration {self._count} with residual {self._residuals[-1]}")
-        else:
+            self._residuals.append(residual)
+        if residual is None:
             log(f"GMRES Iteration {self._count}")
+        else:
+            log(
+                f"GMRES Iteration {self._count} with residual {residual}",
+                extra={"residual": residual},
+            )
 
     @property
     def count(self):
@@ -44,6 +50,325 @@ class IterationCounter(object):
         return self._residuals
 
 
+class FrequencyContinuationSolver(object):
+    """
+    GCRO-DR solver for sequences of systems parametrised by a wavenumber.
+
+    Consecutive wavenumbers of a frequency sweep produce nearly identical
+    systems. This solver warm-starts each system from the previous
+    solutions, extrapolated in k, and recycles a deflation subspace of
+    approximate harmonic Ritz vectors from one system to the next
+    (GCRO-DR, Parks et al., SIAM J. Sci. Comput. 28(5), 2006).
+
+    Systems must be solved in order of the sweep. Several right-hand sides
+    can be given for the same operator, in which case each of them has its
+    own extrapolation history and all share the recycled subspace.
+
+    """
+
+    def __init__(
+        self,
+        tol=1e-5,
+        restart=30,
+        recycle=10,
+        maxiter=None,
+        extrapolation_order=1,
+        use_strong_form=False,
+    ):
+        """
+        Initialize the solver.
+
+        Parameters
+        ----------
+        tol : float
+            Relative tolerance of the residual.
+        restart : int
+            Dimension of the search space of a cycle (recycled + Krylov).
+        recycle : int
+            Dimension of the recycled subspace.
+        maxiter : int
+            Maximum number of iterations per right-hand side.
+            Defaults to ten times the size of the system.
+        extrapolation_order : int
+            Order of the polynomial extrapolation in k of the initial guess.
+            Use 0 to restart from the previous solution.
+        use_strong_form : bool
+            Solve the strong form instead of the weak form.
+
+        """
+        if recycle >= restart:
+            raise ValueError("'recycle' must be smaller than 'restart'.")
+
+        self._tol = tol
+        self._restart = restart
+        self._recycle = recycle
+        self._maxiter = maxiter
+        self._extrapolation_order = extrapolation_order
+        self._use_strong_form = use_strong_form
+
+        self._recycled_space = None
+        self._history = {}
+        self._iteration_counts = []
+        self._wavenumbers = []
+
+    @property
+    def iteration_counts(self):
+        """Return the iteration counts of each right-hand side, per system."""
+        return self._iteration_counts
+
+    @property
+    def wavenumbers(self):
+        """Return the wavenumbers of the solved systems."""
+        return self._wavenumbers
+
+    def reset(self):
+        """Forget the recycled subspace and the previous solutions."""
+        self._recycled_space = None
+        self._history = {}
+        self._iteration_counts = []
+        self._wavenumbers = []
+
+    def solve(self, A, b, k, return_iteration_count=False):
+        """
+        Solve A x = b at wavenumber k.
+
+        Parameters
+        ----------
+        A : BoundaryOperator
+            Operator at wavenumber k.
+        b : GridFunction or list of GridFunction
+            Right-hand side(s).
+        k : float or complex
+            Wavenumber of the system.
+        return_iteration_count : bool
+            Also return the iteration count of each right-hand side.
+
+        Returns
+        -------
+        The solution(s) as grid function(s), the info flag(s) (0 if
+        converged, number of iterations otherwise) and optionally the
+        iteration count(s).
+
+        """
+        from bempp.api.assembly.grid_function import GridFunction
+
+        import bempp.api
+        import time
+
+        single = isinstance(b, GridFunction)
+        rhs_list = [b] if single else list(b)
+
+        if self._use_strong_form:
+            A_op = A.strong_form()
+            b_vecs = [rhs.coefficients for rhs in rhs_list]
+        else:
+            A_op = A.weak_form()
+            b_vecs = [rhs.projections(A.dual_to_range) for rhs in rhs_list]
+
+        maxiter = self._maxiter
+        if maxiter is None:
+            maxiter = 10 * A_op.shape[1]
+
+        bempp.api.log("Starting GCRO-DR iteration")
+        start_time = time.time()
+
+        # Map the recycled subspace onto the new operator.
+        U, C = None, None
+        if self._recycled_space is not None:
+            U, C = _recycle_subspace(A_op, self._recycled_space)
+
+        solutions = []
+        infos = []
+        counts = []
+        for index, b_vec in enumerate(b_vecs):
+            x0 = self._initial_guess(index, k)
+            x, info, count, U, C = _gcrodr(
+                A_op, b_vec, x0, U, C, self._tol, self._restart,
+                self._recycle, maxiter
+            )
+            self._store(index, k, x)
+            solutions.append(GridFunction(A.domain, coefficients=x.ravel()))
+            infos.append(info)
+            counts.append(count)
+
+        self._recycled_space = U
+        self._iteration_counts.append(counts)
+        self._wavenumbers.append(k)
+
+        end_time = time.time()
+        bempp.api.log(
+            "GCRO-DR finished in %i iterations and took %.2E sec."
+            % (sum(counts), end_time - start_time)
+        )
+
+        if single:
+            solutions, infos, counts = solutions[0], infos[0], counts[0]
+
+        if return_iteration_count:
+            return solutions, infos, counts
+
+        return solutions, infos
+
+    def _store(self, index, k, x):
+        """Store a solution for later extrapolation."""
+        history = self._history.setdefault(index, [])
+        history.append((k, x))
+        del history[: -(self._extrapolation_order + 1)]
+
+    def _initial_guess(self, index, k):
+        """Extrapolate the previous solutions to wavenumber k."""
+        history = self._history.get(index, [])
+        if len(history) == 0:
+            return None
+
+        points = history[-(self._extrapolation_order + 1) :]
+        x0 = _np.zeros_like(points[0][1])
+        for i, (ki, xi) in enumerate(points):
+            weight = 1.0
+            for j, (kj, _) in enumerate(points):
+                if j != i:
+                    weight *= (k - kj) / (ki - kj)
+            x0 += weight * xi
+        return x0
+
+
+def _matmat(A_op, X):
+    """Apply a discrete operator to the columns of X."""
+    return _np.column_stack([A_op @ X[:, j] for j in range(X.shape[1])])
+
+
+def _recycle_subspace(A_op, Y):
+    """Return U, C with C = A U orthonormal and span(U) = span(Y)."""
+    from scipy.linalg import qr, solve_triangular
+
+    Q, R = qr(_matmat(A_op, Y), mode="economic")
+    try:
+        U = solve_triangular(R, Y.T, trans="T").T
+    except _np.linalg.LinAlgError:  # degenerate subspace, start afresh
+        return None, None
+    return U, Q
+
+
+def _arnoldi(A_op, r, m, C, atol):
+    """
+    Arnoldi process for (I - C C^H) A started from r.
+
+    Stop after m steps or when the residual of the projected least-squares
+    problem falls below atol. Return the basis V, the Hessenberg matrix H,
+    the projections B = C^H A V and the number of steps.
+    """
+    n = r.shape[0]
+    V = _np.zeros((n, m + 1), dtype="complex128")
+    H = _np.zeros((m + 1, m), dtype="complex128")
+    B = None if C is None else _np.zeros((C.shape[1], m), dtype="complex128")
+
+    beta = _np.linalg.norm(r)
+    V[:, 0] = r / beta
+    e1 = _np.zeros(m + 1, dtype="complex128")
+    e1[0] = beta
+
+    for j in range(m):
+        w = A_op @ V[:, j]
+        if C is not None:
+            B[:, j] = C.conj().T @ w
+            w = w - C @ B[:, j]
+        for i in range(j + 1):
+            H[i, j] = _np.vdot(V[:, i], w)
+            w = w - H[i, j] * V[:, i]
+        H[j + 1, j] = _np.linalg.norm(w)
+        # V must hold the last vector on early exit: the caller uses
+        # A V[:, :j+1] = V[:, :j+2] H[:j+2, :j+1]
+        if H[j + 1, j] != 0:
+            V[:, j + 1] = w / H[j + 1, j]
+
+        y = _np.linalg.lstsq(H[: j + 2, : j + 1], e1[: j + 2], rcond=None)[0]
+        res = _np.linalg.norm(e1[: j + 2] - H[: j + 2, : j + 1] @ y)
+
+        if H[j + 1, j] == 0 or res <= atol:
+            return V, H, B, j + 1
+
+    return V, H, B, m
+
+
+def _harmonic_ritz_space(G, W, V, k):
+    """
+    Compute the new recycled subspace from the harmonic Ritz vectors of
+    smallest magnitude of the cycle A V = W G.
+    """
+    from scipy.linalg import eig, qr, solve_triangular
+
+    k = min(k, G.shape[1])
+    GhG = G.conj().T @ G
+    GhWV = G.conj().T @ (W.conj().T @ V)
+    theta, Z = eig(GhG, GhWV)
+    theta[~_np.isfinite(theta)] = _np.inf
+    P = Z[:, _np.argsort(_np.abs(theta))[:k]]
+
+    Y = V @ P
+    Q, R = qr(G @ P, mode="economic")
+    C = W @ Q
+    U = solve_triangular(R, Y.T, trans="T").T
+    return U, C
+
+
+def _gcrodr(A_op, b, x0, U, C, tol, m, k, maxiter):
+    """
+    GCRO-DR iteration with an optional recycled subspace (U, C = A U).
+
+    Return the solution, the info flag, the iteration count and the
+    recycled subspace updated for the current operator.
+    """
+    bnorm = _np.linalg.norm(b)
+    if bnorm == 0:
+        return _np.zeros_like(b, dtype="complex128"), 0, 0, U, C
+
+    x = _np.zeros(b.shape[0], dtype="complex128")
+    r = b.astype("complex128")
+    if x0 is not None:
+        r0 = b - A_op @ x0
+        if _np.linalg.norm(r0) < bnorm:  # discard poor extrapolations
+            x, r = x0.astype("complex128"), r0
+
+    if C is not None:
+        coef = C.conj().T @ r
+        x = x + U @ coef
+        r = r - C @ coef
+
+    count = 0
+    while True:
+        if _np.linalg.norm(r) <= tol * bnorm:
+            # the updated residual can drift from b - A x: check the true one
+            r = b - A_op @ x
+            if _np.linalg.norm(r) <= tol * bnorm:
+                break
+        if count >= maxiter:
+            return x, count, count, U, C
+
+        if C is None:
+            V, H, _, steps = _arnoldi(A_op, r, m, None, tol * bnorm)
+            W_hat = V[:, : steps + 1]
+            V_hat = V[:, :steps]
+            G = H[: steps + 1, :steps]
+        else:
+            p = C.shape[1]
+            V, H, B, steps = _arnoldi(A_op, r, m - p, C, tol * bnorm)
+            d = 1.0 / _np.linalg.norm(U, axis=0)
+            W_hat = _np.hstack([C, V[:, : steps + 1]])
+            V_hat = _np.hstack([U * d, V[:, :steps]])
+            G = _np.zeros((p + steps + 1, p + steps), dtype="complex128")
+            G[:p, :p] = _np.diag(d)
+            G[:p, p:] = B[:, :steps]
+            G[p:, p:] = H[: steps + 1, :steps]
+
+        count += steps
+        y = _np.linalg.lstsq(G, W_hat.conj().T @ r, rcond=None)[0]
+        x = x + V_hat @ y
+        r = r - W_hat @ (G @ y)
+        U, C = _harmonic_ritz_space(G, W_hat, V_hat, k)
+
+    return x, 0, count, U, C
+
+
 def gmres(
     A,
     b,
@@ -130,6 +130,101 @@ def adjoint_double_layer(
     )
 
 
+def single_layer_halfspace(
+    domain,
+    range_,
+    dual_to_range,
+    wavenumber,
+    planes,
+    parameters=None,
+    assembler="default_nonlocal",
+    device_interface="numba",
+    precision=None,
+):
+    """
+    Assemble the Helmholtz single-layer boundary operator with image sources.
+
+    The Green's function is summed over the images of the trial points on
+    the rigid planes given as a list of (axis, offset) tuples, with
+    axis 0, 1 or 2. One plane gives a half-space, two planes a
+    quarter-space and three planes an eighth-space.
+    """
+    return _common.create_operator(
+        "helmholtz_halfspace_single_layer_boundary",
+        domain,
+        range_,
+        dual_to_range,
+        parameters,
+        _halfspace_assembler(assembler),
+        _halfspace_options(wavenumber, planes),
+        "helmholtz_halfspace_single_layer",
+        "default_scalar",
+        _halfspace_device_interface(device_interface),
+        precision,
+        True,
+    )
+
+
+def double_layer_halfspace(
+    domain,
+    range_,
+    dual_to_range,
+    wavenumber,
+    planes,
+    parameters=None,
+    assembler="default_nonlocal",
+    device_interface="numba",
+    precision=None,
+):
+    """
+    Assemble the Helmholtz double-layer boundary operator with image sources.
+
+    See single_layer_halfspace for the definition of the planes.
+    """
+    return _common.create_operator(
+        "helmholtz_halfspace_double_layer_boundary",
+        domain,
+        range_,
+        dual_to_range,
+        parameters,
+        _halfspace_assembler(assembler),
+        _halfspace_options(wavenumber, planes),
+        "helmholtz_halfspace_double_layer",
+        "default_scalar",
+        _halfspace_device_interface(device_interface),
+        precision,
+        True,
+    )
+
+
+def _halfspace_options(wavenumber, planes):
+    """Return the kernel options of image-source operators."""
+    if len(planes) == 0 or len(planes) > 3:
+        raise ValueError("Between one and three planes are supported.")
+    options = [_np.real(wavenumber), _np.imag(wavenumber), len(planes)]
+    for axis, offset in planes:
+        if axis not in [0, 1, 2]:
+            raise ValueError("Plane axis must be 0, 1 or 2.")
+        options += [axis, offset]
+    return options
+
+
+def _halfspace_assembler(assembler):
+    """The Fmm expansions do not know about image sources."""
+    if assembler == "fmm":
+        raise ValueError("Image-source operators do not support the 'fmm' assembler.")
+    return assembler
+
+
+def _halfspace_device_interface(device_interface):
+    """Image-source kernels are only implemented with Numba."""
+    if device_interface is None:
+        return "numba"
+    if device_interface != "numba":
+        raise ValueError("Image-source operators require device_interface='numba'.")
+    return device_interface
+
+
 def hypersingular(
     domain,
     range_,
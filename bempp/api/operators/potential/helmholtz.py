@@ -96,3 +96,109 @@ def double_layer(
             space, points, operator_descriptor, device_interface, assembler, parameters
         )
     )
+
+
+def single_layer_halfspace(
+    space,
+    points,
+    wavenumber,
+    planes,
+    parameters=None,
+    assembler="dense",
+    device_interface="numba",
+    precision=None,
+):
+    """
+    Return a Helmholtz single-layer potential operator with image sources.
+
+    The planes are given as a list of (axis, offset) tuples, see
+    bempp.api.operators.boundary.helmholtz.single_layer_halfspace.
+    """
+    return _halfspace_potential(
+        "helmholtz_halfspace_single_layer",
+        space,
+        points,
+        wavenumber,
+        planes,
+        parameters,
+        assembler,
+        device_interface,
+        precision,
+    )
+
+
+def double_layer_halfspace(
+    space,
+    points,
+    wavenumber,
+    planes,
+    parameters=None,
+    assembler="dense",
+    device_interface="numba",
+    precision=None,
+):
+    """
+    Return a Helmholtz double-layer potential operator with image sources.
+
+    The planes are given as a list of (axis, offset) tuples, see
+    bempp.api.operators.boundary.helmholtz.single_layer_halfspace.
+    """
+    return _halfspace_potential(
+        "helmholtz_halfspace_double_layer",
+        space,
+        points,
+        wavenumber,
+        planes,
+        parameters,
+        assembler,
+        device_interface,
+        precision,
+    )
+
+
+def _halfspace_potential(
+    kernel_type,
+    space,
+    points,
+    wavenumber,
+    planes,
+    parameters,
+    assembler,
+    device_interface,
+    precision,
+):
+    """Create an image-source potential operator."""
+    import bempp.api
+    from bempp.api.operators import OperatorDescriptor
+    from bempp.api.assembly.potential_operator import PotentialOperator
+    from bempp.api.assembly.assembler import PotentialAssembler
+    from bempp.api.operators.boundary.helmholtz import (
+        _halfspace_options,
+        _halfspace_device_interface,
+        _halfspace_assembler,
+    )
+
+    if precision is None:
+        precision = bempp.api.DEFAULT_PRECISION
+
+    operator_descriptor = OperatorDescriptor(
+        kernel_type + "_potential",  # Identifier
+        _halfspace_options(wavenumber, planes),  # Options
+        kernel_type,  # Kernel type
+        "default_scalar",  # Assembly type
+        precision,  # Precision
+        True,  # Is complex
+        None,  # Singular part
+        1,  # Kernel dimension
+    )
+
+    return PotentialOperator(
+        PotentialAssembler(
+            space,
+            points,
+            operator_descriptor,
+            _halfspace_device_interface(device_interface),
+            _halfspace_assembler(assembler),
+            parameters,
+        )
+    )
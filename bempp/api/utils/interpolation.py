@@ -54,6 +54,22 @@ class ChebychevInterpolation(object):
         """Differentiate the polynomial defined by values."""
         return self.differentiation_matrix.dot(values)
 
+    def barycentric_coefficients(self, evaluation_point):
+        """
+        Return the coefficients of the node values at a point.
+
+        The interpolation polynomial at evaluation_point is the sum of
+        the values at the nodes weighted by these coefficients. This
+        allows the interpolation of arbitrary (e.g. complex or matrix
+        valued) data.
+        """
+        xdiff = evaluation_point - self.nodes
+        exact = xdiff == 0
+        if _np.any(exact):
+            return exact.astype("float64")
+        coefficients = self.weights / xdiff
+        return coefficients / _np.sum(coefficients)
+
 
 def chebychev_nodes_and_weights_second_kind(order):
     """
@@ -41,6 +41,15 @@ class _Fmm(object):
         self.dense_evaluation = False
 
 
+class _Hmat(object):
+    """H-matrix options."""
+
+    def __init__(self):
+        """Initialize H-matrix parameters."""
+        self.tolerance = 1e-4
+        self.leaf_size = 64
+
+
 class _DenseAssembly(object):
     """Dense assembly options."""
 
@@ -69,3 +78,4 @@ class DefaultParameters(object):
         self.quadrature = _Quadrature()
         self.assembly = _Assembly()
         self.fmm = _Fmm()
+        self.hmat = _Hmat()
@@ -50,11 +50,21 @@ def worker(in_queue, out_queue, worker_id, nworkers, buf, log, log_level):
             put(result)
         except Exception:
             traceback.print_exc()
+            put(WorkerError(worker_id, traceback.format_exc()))
 
     bempp.api.flush_log()
     put("FINISHED")
 
 
+class WorkerError(object):
+    """Error raised inside a worker and sent back to the host."""
+
+    def __init__(self, worker_id, message):
+        """Store the worker id and the formatted traceback."""
+        self.worker_id = worker_id
+        self.message = message
+
+
 def as_array(dtype, offset, shape):
     """
     Return part of the buffer as array.
@@ -190,7 +200,13 @@ class Pool(object):
         """Map implementation."""
         for index, arg in zip(range(self._nworkers), args):
             self._senders[index].put((fun, arg, options))
-        return [self._receivers[index].get() for index in range(self._nworkers)]
+        results = [self._receivers[index].get() for index in range(self._nworkers)]
+        for result in results:
+            if isinstance(result, WorkerError):
+                raise RuntimeError(
+                    f"Worker {result.worker_id} failed with:\n{result.message}"
+                )
+        return results
 
     def map(self, fun, args=None):
         """Map function onto workers."""
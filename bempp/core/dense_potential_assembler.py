@@ -26,6 +26,7 @@ class DensePotentialAssembler(object):
 
         self.space = space
         kernel_dimension = operator_descriptor.kernel_dimension
+        block_support = device_interface.split("_")[0] == "numba"
 
         def potential_evaluator(x):
             """Evaluate the potential."""
@@ -35,8 +36,26 @@ class DensePotentialAssembler(object):
             result = implementation(x_transformed)
             return result.reshape([kernel_dimension, -1], order="F")
 
+        def potential_block_evaluator(x):
+            """Evaluate the potential for each column of x."""
+            import numpy as np
+
+            if not block_support:
+                return np.stack(
+                    [potential_evaluator(column) for column in x.T], axis=2
+                )
+            x_transformed = self.space.map_to_full_grid @ (
+                self.space.dof_transformation @ x
+            )
+            return implementation(x_transformed)
+
         self._evaluator = potential_evaluator
+        self._block_evaluator = potential_block_evaluator
 
     def evaluate(self, x):
         """Call the potential evaluator."""
         return self._evaluator(x)
+
+    def evaluate_block(self, x):
+        """Call the potential evaluator on the columns of x."""
+        return self._block_evaluator(x)
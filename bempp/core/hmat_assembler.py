@@ -0,0 +1,507 @@
+"""Hierarchical matrix assembly with adaptive cross approximation."""
+
+import numpy as _np
+from bempp.api.assembly import assembler as _assembler
+from bempp.api.assembly.discrete_boundary_operator import (
+    GenericDiscreteBoundaryOperator,
+)
+
+
+class HMatAssembler(_assembler.AssemblerBase):
+    """
+    Assembler for H-matrix approximations of integral operators.
+
+    The global dofs are clustered in a binary tree of their positions (mean
+    centroid of their support elements). Blocks between well separated
+    clusters are admissible and approximated by adaptive cross
+    approximation (ACA). The remaining blocks between leaf clusters are
+    assembled densely. The singular part of the operator (adjacent
+    elements) is stored as a sparse matrix on the global dofs.
+
+    Rows and columns of a block are obtained by evaluating the regular
+    kernel on the support elements of their dofs and summing the local
+    contributions into the global dofs.
+    """
+
+    # pylint: disable=useless-super-delegation
+    def __init__(self, domain, dual_to_range, parameters=None):
+        """Create an H-matrix assembler instance."""
+        super().__init__(domain, dual_to_range, parameters)
+
+        self.dtype = None
+        self.shape = (dual_to_range.global_dof_count, domain.global_dof_count)
+
+        self._singular_part = None
+        self._dense_blocks = []
+        self._low_rank_blocks = []
+
+    @property
+    def number_of_dense_blocks(self):
+        """Return the number of dense blocks."""
+        return len(self._dense_blocks)
+
+    @property
+    def number_of_low_rank_blocks(self):
+        """Return the number of low-rank blocks."""
+        return len(self._low_rank_blocks)
+
+    @property
+    def ranks(self):
+        """Return the ranks of the low-rank blocks."""
+        return _np.array(
+            [u.shape[1] for _, _, u, _ in self._low_rank_blocks], dtype=int
+        )
+
+    @property
+    def memory_entries(self):
+        """Return the number of stored matrix entries."""
+        count = sum(mat.size for _, _, mat in self._dense_blocks)
+        count += sum(u.size + v.size for _, _, u, v in self._low_rank_blocks)
+        if self._singular_part is not None:
+            count += self._singular_part.nnz
+        return count
+
+    @property
+    def compression_ratio(self):
+        """Return the stored entries relative to the dense matrix."""
+        return self.memory_entries / (self.shape[0] * self.shape[1])
+
+    def assemble(
+        self, operator_descriptor, device_interface, precision, *args, **kwargs
+    ):
+        """H-matrix assembly of the integral operator."""
+        import bempp.api
+
+        if (
+            self.domain.requires_dof_transformation
+            or self.dual_to_range.requires_dof_transformation
+        ):
+            raise ValueError(
+                "Spaces that require dof transformations not supported for H-matrix assembly."
+            )
+
+        if operator_descriptor.assembly_type != "default_scalar":
+            raise ValueError(
+                "H-matrix assembly only supports operators with scalar kernels."
+            )
+
+        if operator_descriptor.is_complex:
+            self.dtype = "complex128"
+        else:
+            self.dtype = "float64"
+
+        with bempp.api.Timer(
+            message=f"H-matrix assembler:{operator_descriptor.identifier}"
+        ):
+            self._assemble_blocks(operator_descriptor, device_interface)
+
+        bempp.api.log(
+            f"H-matrix {operator_descriptor.identifier}: "
+            + f"{self.number_of_dense_blocks} dense blocks, "
+            + f"{self.number_of_low_rank_blocks} low-rank blocks "
+            + f"(maximum rank {self.ranks.max(initial=0)}), "
+            + f"compression ratio {self.compression_ratio:.2%}.",
+            extra={"compression_ratio": self.compression_ratio},
+        )
+
+        return HMatrixDiscreteBoundaryOperator(self)
+
+    def matvec(self, x):
+        """Perform a matvec."""
+        ndim = len(x.shape)
+        x = x.reshape(self.shape[1], -1)
+
+        result = _np.zeros(
+            (self.shape[0], x.shape[1]), dtype=_np.result_type(self.dtype, x.dtype)
+        )
+        if self._singular_part is not None:
+            result += self._singular_part @ x
+        for rows, cols, mat in self._dense_blocks:
+            result[rows] += mat @ x[cols]
+        for rows, cols, u, v in self._low_rank_blocks:
+            result[rows] += u @ (v @ x[cols])
+
+        if ndim == 1:
+            return result.ravel()
+        return result
+
+    def _assemble_blocks(self, operator_descriptor, device_interface):
+        """Build the block partition and assemble all blocks."""
+        from bempp.core.singular_assembler import assemble_singular_part
+
+        domain = self.domain
+        dual_to_range = self.dual_to_range
+        hmat_parameters = self.parameters.hmat
+
+        evaluator = _BlockEvaluator(
+            operator_descriptor, domain, dual_to_range, self.parameters
+        )
+
+        self._dense_blocks = []
+        self._low_rank_blocks = []
+        for rows, cols, admissible in _block_partition(
+            domain, dual_to_range, hmat_parameters.leaf_size
+        ):
+            low_rank = None
+            if admissible:
+                low_rank = _aca(evaluator, rows, cols, hmat_parameters.tolerance)
+            if low_rank is None:
+                self._dense_blocks.append((rows, cols, evaluator.block(rows, cols)))
+            else:
+                self._low_rank_blocks.append((rows, cols, *low_rank))
+
+        self._singular_part = None
+        if domain.grid == dual_to_range.grid:
+            from scipy.sparse import coo_matrix
+
+            singular_rows, singular_cols, singular_values = assemble_singular_part(
+                domain.localised_space,
+                dual_to_range.localised_space,
+                self.parameters,
+                operator_descriptor,
+                device_interface,
+            )
+            local = coo_matrix(
+                (singular_values, (singular_rows, singular_cols)),
+                shape=(evaluator.test_map.shape[0], evaluator.trial_map.shape[0]),
+            ).tocsr()
+            self._singular_part = (
+                evaluator.test_map.T @ local @ evaluator.trial_map
+            ).tocsr()
+
+
+class HMatrixDiscreteBoundaryOperator(GenericDiscreteBoundaryOperator):
+    """Discrete boundary operator stored as an H-matrix."""
+
+    def _matmat(self, x):
+        """Multiply the operator by a matrix."""
+        return self._evaluator.matvec(x)
+
+    @property
+    def compression_ratio(self):
+        """Return the stored entries relative to the dense matrix."""
+        return self._evaluator.compression_ratio
+
+    @property
+    def ranks(self):
+        """Return the ranks of the low-rank blocks."""
+        return self._evaluator.ranks
+
+
+class _BlockEvaluator(object):
+    """
+    Evaluate blocks between global dofs with the regular Numba kernel.
+
+    The kernel is evaluated between the support elements of the dofs and
+    the local contributions are summed into the global dofs.
+    """
+
+    def __init__(self, operator_descriptor, domain, dual_to_range, parameters):
+        """Initialize the kernel arguments."""
+        from bempp.core.numba_kernels import select_numba_kernels
+        from bempp.api.integration.triangle_gauss import rule
+
+        (self._assembly_function, self._kernel_function) = select_numba_kernels(
+            operator_descriptor, mode="regular"
+        )
+        quad_points, quad_weights = rule(parameters.quadrature.regular)
+
+        self._domain = domain
+        self._dual_to_range = dual_to_range
+        self.nshape_test = dual_to_range.number_of_shape_functions
+        self.nshape_trial = domain.number_of_shape_functions
+        self._grids_identical = domain.grid == dual_to_range.grid
+
+        if operator_descriptor.is_complex:
+            self._result_type = _np.dtype("complex128")
+        else:
+            self._result_type = _np.dtype("float64")
+
+        self._quad_points = quad_points.astype("float64")
+        self._quad_weights = quad_weights.astype("float64")
+        self._options = _np.array(operator_descriptor.options, dtype="float64")
+        self._test_multipliers = _np.ones(
+            dual_to_range.local_multipliers.shape, dtype="float64"
+        )
+        self._trial_multipliers = _np.ones(
+            domain.local_multipliers.shape, dtype="float64"
+        )
+
+        # elementwise dofs of the block being evaluated, only the entries
+        # of the block elements are set before each evaluation
+        self._test_dofs = _np.zeros_like(dual_to_range.local2global)
+        self._trial_dofs = _np.zeros_like(domain.local2global)
+
+        # maps from global dofs to elementwise dofs (local2global with
+        # multipliers), by column for support lookups
+        self.test_map = _local_to_global_map(dual_to_range)
+        self.trial_map = _local_to_global_map(domain)
+        self._test_map_csc = self.test_map.tocsc()
+        self._trial_map_csc = self.trial_map.tocsc()
+        self._test_element_type = dual_to_range.support_elements.dtype
+        self._trial_element_type = domain.support_elements.dtype
+
+    def test_support(self, dofs):
+        """Return the support elements of test dofs and their local map."""
+        return _support(
+            self._test_map_csc, dofs, self.nshape_test, self._test_element_type
+        )
+
+    def trial_support(self, dofs):
+        """Return the support elements of trial dofs and their local map."""
+        return _support(
+            self._trial_map_csc, dofs, self.nshape_trial, self._trial_element_type
+        )
+
+    def block(self, rows, cols, test=None, trial=None):
+        """
+        Return the dense block between the global test dofs rows and trial
+        dofs cols. The supports of rows and cols can be given if known.
+        """
+        test_elements, test_map = self.test_support(rows) if test is None else test
+        trial_elements, trial_map = (
+            self.trial_support(cols) if trial is None else trial
+        )
+        local = self.element_block(test_elements, trial_elements)
+        return test_map.T @ (trial_map.T @ local.T).T
+
+    def element_block(self, test_elements, trial_elements):
+        """Return the elementwise block between test and trial elements."""
+        result = _np.zeros(
+            (
+                len(test_elements) * self.nshape_test,
+                len(trial_elements) * self.nshape_trial,
+            ),
+            dtype=self._result_type,
+        )
+        self._test_dofs[test_elements] = _np.arange(
+            len(test_elements) * self.nshape_test
+        ).reshape(-1, self.nshape_test)
+        self._trial_dofs[trial_elements] = _np.arange(
+            len(trial_elements) * self.nshape_trial
+        ).reshape(-1, self.nshape_trial)
+
+        self._assembly_function(
+            self._dual_to_range.grid.data("double"),
+            self._domain.grid.data("double"),
+            self.nshape_test,
+            self.nshape_trial,
+            test_elements,
+            trial_elements,
+            self._test_multipliers,
+            self._trial_multipliers,
+            self._test_dofs,
+            self._trial_dofs,
+            self._dual_to_range.normal_multipliers,
+            self._domain.normal_multipliers,
+            self._quad_points,
+            self._quad_weights,
+            self._kernel_function,
+            self._options,
+            self._grids_identical,
+            self._dual_to_range.shapeset.evaluate,
+            self._domain.shapeset.evaluate,
+            result,
+        )
+        return result
+
+
+def _aca(evaluator, rows, cols, tol):
+    """
+    Adaptive cross approximation with partial pivoting of the block between
+    the global dofs rows and cols.
+
+    Return (u, v) with block ~ u @ v, recompressed to the tolerance, or None
+    if the rank needed is too large for a low-rank block to pay off.
+    """
+    m = len(rows)
+    n = len(cols)
+    max_rank = (m * n) // (m + n)
+
+    # supports of the whole block, evaluated once
+    test = evaluator.test_support(rows)
+    trial = evaluator.trial_support(cols)
+
+    def get_row(i):
+        return evaluator.block(rows[i : i + 1], cols, trial=trial)[0]
+
+    def get_col(j):
+        return evaluator.block(rows, cols[j : j + 1], test=test)[:, 0]
+
+    us = []
+    vs = []
+    used_rows = _np.zeros(m, dtype=_np.bool_)
+    norm2 = 0.0
+    converged = False
+    i = 0
+
+    while len(us) < max_rank:
+        used_rows[i] = True
+        row = get_row(i)
+        for u, v in zip(us, vs):
+            row -= u[i] * v
+        j = _np.argmax(_np.abs(row))
+        if row[j] == 0:
+            # zero row, try the next unused one
+            free = _np.flatnonzero(~used_rows)
+            if len(free) == 0:
+                converged = True
+                break
+            i = free[0]
+            continue
+        v = row / row[j]
+        u = get_col(j)
+        for uk, vk in zip(us, vs):
+            u -= vk[j] * uk
+
+        unorm2 = _np.vdot(u, u).real
+        vnorm2 = _np.vdot(v, v).real
+        for uk, vk in zip(us, vs):
+            norm2 += 2 * (_np.vdot(uk, u) * _np.vdot(vk, v)).real
+        norm2 += unorm2 * vnorm2
+        us.append(u)
+        vs.append(v)
+
+        if _np.sqrt(unorm2 * vnorm2) <= tol * _np.sqrt(abs(norm2)):
+            converged = True
+            break
+
+        candidates = _np.abs(u)
+        candidates[used_rows] = -1
+        i = _np.argmax(candidates)
+        if candidates[i] < 0:
+            converged = True
+            break
+
+    if not converged or len(us) == 0:
+        return None
+
+    return _recompress(_np.array(us).T, _np.array(vs), tol)
+
+
+def _recompress(u, v, tol):
+    """Truncate the low-rank product u @ v with an SVD of its QR factors."""
+    q_u, r_u = _np.linalg.qr(u)
+    q_v, r_v = _np.linalg.qr(v.T)
+    left, sigma, right = _np.linalg.svd(r_u @ r_v.T)
+
+    # smallest rank with a relative truncation error below tol
+    tail = _np.sqrt(_np.cumsum(sigma[::-1] ** 2))[::-1]
+    rank = max(1, int(_np.count_nonzero(tail > tol * tail[0])))
+
+    return (q_u @ left[:, :rank]) * sigma[:rank], right[:rank] @ q_v.T
+
+
+# admissibility of a block: min(diam(X), diam(Y)) <= ETA * dist(X, Y)
+ETA = 2.0
+
+
+def _block_partition(domain, dual_to_range, leaf_size):
+    """
+    Return the blocks as a list of (rows, cols, admissible), with rows and
+    cols global dofs of dual_to_range and domain.
+
+    The dofs of each space are clustered in a binary tree, splitting
+    clusters at the median of their positions along their largest extent
+    until they hold at most leaf_size dofs. A block is admissible if the
+    bounding boxes of the supports of its dofs are well separated,
+    min(diam(X), diam(Y)) <= ETA * dist(X, Y), so that it never contains
+    adjacent elements. Other blocks are subdivided down to leaf clusters.
+    """
+    test_tree = _cluster_tree(dual_to_range, leaf_size)
+    trial_tree = _cluster_tree(domain, leaf_size)
+
+    blocks = []
+    stack = [(test_tree, trial_tree)]
+    while len(stack) > 0:
+        test, trial = stack.pop()
+        lower = _np.maximum(test["lower"], trial["lower"])
+        upper = _np.minimum(test["upper"], trial["upper"])
+        distance = _np.linalg.norm(_np.maximum(lower - upper, 0))
+        if distance > 0 and min(test["diameter"], trial["diameter"]) <= ETA * distance:
+            blocks.append((test["dofs"], trial["dofs"], True))
+        elif test["children"] is None and trial["children"] is None:
+            blocks.append((test["dofs"], trial["dofs"], False))
+        elif trial["children"] is None or (
+            test["children"] is not None and test["diameter"] >= trial["diameter"]
+        ):
+            stack += [(child, trial) for child in test["children"]]
+        else:
+            stack += [(test, child) for child in trial["children"]]
+    return blocks
+
+
+def _cluster_tree(space, leaf_size):
+    """
+    Return the cluster tree of the global dofs of a space. Each cluster is a
+    dict with its sorted dofs, the bounding box of their supports (lower,
+    upper, diameter) and its two children (None for leaves).
+    """
+    positions = _dof_positions(space)
+    lower, upper = _support_boxes(space)
+
+    def cluster(dofs):
+        node = {"dofs": _np.sort(dofs), "children": None}
+        node["lower"] = lower[dofs].min(axis=0)
+        node["upper"] = upper[dofs].max(axis=0)
+        node["diameter"] = _np.linalg.norm(node["upper"] - node["lower"])
+        if len(dofs) > leaf_size:
+            points = positions[dofs]
+            axis = _np.argmax(points.max(axis=0) - points.min(axis=0))
+            order = dofs[_np.argsort(points[:, axis], kind="stable")]
+            half = len(order) // 2
+            node["children"] = [cluster(order[:half]), cluster(order[half:])]
+        return node
+
+    return cluster(_np.arange(space.global_dof_count))
+
+
+def _support_boxes(space):
+    """Return the bounding box (lower, upper) of the support of each dof."""
+    local_map = _local_to_global_map(space).tocsc()
+    elements = local_map.indices // space.number_of_shape_functions
+    corners = space.grid.vertices[:, space.grid.elements[:, elements]]
+    lower = _np.minimum.reduceat(corners.min(axis=1).T, local_map.indptr[:-1], axis=0)
+    upper = _np.maximum.reduceat(corners.max(axis=1).T, local_map.indptr[:-1], axis=0)
+    return lower, upper
+
+
+def _dof_positions(space):
+    """Return the position of each global dof: mean centroid of its support."""
+    local_map = _local_to_global_map(space).tocsc()
+    elements = local_map.indices // space.number_of_shape_functions
+    centroids = space.grid.centroids[elements]
+    counts = _np.diff(local_map.indptr)
+    sums = _np.add.reduceat(centroids, local_map.indptr[:-1], axis=0)
+    return sums / counts[:, _np.newaxis]
+
+
+def _support(local_map, dofs, nshape, dtype):
+    """
+    Return the support elements of global dofs and the map from their
+    elementwise dofs to the given global dofs.
+    """
+    columns = local_map[:, dofs]
+    elements = _np.unique(columns.indices // nshape).astype(dtype)
+    return elements, columns.tocsr()[_local_indices(elements, nshape)]
+
+
+def _local_indices(elements, nshape):
+    """Return the elementwise dof indices of a list of elements."""
+    return (elements[:, _np.newaxis] * nshape + _np.arange(nshape)).ravel()
+
+
+def _local_to_global_map(space):
+    """Return the sparse map from global dofs to elementwise dofs."""
+    from scipy.sparse import coo_matrix
+
+    nshape = space.number_of_shape_functions
+    elements = space.support_elements
+    rows = _local_indices(elements, nshape)
+    cols = space.local2global[elements].ravel()
+    values = space.local_multipliers[elements].ravel()
+
+    return coo_matrix(
+        (values, (rows, cols)),
+        shape=(space.grid.number_of_elements * nshape, space.global_dof_count),
+    ).tocsr()
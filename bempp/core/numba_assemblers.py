@@ -151,9 +151,28 @@ def potential_assembler(
 
     kernel_parameters = _np.array(operator_descriptor.options, dtype=dtype)
 
+    try:
+        numba_block_function, _ = select_numba_kernels(
+            operator_descriptor, mode="potential_block"
+        )
+    except KeyError:
+        numba_block_function = None
+
     def evaluator(x):
-        """Actually evaluate the potential."""
-        return numba_assembly_function(
+        """
+        Actually evaluate the potential.
+
+        If x is two-dimensional, each column is evaluated and the result has
+        the shape (kernel_dimension, number_of_points, number_of_columns).
+        """
+        if x.ndim == 2:
+            if numba_block_function is None:
+                return _np.stack([evaluator(column) for column in x.T], axis=2)
+            assembly_function = numba_block_function
+            x = _np.ascontiguousarray(x)
+        else:
+            assembly_function = numba_assembly_function
+        return assembly_function(
             dtype,
             result_type,
             kernel_dimension,
@@ -32,6 +32,9 @@ def select_numba_kernels(operator_descriptor, mode="regular"):
         "maxwell_magnetic_far_field": maxwell_mfield_far_field,
         "maxwell_electric_far_field": maxwell_efield_far_field,
     }
+    assembly_function_potential_block = {
+        "default_scalar": default_scalar_potential_block_kernel,
+    }
 
     assembly_functions_sparse = {"default_sparse": default_sparse_kernel}
 
@@ -44,6 +47,8 @@ def select_numba_kernels(operator_descriptor, mode="regular"):
         "helmholtz_far_field_single_layer": helmholtz_far_field_single_layer,
         "helmholtz_far_field_double_layer": helmholtz_far_field_double_layer,
         "helmholtz_adjoint_double_layer": helmholtz_adjoint_double_layer_regular,
+        "helmholtz_halfspace_single_layer": helmholtz_halfspace_single_layer_regular,
+        "helmholtz_halfspace_double_layer": helmholtz_halfspace_double_layer_regular,
         "modified_helmholtz_single_layer": modified_helmholtz_single_layer_regular,
         "modified_helmholtz_double_layer": modified_helmholtz_double_layer_regular,
         "modified_helmholtz_adjoint_double_layer": modified_helmholtz_adjoint_double_layer_regular,
@@ -56,6 +61,8 @@ def select_numba_kernels(operator_descriptor, mode="regular"):
         "helmholtz_single_layer": helmholtz_single_layer_singular,
         "helmholtz_double_layer": helmholtz_double_layer_singular,
         "helmholtz_adjoint_double_layer": helmholtz_adjoint_double_layer_singular,
+        "helmholtz_halfspace_single_layer": helmholtz_halfspace_single_layer_singular,
+        "helmholtz_halfspace_double_layer": helmholtz_halfspace_double_layer_singular,
         "modified_helmholtz_single_layer": modified_helmholtz_single_layer_singular,
         "modified_helmholtz_double_layer": modified_helmholtz_double_layer_singular,
         "modified_helmholtz_adjoint_double_layer": modified_helmholtz_adjoint_double_layer_singular,
@@ -88,6 +95,11 @@ def select_numba_kernels(operator_descriptor, mode="regular"):
             assembly_function_potential[operator_descriptor.assembly_type],
             kernel_functions_regular[operator_descriptor.kernel_type],
         )
+    elif mode == "potential_block":
+        return (
+            assembly_function_potential_block[operator_descriptor.assembly_type],
+            kernel_functions_regular[operator_descriptor.kernel_type],
+        )
     else:
         raise ValueError("Unknown mode.")
 
@@ -643,6 +655,128 @@ def helmholtz_adjoint_double_layer_singular(
     return output_real + 1j * output_imag
 
 
+@_numba.jit(
+    nopython=True, parallel=False, error_model="numpy", fastmath=True, boundscheck=False
+)
+def _reflect_points(points, image, kernel_parameters):
+    """
+    Reflect points on the planes selected by the bits of image.
+
+    The planes are stored in kernel_parameters after the wavenumber as
+    [nplanes, axis_0, offset_0, axis_1, offset_1, ...].
+    """
+    nplanes = int(kernel_parameters[2])
+    result = points.copy()
+    for plane in range(nplanes):
+        if (image >> plane) & 1:
+            axis = int(kernel_parameters[3 + 2 * plane])
+            offset = kernel_parameters[4 + 2 * plane]
+            result[axis] = 2 * offset - result[axis]
+    return result
+
+
+@_numba.jit(
+    nopython=True, parallel=False, error_model="numpy", fastmath=True, boundscheck=False
+)
+def _reflect_normals(normals, image, kernel_parameters):
+    """Reflect normals on the planes selected by the bits of image."""
+    nplanes = int(kernel_parameters[2])
+    result = normals.copy()
+    for plane in range(nplanes):
+        if (image >> plane) & 1:
+            axis = int(kernel_parameters[3 + 2 * plane])
+            result[axis] = -result[axis]
+    return result
+
+
+@_numba.jit(
+    nopython=True, parallel=False, error_model="numpy", fastmath=True, boundscheck=False
+)
+def helmholtz_halfspace_single_layer_regular(
+    test_point, trial_points, test_normal, trial_normals, kernel_parameters
+):
+    """Evaluate Helmholtz half-space single layer for regular kernels."""
+    result = helmholtz_single_layer_regular(
+        test_point, trial_points, test_normal, trial_normals, kernel_parameters
+    )
+    nimages = 2 ** int(kernel_parameters[2])
+    for image in range(1, nimages):
+        result += helmholtz_single_layer_regular(
+            test_point,
+            _reflect_points(trial_points, image, kernel_parameters),
+            test_normal,
+            trial_normals,
+            kernel_parameters,
+        )
+    return result
+
+
+@_numba.jit(
+    nopython=True, parallel=False, error_model="numpy", fastmath=True, boundscheck=False
+)
+def helmholtz_halfspace_double_layer_regular(
+    test_point, trial_points, test_normal, trial_normals, kernel_parameters
+):
+    """Evaluate Helmholtz half-space double layer for regular kernels."""
+    result = helmholtz_double_layer_regular(
+        test_point, trial_points, test_normal, trial_normals, kernel_parameters
+    )
+    nimages = 2 ** int(kernel_parameters[2])
+    for image in range(1, nimages):
+        result += helmholtz_double_layer_regular(
+            test_point,
+            _reflect_points(trial_points, image, kernel_parameters),
+            test_normal,
+            _reflect_normals(trial_normals, image, kernel_parameters),
+            kernel_parameters,
+        )
+    return result
+
+
+@_numba.jit(
+    nopython=True, parallel=False, error_model="numpy", fastmath=True, boundscheck=False
+)
+def helmholtz_halfspace_single_layer_singular(
+    test_points, trial_points, test_normal, trial_normal, kernel_parameters
+):
+    """Evaluate Helmholtz half-space single layer for singular kernels."""
+    result = helmholtz_single_layer_singular(
+        test_points, trial_points, test_normal, trial_normal, kernel_parameters
+    )
+    nimages = 2 ** int(kernel_parameters[2])
+    for image in range(1, nimages):
+        result += helmholtz_single_layer_singular(
+            test_points,
+            _reflect_points(trial_points, image, kernel_parameters),
+            test_normal,
+            trial_normal,
+            kernel_parameters,
+        )
+    return result
+
+
+@_numba.jit(
+    nopython=True, parallel=False, error_model="numpy", fastmath=True, boundscheck=False
+)
+def helmholtz_halfspace_double_layer_singular(
+    test_points, trial_points, test_normal, trial_normal, kernel_parameters
+):
+    """Evaluate Helmholtz half-space double layer for singular kernels."""
+    result = helmholtz_double_layer_singular(
+        test_points, trial_points, test_normal, trial_normal, kernel_parameters
+    )
+    nimages = 2 ** int(kernel_parameters[2])
+    for image in range(1, nimages):
+        result += helmholtz_double_layer_singular(
+            test_points,
+            _reflect_points(trial_points, image, kernel_parameters),
+            test_normal,
+            _reflect_normals(trial_normal, image, kernel_parameters),
+            kernel_parameters,
+        )
+    return result
+
+
 @_numba.jit(
     nopython=True, parallel=False, error_model="numpy", fastmath=True, boundscheck=False
 )
@@ -2265,6 +2399,104 @@ def default_scalar_potential_kernel(
     return result
 
 
+@_numba.jit(
+    nopython=True, parallel=True, error_model="numpy", fastmath=True, boundscheck=False
+)
+def default_scalar_potential_block_kernel(
+    dtype,
+    result_type,
+    kernel_dimension,
+    points,
+    x,
+    grid_data,
+    quad_points,
+    quad_weights,
+    number_of_shape_functions,
+    shapeset_evaluate,
+    kernel_function,
+    kernel_parameters,
+    normal_multipliers,
+    support_elements,
+):
+    """
+    Implement a scalar potential kernel for several coefficient vectors.
+
+    The columns of x are evaluated together, so that the kernel values
+    are only computed once per evaluation point.
+    """
+    number_of_columns = x.shape[1]
+    result = _np.zeros(
+        (kernel_dimension, points.shape[1], number_of_columns), dtype=result_type
+    )
+    n_support_elements = len(support_elements)
+    number_of_quad_points = len(quad_weights)
+    number_of_points = points.shape[1]
+
+    global_points = _np.zeros(
+        (3, number_of_quad_points * n_support_elements), dtype=dtype
+    )
+
+    tmp = _np.zeros(
+        (number_of_quad_points * n_support_elements, number_of_columns),
+        dtype=result_type,
+    )
+
+    for element_index, element in enumerate(support_elements):
+        global_points[
+            :,
+            number_of_quad_points
+            * element_index : number_of_quad_points
+            * (1 + element_index),
+        ] = grid_data.local2global(element, quad_points)
+
+    normals = get_normals(
+        grid_data, number_of_quad_points, support_elements, normal_multipliers
+    )
+
+    fun_values = shapeset_evaluate(quad_points)
+
+    test_normal = _np.array(
+        [0.0, 0.0, 0.0], dtype=dtype
+    )  # Just need a dummy test normal
+
+    for element_index, element in enumerate(support_elements):
+        for quad_point_index in range(number_of_quad_points):
+            for fun_index in range(number_of_shape_functions):
+                weight = (
+                    grid_data.integration_elements[element]
+                    * quad_weights[quad_point_index]
+                    * fun_values[0, fun_index, quad_point_index]
+                )
+                for column in range(number_of_columns):
+                    tmp[
+                        number_of_quad_points * element_index + quad_point_index,
+                        column,
+                    ] += (
+                        weight
+                        * x[number_of_shape_functions * element + fun_index, column]
+                    )
+
+    for point_index in _numba.prange(number_of_points):
+        test_point = points[:, point_index]
+
+        kernel_values = _np.atleast_2d(
+            kernel_function(
+                test_point, global_points, test_normal, normals, kernel_parameters
+            )
+        )
+
+        for dim in range(kernel_dimension):
+            for column in range(number_of_columns):
+                point_result = result_type.type(0)
+                for trial_index in range(number_of_quad_points * n_support_elements):
+                    point_result += (
+                        kernel_values[dim, trial_index] * tmp[trial_index, column]
+                    )
+                result[dim, point_index, column] = point_result
+
+    return result
+
+
 @_numba.jit(
     nopython=True, parallel=True, error_model="numpy", fastmath=True, boundscheck=False
 )
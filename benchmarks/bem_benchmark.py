@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite of the BEM pipeline.
+
+Times the construction of the study, the assembly (regular and singular
+parts), the solve and the evaluation at microphones of bem studies on the
+bundled notebook/Loudspeaker.msh and on synthetic geometries (regular spheres
+built in place and boxes of bempp.api.shapes), across element counts, frequency counts and
+radiator counts. Runs headless on CPU (numba backend by default).
+
+Results are written to a .json file. A former result file can be given as
+baseline: timings more than `threshold` slower than the baseline are reported
+as regressions and the script exits with status 1.
+
+Examples
+--------
+    python benchmarks/bem_benchmark.py --output baseline.json
+    python benchmarks/bem_benchmark.py --baseline baseline.json
+
+@author: tom
+"""
+import os
+os.environ.setdefault("MPLBACKEND", "Agg")          # headless
+os.environ.setdefault("PYVISTA_OFF_SCREEN", "true")
+
+import sys
+import json
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import bempp.api
+from bempp.api.grid.grid import Grid
+from electroacPy.acousticSim.bem import bem
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOUDSPEAKER_MESH = os.path.join(ROOT, "notebook", "Loudspeaker.msh")
+
+# timed stages (s)
+METRICS = ["setup", "assembly_regular", "assembly_singular", "solve",
+           "evaluation", "total"]
+
+# element sweep at (4 frequencies, 1 radiator), frequency and radiator sweeps
+# on a mid-size sphere
+PRESETS = {"quick": {"geometries": ["sphere-2", "sphere-3", "loudspeaker"],
+                     "frequencies": [4, 8],
+                     "radiators": [1, 2],
+                     "reference": "sphere-2"},
+           "full": {"geometries": ["sphere-2", "sphere-3", "sphere-4",
+                                   "box-0.2", "box-0.1", "loudspeaker"],
+                    "frequencies": [4, 16, 64],
+                    "radiators": [1, 4, 8],
+                    "reference": "sphere-3"}}
+
+
+#%% cases
+def get_cases(preset):
+    """
+    Return the list of cases (geometry, number of frequencies, number of
+    radiators) of a preset.
+    """
+    p = PRESETS[preset]
+    nf, nr = p["frequencies"][0], p["radiators"][0]
+    cases = [(g, nf, nr) for g in p["geometries"]]
+    cases += [(p["reference"], f, nr) for f in p["frequencies"]]
+    cases += [(p["reference"], nf, r) for r in p["radiators"]]
+    out = []
+    for case in cases:
+        if case not in out:
+            out.append(case)
+    return out
+
+
+def case_name(geometry, n_frequencies, n_radiators):
+    return "{}-f{}-r{}".format(geometry, n_frequencies, n_radiators)
+
+
+def get_grid(geometry):
+    """
+    Return the grid of a geometry: "loudspeaker", "sphere-<refinement level>"
+    or "box-<element size>".
+    """
+    if geometry == "loudspeaker":
+        return bempp.api.import_grid(LOUDSPEAKER_MESH)
+    name, value = geometry.split("-")
+    if name == "sphere":
+        return regular_sphere(int(value))
+    elif name == "box":
+        return bempp.api.shapes.cube(h=float(value))
+    raise ValueError("Geometry '{}' not understood.".format(geometry))
+
+
+def regular_sphere(level):
+    """
+    Return a regular sphere: octahedron refined level times (8 * 4**level
+    elements). Same construction as bempp.api.shapes.regular_sphere, whose
+    grid data file is not shipped.
+    """
+    vertices = [np.array(v, dtype="float64") for v in 
+                [[1, 0, 0], [0, 1, 0], [-1, 0, 0], [0, -1, 0], [0, 0, 1], 
+                 [0, 0, -1]]]
+    elements = [[0, 1, 4], [1, 2, 4], [2, 3, 4], [3, 0, 4],
+                [1, 0, 5], [2, 1, 5], [3, 2, 5], [0, 3, 5]]
+    for _ in range(level):
+        midpoints = {}
+
+        def midpoint(a, b):
+            key = (min(a, b), max(a, b))
+            if key not in midpoints:
+                point = vertices[a] + vertices[b]
+                vertices.append(point / np.linalg.norm(point))
+                midpoints[key] = len(vertices) - 1
+            return midpoints[key]
+
+        refined = []
+        for a, b, c in elements:
+            ab, bc, ca = midpoint(a, b), midpoint(b, c), midpoint(c, a)
+            refined += [[a, ab, ca], [ab, b, bc], [ca, bc, c], [ab, bc, ca]]
+        elements = refined
+    return Grid(np.array(vertices).T, np.array(elements, dtype="uint32").T)
+
+
+def split_radiators(grid, n_radiators):
+    """
+    Return a copy of grid whose elements are labelled 1 to n_radiators by
+    angular sector around the z axis.
+    """
+    centroids = grid.centroids
+    angle = np.arctan2(centroids[:, 1], centroids[:, 0]) + np.pi
+    labels = np.minimum((angle / (2 * np.pi) * n_radiators).astype(int),
+                        n_radiators - 1) + 1
+    return Grid(grid.vertices, grid.elements, labels.astype("uint32"))
+
+
+def write_mesh(geometry, n_radiators, directory):
+    """
+    Write the mesh of a case (ASCII gmsh 2.2) and return its path and the
+    radiating domain indices.
+    """
+    grid = get_grid(geometry)
+    if geometry == "loudspeaker":
+        groups = [int(g) for g in np.unique(grid.domain_indices)]
+        radiators = groups[:n_radiators]
+    else:
+        grid = split_radiators(grid, n_radiators)
+        radiators = list(range(1, n_radiators + 1))
+    path = os.path.join(directory, "{}-r{}.msh".format(geometry, n_radiators))
+    bempp.api.export(path, grid=grid, write_binary=False)
+    return path, radiators, grid.number_of_elements
+
+
+#%% run
+def run_case(geometry, n_frequencies, n_radiators, directory, n_mic=36,
+             **kwargs):
+    """
+    Run one case and return its timings (s).
+
+    Parameters
+    ----------
+    geometry : str
+        Geometry of the case (see get_grid).
+    n_frequencies : int
+        Number of frequencies, log-spaced between 100 Hz and 500 Hz.
+    n_radiators : int
+        Number of radiators.
+    directory : str
+        Directory where meshes are written.
+    n_mic : int, optional
+        Number of microphones (circle of radius 2 m). The default is 36.
+    **kwargs :
+        Passed to the bem object (solver, assembler, ...).
+
+    Returns
+    -------
+    result : dict
+        Timings and size of the case.
+
+    """
+    path, radiators, n_elements = write_mesh(geometry, n_radiators, directory)
+    frequency = np.logspace(2, np.log10(500), n_frequencies)
+    velocity = [np.ones(n_frequencies, dtype=complex) for _ in radiators]
+    theta = np.linspace(0, 2 * np.pi, n_mic, endpoint=False)
+    mics = 2 * np.array([np.cos(theta), np.zeros(n_mic), np.sin(theta)]).T
+
+    with bempp.api.Timer(enable_log=False) as total:
+        with bempp.api.Timer(enable_log=False) as setup:
+            study = bem(path, radiators, velocity, frequency, profile="time",
+                        **kwargs)
+        study.solve()
+        study.getMicPressure(mics)
+    table = study.profiler.table()
+
+    result = {"case": case_name(geometry, n_frequencies, n_radiators),
+              "geometry": geometry, "elements": int(n_elements),
+              "dofs": int(study.spaceP.global_dof_count),
+              "frequencies": n_frequencies, "radiators": len(radiators),
+              "microphones": n_mic, "setup": setup.interval,
+              "total": total.interval,
+              "iterations": int(np.nansum(table["iterations"].astype(float)))}
+    for metric in ["assembly_regular", "assembly_singular", "solve",
+                   "evaluation"]:
+        result[metric] = float(np.nansum(table[metric]))
+    return result
+
+
+def run(preset="quick", repeat=3, **kwargs):
+    """
+    Run the cases of a preset. Each case runs `repeat` times and the minimum
+    of each timing is kept. A warm-up run compiles the numba kernels first.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        print("Warm-up (numba compilation)")
+        run_case("sphere-1", 2, 1, directory, **kwargs)
+        for case in get_cases(preset):
+            name = case_name(*case)
+            print("\n" + "Benchmark " + name)
+            runs = [run_case(*case, directory, **kwargs) for _ in range(repeat)]
+            result = runs[0]
+            for metric in METRICS:
+                result[metric] = min(r[metric] for r in runs)
+            results.append(result)
+    return results
+
+
+def get_metadata(preset, repeat, **kwargs):
+    """Return the machine and settings of the run."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    try:
+        import numba
+        numba_version = numba.__version__
+    except ImportError:
+        numba_version = None
+    return {"commit": commit, "preset": preset, "repeat": repeat,
+            "settings": kwargs, "platform": platform.platform(),
+            "processor": platform.processor(), "cpu_count": os.cpu_count(),
+            "python": platform.python_version(), "numpy": np.__version__,
+            "numba": numba_version,
+            "device_interface": bempp.api.DEFAULT_DEVICE_INTERFACE}
+
+
+#%% comparison
+def compare(results, baseline, threshold=0.2, min_time=0.05):
+    """
+    Compare results to a baseline.
+
+    Parameters
+    ----------
+    results : list of dict
+        Results of the current run.
+    baseline : list of dict
+        Results of the baseline run.
+    threshold : float, optional
+        Relative slow down flagged as regression. The default is 0.2.
+    min_time : float, optional
+        Timings differing by less than min_time (s) are not flagged (timer
+        noise). The default is 0.05.
+
+    Returns
+    -------
+    regressions : list of tuple
+        (case, metric, baseline, current, ratio) of each regression.
+
+    """
+    reference = {r["case"]: r for r in baseline}
+    regressions = []
+    print("\n" + "{:<26} {:<18} {:>10} {:>10} {:>7}".format("case", "metric",
+                                                          "baseline",
+                                                          "current", "ratio"))
+    for r in results:
+        if r["case"] not in reference:
+            print("{:<26} not in baseline".format(r["case"]))
+            continue
+        b = reference[r["case"]]
+        for metric in METRICS:
+            if metric not in b:
+                continue
+            ratio = r[metric] / b[metric] if b[metric] > 0 else np.inf
+            flag = (r[metric] > (1 + threshold) * b[metric] and
+                    r[metric] - b[metric] > min_time)
+            print("{:<26} {:<18} {:10.3f} {:10.3f} {:7.2f}{}".format(
+                r["case"], metric, b[metric], r[metric], ratio,
+                "  REGRESSION" if flag else ""))
+            if flag:
+                regressions.append((r["case"], metric, b[metric], r[metric],
+                                    ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of the BEM pipeline.")
+    parser.add_argument("--preset", choices=list(PRESETS), default="quick")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None,
+                        help="Write the results to this .json file.")
+    parser.add_argument("--baseline", default=None,
+                        help="Compare the results to this .json file.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative slow down flagged as regression.")
+    parser.add_argument("--min-time", type=float, default=0.05,
+                        help="Smallest flagged slow down (s).")
+    parser.add_argument("--solver", default="gmres")
+    parser.add_argument("--assembler", default="dense")
+    parser.add_argument("--device", default="numba",
+                        help="bempp device interface (numba or opencl).")
+    args = parser.parse_args(argv)
+
+    bempp.api.DEFAULT_DEVICE_INTERFACE = args.device
+    settings = {"solver": args.solver, "assembler": args.assembler}
+    results = run(args.preset, args.repeat, **settings)
+    out = {"metadata": get_metadata(args.preset, args.repeat, **settings),
+           "results": results}
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(out, f, indent=2)
+        print("\n" + "Results written to " + args.output)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for key in ["cpu_count", "processor", "device_interface", "settings"]:
+            if baseline["metadata"].get(key) != out["metadata"][key]:
+                print("Warning: baseline {} differs ({} != {}).".format(
+                    key, baseline["metadata"].get(key), out["metadata"][key]))
+        regressions = compare(results, baseline["results"], args.threshold,
+                              args.min_time)
+        if len(regressions) > 0:
+            print("\n" + "{} regression(s) above {:.0%}.".format(len(regressions),
+                                                                args.threshold))
+            return 1
+        print("\n" + "No regression above {:.0%}.".format(args.threshold))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Adaptive frequency sampling of BEM studies.
+
+Only a subset of the study frequencies is solved. A rational model of the
+surface pressure is fitted to the solved frequencies with the AAA algorithm
+(set-valued: the same barycentric weights for all degrees of freedom), and
+new frequencies are solved where the error estimate of the model is above
+the tolerance. The remaining frequencies are interpolated by the model.
+
+The error estimate is the difference between the last two AAA iterates,
+relative to the largest response. The model is fitted on a random sketch of
+the surface pressure (n_sketch combinations of all degrees of freedom and
+radiators), then applied to the full coefficients: the barycentric formula is
+linear in the values at the support frequencies.
+
+@author: tom
+"""
+import numpy as np
+
+
+def adaptive_solve(bemObj, resume=False):
+    """
+    Solve a bem study with adaptive frequency sampling.
+
+    Parameters
+    ----------
+    bemObj : bem object
+        Study to solve. Uses bemObj.adaptive_tol, adaptive_seed and
+        adaptive_max_solves.
+    resume : bool, optional
+        Passed to bem.solve(). The default is False.
+
+    Returns
+    -------
+    None.
+
+    Notes
+    -----
+    Solved frequency indices are stored in bemObj.adaptiveIndices and the
+    error estimate at each frequency (0 at solved frequencies) in
+    bemObj.adaptiveError.
+
+    """
+    frequency = np.asarray(bemObj.frequency, dtype=float)
+    Nfft = len(frequency)
+    tol = bemObj.adaptive_tol
+    max_solves = bemObj.adaptive_max_solves
+    if max_solves is None:
+        max_solves = Nfft
+    n_seed = min(bemObj.adaptive_seed, Nfft, max_solves)
+
+    solved = np.zeros(Nfft, dtype=bool)
+    indices = np.unique(np.round(np.linspace(0, Nfft - 1, n_seed)).astype(int))
+    sketch = get_sketch(bemObj.Ns * bemObj.spaceP.global_dof_count,
+                        bemObj.adaptive_sketch)
+    error = np.full(Nfft, np.inf)
+    model = None
+    while True:
+        bemObj.solve(resume, indices=list(indices))
+        solved[indices] = True
+        z = frequency[solved]
+        F = sketch_responses(bemObj, np.flatnonzero(solved), sketch)
+        model, previous = aaa(z, F, tol=0.1 * tol)
+
+        error[:] = 0
+        scale = np.max(np.linalg.norm(F, axis=1))
+        if previous is not None and scale > 0:
+            x = frequency[~solved]
+            diff = (barycentric(x, z, F, *model) -
+                    barycentric(x, z, F, *previous))
+            error[~solved] = np.linalg.norm(diff, axis=1) / scale
+        elif previous is None:
+            error[~solved] = np.inf
+        print("Adaptive sweep: {} / {} frequencies solved, estimated error "
+              "{:.2e}".format(np.count_nonzero(solved), Nfft, error.max()))
+
+        budget = max_solves - np.count_nonzero(solved)
+        if error.max() <= tol or budget <= 0:
+            break
+        indices = get_refinement(error, tol)[:budget]
+
+    # fill unsolved frequencies with the rational model of the full response
+    unsolved = np.flatnonzero(~solved)
+    if len(unsolved) > 0:
+        solved_indices = np.flatnonzero(solved)
+        support, weights = model
+        values = bemObj.p_mesh.coefficients[solved_indices[support]]
+        shape = values.shape[1:]
+        values = values.reshape(len(support), -1)
+        interpolated = barycentric(frequency[unsolved], z, None, support,
+                                   weights, values)
+        bemObj.p_mesh.coefficients[unsolved] = interpolated.reshape(len(unsolved),
+                                                                    *shape)
+    if error.max() > tol:
+        print("Adaptive sweep did not reach the tolerance ({:.2e} > {:.2e}) "
+              "with {} solves.".format(error.max(), tol, max_solves))
+    bemObj.adaptiveIndices = np.flatnonzero(solved)
+    bemObj.adaptiveError = error
+    return None
+
+
+def get_sketch(n, n_sketch, seed=0):
+    """
+    Return a (n, n_sketch) random gaussian matrix used to compress the
+    responses before fitting.
+    """
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((n, n_sketch)) / np.sqrt(n_sketch)
+
+
+def sketch_responses(bemObj, indices, sketch):
+    """
+    Return the sketched surface pressure at the given frequency indices.
+    Shape: (len(indices), n_sketch)
+    """
+    coefficients = bemObj.p_mesh.coefficients[indices]
+    return coefficients.reshape(len(indices), -1).astype(complex) @ sketch
+
+
+def get_refinement(error, tol):
+    """
+    Return the frequency indices to solve next: local maxima of the error
+    above tol, largest first.
+    """
+    padded = np.concatenate(([-np.inf], error, [-np.inf]))
+    peaks = np.flatnonzero((error >= padded[:-2]) & (error > padded[2:]) &
+                           (error > tol))
+    if len(peaks) == 0:
+        peaks = np.array([np.argmax(error)])
+    return peaks[np.argsort(error[peaks])[::-1]]
+
+
+#%% AAA rational approximation
+def aaa(z, F, tol=1e-13, mmax=100):
+    """
+    Set-valued AAA rational approximation.
+
+    Parameters
+    ----------
+    z : numpy array
+        Sample points. Shape: (M,)
+    F : numpy array
+        Values at the sample points. Shape: (M, q)
+    tol : float, optional
+        Relative tolerance on the sample points. The default is 1e-13.
+    mmax : int, optional
+        Maximum number of support points. The default is 100.
+
+    Returns
+    -------
+    model : tuple
+        (support, weights) of the last iterate: indices of the support points
+        in z and barycentric weights.
+    previous : tuple or None
+        (support, weights) of the iterate before, None if there is only one.
+
+    """
+    M = len(z)
+    mmax = min(mmax, M)
+    norm = np.max(np.abs(F))
+    free = np.ones(M, dtype=bool)
+    R = np.tile(np.mean(F, axis=0), (M, 1))
+    support = []
+    model = None
+    previous = None
+    for _ in range(mmax):
+        residual = np.linalg.norm(F - R, axis=1)
+        residual[~free] = -1
+        j = int(np.argmax(residual))
+        support.append(j)
+        free[j] = False
+
+        # Loewner matrix of the free points, stacked for all components
+        C = 1 / (z[free, None] - z[None, support])
+        A = ((F[free][:, :, None] - F[support].T[None]) * C[:, None, :])
+        A = A.reshape(-1, len(support))
+        if A.shape[0] > 0:
+            _, _, Vh = np.linalg.svd(A, full_matrices=A.shape[0] < A.shape[1])
+            weights = Vh[-1].conj()
+        else:
+            weights = np.ones(len(support), dtype=complex)
+
+        previous = model
+        model = (np.array(support), weights)
+        R = F.copy()
+        R[free] = (C @ (weights[:, None] * F[support])) / (C @ weights)[:, None]
+        if np.count_nonzero(free) == 0 or np.max(np.abs(F - R)) <= tol * norm:
+            break
+    return model, previous
+
+
+def barycentric(x, z, F, support, weights, values=None):
+    """
+    Evaluate a barycentric rational model at points x.
+
+    Parameters
+    ----------
+    x : numpy array
+        Evaluation points. Shape: (P,)
+    z : numpy array
+        Sample points. Shape: (M,)
+    F : numpy array
+        Values at the sample points. Shape: (M, q). Not used if values is
+        given.
+    support : numpy array
+        Indices of the support points in z.
+    weights : numpy array
+        Barycentric weights.
+    values : numpy array, optional
+        Values at the support points. Shape: (len(support), q). The default
+        is F[support].
+
+    Returns
+    -------
+    R : numpy array
+        Model at x. Shape: (P, q)
+
+    """
+    if values is None:
+        values = F[support]
+    zs = z[support]
+    diff = x[:, None] - zs[None]
+    exact = diff == 0
+    diff[exact] = 1
+    C = 1 / diff
+    R = (C @ (weights[:, None] * values)) / (C @ weights)[:, None]
+    rows, cols = np.nonzero(exact)
+    R[rows] = values[cols]
+    return R
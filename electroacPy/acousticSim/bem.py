@@ -11,10 +11,13 @@ from bempp.api.operators.boundary import helmholtz, sparse
 from bempp.api.operators.potential import helmholtz as helmholtz_potential
 from bempp.api.assembly.discrete_boundary_operator import DiagonalOperator
 from scipy.sparse.linalg import gmres as scipy_gmres
-from bempp.api.linalg import gmres
+from bempp.api.linalg import gmres, FrequencyContinuationSolver
+from scipy.linalg import lu_factor, lu_solve
 import numpy as np
 from tqdm import tqdm
+from contextlib import nullcontext
 import warnings
+import logging
 from pyopencl import CompilerWarning
 import electroacPy.general as gtb
 
@@ -27,6 +30,15 @@ warnings.filterwarnings("ignore", category=CompilerWarning)
 # bempp.api.POTENTIAL_OPERATOR_DEVICE_TYPE = 'gpu'
 # bempp.api.DEFAULT_PRECISION = 'single'
 
+# attributes built by bem.init_solver_data
+SOLVER_DATA = ["grid_sim", "grid_init", "sizeFactor", "planes", "vertices",
+               "spaceP", "identity", "spaceU_freq", "u_callable_freq",
+               "correctionCoefficients", "p_mesh", "u_mesh", "p_total_mesh",
+               "u_total_mesh", "spaceU_all", "unionDOF", "dof", 
+               "coeff_radSurf", "admittanceCoeff", "ladder", "meshLevel",
+               "ladderTransfer"]
+
+
 class bem:
     def __init__(self, meshPath, radiatingElement, velocity, frequency, 
                  domain="exterior", c_0=343, rho_0=1.22, **kwargs):
@@ -56,6 +68,36 @@ class bem:
         -------
         None.
 
+        """
+        self.init_parameters(meshPath, radiatingElement, velocity, frequency,
+                             domain, c_0, rho_0, **kwargs)
+        self.init_solver_data()
+    
+    @classmethod
+    def deferred(cls, meshPath, radiatingElement, velocity, frequency, 
+                 domain="exterior", c_0=343, rho_0=1.22, **kwargs):
+        """
+        Create a BEM object whose solver data (grids, function spaces, 
+        velocity coefficients, pressure arrays and mesh ladder) are only 
+        built when one of them is first used. Same parameters as bem().
+        """
+        study = cls.__new__(cls)
+        study.init_parameters(meshPath, radiatingElement, velocity, frequency,
+                              domain, c_0, rho_0, **kwargs)
+        return study
+    
+    def __getattr__(self, name):
+        # only called for missing attributes: solver data of deferred objects
+        if name in SOLVER_DATA and self.__dict__.get("isBuilt") is False:
+            self.init_solver_data()
+            return getattr(self, name)
+        raise AttributeError("'bem' object has no attribute '{}'".format(name))
+    
+    def init_parameters(self, meshPath, radiatingElement, velocity, frequency, 
+                        domain="exterior", c_0=343, rho_0=1.22, **kwargs):
+        """
+        Store the parameters of the study and parse kwargs. Nothing is 
+        assembled nor allocated.
         """
         # get main parameters
         self.radiatingElement = radiatingElement
@@ -78,6 +120,33 @@ class bem:
         self.direction = False
         self.vibrometry_points = None
         self.tol = None
+        self.solver = None
+        self.recycle_dim = None
+        self.wideband = None
+        self.wideband_tol = None
+        self.image_source = None
+        self.cache = None
+        self.checkpoint = None
+        self.storage_precision = None
+        self.mic_memory = None
+        self.mic_memmap = None
+        self.assembler = None
+        self.fmm_parameters = None
+        self.hmat_parameters = None
+        self.parameters = None
+        self.n_workers = None
+        self.adaptive = None
+        self.adaptive_tol = None
+        self.adaptive_seed = None
+        self.adaptive_max_solves = None
+        self.adaptive_sketch = None
+        self.mesh_ladder = None
+        self.elements_per_wavelength = None
+        self.formulation = None
+        self.coupling = None
+        self.solver_precision = None
+        self.profiler = None
+        self.compression_ratio = None
         self.parse_input()
         
         # other parameters
@@ -85,16 +154,42 @@ class bem:
         self.isComputed = False
         self.is2dData = checkVelocityInput(self.velocity)
         
-        # initialize pressures and velocities arrays
-        self.u_mesh = np.empty([len(frequency), self.Ns], dtype=object)  # separate sources
-        self.p_mesh = np.empty([len(frequency), self.Ns], dtype=object)  # separate drivers
-        self.u_total_mesh = np.empty([len(frequency)], dtype=object)   # summed sources
-        self.p_total_mesh = np.empty([len(frequency)], dtype=object)   # summed sources
+        # driver reference
+        self.LEM_enclosures = None
+        self.radiator = None
+        
+        # reference to the study context copied on the worker pool
+        self.poolKey = None
+        
+        # a-posteriori error of the wideband operators (double, single layer)
+        self.widebandError = None
+        
+        # surface pressure coefficients to restore once the solver data are 
+        # built (studies loaded from a project)
+        self.storedPressure = None
+        self.isBuilt = False
+        return None
+    
+    def init_solver_data(self):
+        """
+        Load the meshes and build the function spaces, velocity coefficients
+        and pressure arrays of the study.
+        """
+        radiatingElement = self.radiatingElement
+        velocity = self.velocity
+        frequency = self.frequency
         
         # load simulation grid and mirror mesh if needed
         self.grid_sim = bempp.api.import_grid(self.meshPath)
         self.grid_init = bempp.api.import_grid(self.meshPath)
-        self.grid_sim, self.sizeFactor = mirror_mesh(self.grid_init, self.boundary_conditions)
+        if self.image_source is True:
+            # baffles handled by image sources in the kernels: no mirroring
+            self.grid_sim = self.grid_init
+            self.sizeFactor = 1
+            self.planes = get_image_planes(self.boundary_conditions)
+        else:
+            self.grid_sim, self.sizeFactor = mirror_mesh(self.grid_init, self.boundary_conditions)
+            self.planes = None
         self.vertices = np.shape(self.grid_sim.vertices)[1]
 
         # define space functions
@@ -119,6 +214,18 @@ class bem:
             else:
                 self.correctionCoefficients.append(1)
         
+        # initialize pressures and velocities arrays
+        self.init_mesh_arrays()
+        
+        # union of all radiating surfaces: used to stack every radiator in a 
+        # single block (one single layer for all radiators)
+        self.spaceU_all = bempp.api.function_space(self.grid_sim, "DP", 0,
+                                                   segments=[int(e) for e in np.unique(radiatingElement)])
+        self.unionDOF = []
+        for i in range(self.Ns):
+            self.unionDOF.append(np.searchsorted(self.spaceU_all.support_elements,
+                                                 self.spaceU_freq[i].support_elements))
+        
         # Assign vibrometric coefficients to corresponding radiators // Assign surface velocity if not vibration data
         self.dof = dof
         maxDOF = int(np.max(dof) + 1)
@@ -136,12 +243,77 @@ class bem:
         
         self.admittanceCoeff = getSurfaceAdmittance(self.impedanceSurfaceIndex, self.surfaceImpedance, 
                                                     frequency, self.spaceP, self.c_0, self.rho_0)        
-        # driver reference
-        self.LEM_enclosures = None
-        self.radiator = None
+        
+        # coarser meshes solving the low frequencies
+        self.ladder = None
+        self.meshLevel = None
+        self.ladderTransfer = None
+        if self.mesh_ladder is not None:
+            self.init_mesh_ladder()
+        
+        if self.storedPressure is not None:
+            if self.storedPressure.shape != self.p_mesh.coefficients.shape:
+                raise ValueError("Stored surface pressure does not match the "
+                                 "mesh {}.".format(self.meshPath))
+            self.p_mesh.coefficients = self.storedPressure
+            self.storedPressure = None
+        self.isBuilt = True
+        return None
 
     def discard_frequency(self):
         return None
+    
+    def init_mesh_ladder(self):
+        """
+        Create the studies of the meshes of the ladder and assign each 
+        frequency to the coarsest mesh with at least elements_per_wavelength
+        elements per wavelength (the finest mesh if none is fine enough).
+        Level len(self.ladder) in self.meshLevel is the mesh of this study.
+        """
+        kwargs = {key: self.kwargs[key] for key in self.kwargs 
+                  if key != "mesh_ladder"}
+        self.ladder = [bem(path, self.radiatingElement, self.velocity, 
+                           self.frequency, self.domain, self.c_0, self.rho_0,
+                           **kwargs) for path in self.mesh_ladder]
+        self.ladderTransfer = [None] * len(self.ladder)
+        
+        sizes = np.array([study.grid_sim.maximum_element_diameter 
+                          for study in self.ladder] + 
+                         [self.grid_sim.maximum_element_diameter])
+        f_max = self.c_0 / (self.elements_per_wavelength * sizes)
+        coarsest_first = np.argsort(sizes)[::-1]
+        self.meshLevel = np.full(len(self.frequency), coarsest_first[-1])
+        for i, f in enumerate(self.frequency):
+            for level in coarsest_first:
+                if f <= f_max[level]:
+                    self.meshLevel[i] = level
+                    break
+        return None
+    
+    def solve_ladder(self, pending, resume=False):
+        """
+        Solve the pending frequencies assigned to other meshes of the ladder,
+        and interpolate their surface pressure on the mesh of this study. 
+        Return the frequencies left to solve on this mesh.
+        """
+        for level, study in enumerate(self.ladder):
+            indices = [i for i in pending if self.meshLevel[i] == level]
+            if len(indices) == 0:
+                continue
+            print("Mesh ladder: {} frequencies on {} ({} DOF)".format(
+                len(indices), study.meshPath, study.spaceP.global_dof_count))
+            study.solve(resume, indices=indices)
+            if self.ladderTransfer[level] is None:
+                self.ladderTransfer[level] = get_transfer_matrix(study.spaceP,
+                                                                 self.spaceP)
+            for i in indices:
+                self.store_solution(i, self.ladderTransfer[level] @ 
+                                    study.get_pressure_block(i))
+                self.iterations[i] = study.iterations[i]
+                self.error[i] = study.error[i]
+                for stage in self.timings:
+                    self.timings[stage][i] = study.timings[stage][i]
+        return [i for i in pending if self.meshLevel[i] == len(self.ladder)]
         
     def parse_input(self):
         if "boundary_conditions" in self.kwargs:
@@ -158,6 +330,149 @@ class bem:
             self.tol = self.kwargs["tol"]
         else:
             self.tol = 1e-5
+        if "solver" in self.kwargs:
+            self.solver = self.kwargs["solver"]
+        else:
+            self.solver = "gmres"
+        if self.solver not in ["gmres", "lu", "recycle"]:
+            raise ValueError("'solver' not understood. Try 'gmres', 'lu' or 'recycle'.")
+        if "solver_precision" in self.kwargs:
+            self.solver_precision = self.kwargs["solver_precision"]
+        else:
+            self.solver_precision = "double"
+        if self.solver_precision not in ["double", "mixed"]:
+            raise ValueError("'solver_precision' not understood. Try 'double' or 'mixed'.")
+        if self.solver_precision == "mixed" and self.solver != "lu":
+            raise ValueError("solver_precision='mixed' applies to solver='lu'.")
+        if "recycle_dim" in self.kwargs:
+            self.recycle_dim = int(self.kwargs["recycle_dim"])
+        else:
+            self.recycle_dim = 10
+        if "wideband" in self.kwargs:
+            self.wideband = bool(self.kwargs["wideband"])
+        else:
+            self.wideband = False
+        if "wideband_tol" in self.kwargs:
+            self.wideband_tol = self.kwargs["wideband_tol"]
+        else:
+            self.wideband_tol = 1e-6
+        if "image_source" in self.kwargs:
+            self.image_source = bool(self.kwargs["image_source"])
+        else:
+            self.image_source = False
+        if "cache" in self.kwargs and self.kwargs["cache"] is not False:
+            from electroacPy.acousticSim.storage import ResultStore, DEFAULT_CACHE_DIR
+            if self.kwargs["cache"] is True:
+                cache_dir = DEFAULT_CACHE_DIR
+            else:
+                cache_dir = self.kwargs["cache"]
+            if "cache_size" in self.kwargs:
+                cache_size = self.kwargs["cache_size"]
+            else:
+                cache_size = 4096
+            self.cache = ResultStore(cache_dir, max_size=cache_size)
+        else:
+            self.cache = None
+        if "checkpoint" in self.kwargs and self.kwargs["checkpoint"] is not False:
+            self.checkpoint = self.get_checkpoint_store(self.kwargs["checkpoint"])
+        else:
+            self.checkpoint = None
+        if "storage_precision" in self.kwargs:
+            self.storage_precision = self.kwargs["storage_precision"]
+        else:
+            self.storage_precision = "double"
+        if self.storage_precision not in ["double", "single"]:
+            raise ValueError("'storage_precision' not understood. Try 'double' or 'single'.")
+        if "mic_memory" in self.kwargs:
+            self.mic_memory = self.kwargs["mic_memory"]
+        else:
+            self.mic_memory = None
+        if "mic_memmap" in self.kwargs:
+            self.mic_memmap = self.kwargs["mic_memmap"]
+        else:
+            self.mic_memmap = None
+        if "n_workers" in self.kwargs:
+            self.n_workers = int(self.kwargs["n_workers"])
+        else:
+            self.n_workers = 1
+        if "profile" in self.kwargs and self.kwargs["profile"] in [True, "time"]:
+            from electroacPy.acousticSim.profiling import Profiler
+            # "time": no tracemalloc overhead in timings
+            self.profiler = Profiler(self.frequency, 
+                                     memory=self.kwargs["profile"] is True)
+            if self.n_workers > 1:
+                print("Profiling: timings and memory are only recorded with "
+                      "n_workers=1.")
+        if "assembler" in self.kwargs:
+            self.assembler = self.kwargs["assembler"]
+        else:
+            self.assembler = "dense"
+        if self.assembler not in ["dense", "fmm", "hmat"]:
+            raise ValueError("'assembler' not understood. Try 'dense', 'fmm' or 'hmat'.")
+        if self.assembler == "fmm":
+            if self.solver == "lu":
+                raise ValueError("solver='lu' needs dense matrices, use 'gmres' or 'recycle' with assembler='fmm'.")
+            if self.wideband is True:
+                raise ValueError("wideband=True needs dense matrices, it cannot be used with assembler='fmm'.")
+            if self.image_source is True:
+                raise ValueError("image_source=True is not supported with assembler='fmm'.")
+        if self.assembler == "hmat":
+            if self.solver == "lu":
+                raise ValueError("solver='lu' needs dense matrices, use 'gmres' or 'recycle' with assembler='hmat'.")
+            if self.wideband is True:
+                raise ValueError("wideband=True needs dense matrices, it cannot be used with assembler='hmat'.")
+        self.fmm_parameters = get_fmm_parameters(self.kwargs.get("fmm_parameters", None))
+        self.hmat_parameters = get_hmat_parameters(self.kwargs.get("hmat_parameters", None))
+        self.parameters = get_assembly_parameters(self.assembler, 
+                                                  self.fmm_parameters,
+                                                  self.hmat_parameters)
+        if "adaptive" in self.kwargs:
+            self.adaptive = bool(self.kwargs["adaptive"])
+        else:
+            self.adaptive = False
+        if "adaptive_tol" in self.kwargs:
+            self.adaptive_tol = self.kwargs["adaptive_tol"]
+        else:
+            self.adaptive_tol = 1e-3
+        if "adaptive_seed" in self.kwargs:
+            self.adaptive_seed = int(self.kwargs["adaptive_seed"])
+        else:
+            self.adaptive_seed = 8
+        if "adaptive_max_solves" in self.kwargs:
+            self.adaptive_max_solves = self.kwargs["adaptive_max_solves"]
+        else:
+            self.adaptive_max_solves = None
+        if "adaptive_sketch" in self.kwargs:
+            self.adaptive_sketch = int(self.kwargs["adaptive_sketch"])
+        else:
+            self.adaptive_sketch = 32
+        if "mesh_ladder" in self.kwargs and self.kwargs["mesh_ladder"] is not None:
+            self.mesh_ladder = list(self.kwargs["mesh_ladder"])
+        else:
+            self.mesh_ladder = None
+        if "elements_per_wavelength" in self.kwargs:
+            self.elements_per_wavelength = self.kwargs["elements_per_wavelength"]
+        else:
+            self.elements_per_wavelength = 6
+        if "formulation" in self.kwargs:
+            self.formulation = self.kwargs["formulation"]
+        else:
+            self.formulation = "standard"
+        if self.formulation not in ["standard", "burton_miller"]:
+            raise ValueError("'formulation' not understood. Try 'standard' or 'burton_miller'.")
+        if "coupling" in self.kwargs:
+            self.coupling = self.kwargs["coupling"]
+        else:
+            self.coupling = None
+        if self.formulation == "burton_miller":
+            if self.domain != "exterior":
+                raise ValueError("formulation='burton_miller' only applies to exterior problems.")
+            if self.image_source is True:
+                raise ValueError("formulation='burton_miller' is not supported with image_source=True.")
+            if self.wideband is True:
+                raise ValueError("formulation='burton_miller' is not supported with wideband=True.")
+            if self.assembler == "hmat":
+                raise ValueError("formulation='burton_miller' needs the hypersingular operator, not supported with assembler='hmat'.")
             
     def initialize_conditions(self):
         for bc in self.boundary_conditions:
@@ -167,7 +482,7 @@ class bem:
             else:
                 pass
     
-    def solve(self):
+    def solve(self, resume=False, indices=None):
         """
         Compute the Boundary Element Method (BEM) solution for the loudspeaker system.
 
@@ -175,6 +490,16 @@ class bem:
         due to the contribution of individual speakers. The total pressure distribution is also computed by summing
         up the contributions of all speakers.
 
+        Parameters
+        ----------
+        resume : bool, optional
+            If True, frequencies already saved in the checkpoint store are 
+            loaded instead of being solved. The default is False.
+        indices : list of int, optional
+            Frequency indices to solve. Solutions at other frequencies are 
+            kept. The default is None (all frequencies, or adaptive sampling
+            if the study was created with adaptive=True).
+
         Returns
         -------
         None
@@ -187,6 +512,9 @@ class bem:
         pressure distribution. The results are stored in class attributes for further analysis.
 
         """
+        if self.adaptive is True and indices is None:
+            from electroacPy.acousticSim.adaptive import adaptive_solve
+            return adaptive_solve(self, resume)
         
         if self.domain == "exterior":
             domain_operator = -1
@@ -196,92 +524,329 @@ class bem:
         omega = 2 * np.pi * self.frequency
         k = -omega / self.c_0
 
-        # individual speakers
-        self.u_mesh = np.empty([len(k), self.Ns], dtype=object)
-        self.p_mesh = np.empty([len(k), self.Ns], dtype=object)
-
-        # sum of all speakers
-        self.u_total_mesh = np.empty([len(k)], dtype=object)
-        self.p_total_mesh = np.empty([len(k)], dtype=object)
-
-        # error
-        self.error = np.zeros([len(k), self.Ns])
+        if indices is None or self.isComputed is False:
+            # individual speakers and sum of all speakers
+            self.init_mesh_arrays()
+    
+            # relative residual of direct solves (nan for iterative solvers)
+            self.error = np.zeros([len(k), self.Ns])
+            
+            # iterative solver iterations (refinement steps for direct solves)
+            self.iterations = np.zeros([len(k), self.Ns], dtype=int)
+            
+            # time spent in each stage of the absorbing surfaces solver (s)
+            self.timings = {"assembly": np.zeros(len(k)),
+                            "factorization": np.zeros(len(k)),
+                            "solve": np.zeros(len(k))}
+        
+        # load frequencies already solved
+        if resume is True and self.checkpoint is None:
+            self.checkpoint = self.get_checkpoint_store(True)
+        keys = self.get_frequency_keys()
+        pending = self.load_frequencies(keys, resume, indices)
+        if self.ladder is not None:
+            pending = self.solve_ladder(pending, resume)
 
         print("Computing pressure on mesh")
-        if self.admittanceCoeff is None:
-            for i in tqdm(range(len(k))):
-                # creation of the double layer
-                double_layer = helmholtz.double_layer(self.spaceP, self.spaceP,
-                                                      self.spaceP, k[i])
-                for rs in range(self.Ns):                
-                    coeff_radSurf = self.coeff_radSurf[i, rs, :int(self.dof[rs])]
-                    spaceU = bempp.api.function_space(self.grid_sim, "DP", 0,
-                                                      segments=[self.radiatingElement[rs]])
-    
-                    # get velocity on current radiator
-                    u_total = bempp.api.GridFunction(spaceU, coefficients=-coeff_radSurf *
-                                                                          self.correctionCoefficients[rs])
-                    # single layer
-                    single_layer = helmholtz.single_layer(spaceU,
-                                                          self.spaceP, self.spaceP,
-                                                          k[i])
-    
-                    # pressure over the whole surface of the loudspeaker (p_total)
-                    lhs = double_layer + 0.5 * self.identity * domain_operator
-                    rhs = 1j * omega[i] * self.rho_0 * single_layer * u_total
-                    p_total, _ = gmres(lhs, rhs, tol=self.tol, 
-                                       return_residuals=False)
-    
-                    self.p_mesh[i, rs] = p_total # individual speakers
-                    self.u_mesh[i, rs] = u_total # individual speakers
-            self.isComputed = True
+        self.report_assembler()
+        compression = self.record_compression()
+        if self.admittanceCoeff is None and len(pending) > 0:
+            if self.n_workers > 1:
+                # spread frequencies across a worker pool
+                from electroacPy.acousticSim import parallel
+                
+                def store(i, p_total, info):
+                    self.iterations[i], self.error[i] = info
+                    self.store_solution(i, p_total)
+                    self.save_frequency(i, keys, p_total)
+                    
+                parallel.solve(self, k, omega, domain_operator, pending, store)
+            else:
+                continuation = self.get_continuation_solver()
+                wideband = None
+                if self.wideband is True:
+                    wideband = wideband_operators(self.spaceP, self.spaceU_all,
+                                                  k[pending], self.wideband_tol, 
+                                                  self.planes)
+                    self.widebandError = [op.error_estimate for op in wideband]
+                for i in tqdm(pending):
+                    with self.profile("solve", i):
+                        p_total, self.iterations[i], self.error[i] = solve_frequency(self.spaceP, 
+                                                                      self.identity, 
+                                                                      self.spaceU_all, 
+                                                                      self.get_velocity_block(i),
+                                                                      k[i], omega[i], 
+                                                                      self.rho_0,
+                                                                      domain_operator, 
+                                                                      self.solver,
+                                                                      self.tol, 
+                                                                      continuation,
+                                                                      wideband,
+                                                                      self.planes,
+                                                                      self.assembler,
+                                                                      self.parameters,
+                                                                      self.formulation,
+                                                                      self.coupling,
+                                                                      self.solver_precision)
+                    self.clear_assembly_cache()
+                    self.store_solution(i, p_total)
+                    self.save_frequency(i, keys, p_total)
             
         elif self.admittanceCoeff is not None:
-            for i in tqdm(range(len(k))):
-                # creation of the double layer
-                double_layer = helmholtz.double_layer(self.spaceP, self.spaceP,
-                                                      self.spaceP, k[i])
-                # admittance single layer
-                single_layer_Y = helmholtz.single_layer(self.spaceP, self.spaceP,
-                                                        self.spaceP, k[i])
-                for rs in range(self.Ns):
-                    # RADIATING SURFACES
-                    coeff_radSurf = self.coeff_radSurf[i, rs, :int(self.dof[rs])]
-
-                    spaceU = bempp.api.function_space(self.grid_sim, "DP", 0,
-                                                      segments=[self.radiatingElement[rs]])
-
-                    # get velocity on current radiator
-                    u_total = bempp.api.GridFunction(spaceU, coefficients=-coeff_radSurf *
-                                                                          self.correctionCoefficients[rs])
-
-                    # single layer - radiating surface
-                    single_layer = helmholtz.single_layer(spaceU,
-                                                          self.spaceP, self.spaceP,
-                                                          k[i])
-
-                    # ABSORBING SURFACES
-                    Yn = self.admittanceCoeff[:, i]  # all admittance coeff at current frequency
-                    yn_fun = bempp.api.GridFunction(self.spaceP, coefficients=Yn)  # ? doubts on its usefulness
-                    yn = DiagonalOperator(yn_fun.coefficients)
-
-                    # building equations
-                    lhs = ((double_layer + 0.5*self.identity * domain_operator).weak_form()
-                           - (1j*k[i]*single_layer_Y.weak_form()*yn))
-                    rhs = 1j * omega[i] * self.rho_0 * single_layer * u_total
-                    rhs = rhs.projections(self.spaceP)
-
-                    # pressure over the whole surface of the loudspeaker (p_total)
-                    p_total_coefficients, _ = scipy_gmres(lhs, rhs, rtol=self.tol)
-                    p_total = bempp.api.GridFunction(self.spaceP, coefficients=p_total_coefficients)
-
-                    self.p_mesh[i, rs] = p_total  # individual speakers
-                    self.u_mesh[i, rs] = u_total  # individual speakers
-            self.isComputed = True 
+            for i in tqdm(pending):
+                with self.profile("solve", i):
+                    p_total, self.iterations[i], self.error[i], timings = solve_admittance_frequency(self.spaceP,
+                                                                                      self.identity,
+                                                                                      self.spaceU_all,
+                                                                                      self.get_velocity_block(i),
+                                                                                      self.admittanceCoeff[:, i],
+                                                                                      k[i], omega[i],
+                                                                                      self.rho_0,
+                                                                                      domain_operator,
+                                                                                      self.solver,
+                                                                                      self.tol,
+                                                                                      self.planes,
+                                                                                      self.assembler,
+                                                                                      self.parameters,
+                                                                                      self.formulation,
+                                                                                      self.coupling,
+                                                                                      self.solver_precision)
+                self.clear_assembly_cache()
+                for stage in timings:
+                    self.timings[stage][i] = timings[stage]
+                self.store_solution(i, p_total)
+                self.save_frequency(i, keys, p_total)
+        self.report_compression(compression)
+        if self.profiler is not None:
+            self.profiler.set_solution(pending, self.iterations, self.error)
+        if self.solver_precision == "mixed" and len(pending) > 0:
+            print("Mixed precision: max relative residual {:.2e}, {} refinement "
+                  "steps at most".format(np.nanmax(self.error[pending]),
+                                         np.max(self.iterations[pending])))
+        self.isComputed = True
         return None
+    
+    def get_frequency_keys(self):
+        """
+        Return the content hash of each frequency of the study, None if no 
+        result store is used.
+        """
+        if self.cache is None and self.checkpoint is None:
+            return None
+        from electroacPy.acousticSim import storage
+        study_key = storage.hash_study(self)
+        keys = []
+        for i in range(len(self.frequency)):
+            if self.admittanceCoeff is None:
+                admittance = None
+            else:
+                admittance = self.admittanceCoeff[:, i]
+            keys.append(storage.hash_frequency(study_key, self.frequency[i],
+                                               self.get_velocity_block(i),
+                                               admittance))
+        return keys
+    
+    def load_frequencies(self, keys, resume=False, indices=None):
+        """
+        Load the frequencies found in the result cache, and in the checkpoint
+        store if resume is True. Return the indices of frequencies left to 
+        compute, among indices (all frequencies if None).
+        """
+        if indices is None:
+            indices = range(len(self.frequency))
+        if keys is None:
+            return list(indices)
+        stores = []
+        if self.cache is not None:
+            stores.append(self.cache)
+        if resume is True and self.checkpoint is not None:
+            stores.append(self.checkpoint)
+        shape = (self.spaceP.global_dof_count, self.Ns)
+        pending = []
+        for i in indices:
+            key = keys[i]
+            p_total = None
+            for store in stores:
+                p_total = store.get(key)
+                if p_total is not None and p_total.shape == shape:
+                    break
+                p_total = None
+            if p_total is None:
+                pending.append(i)
+            else:
+                self.store_solution(i, p_total)
+        if len(pending) < len(indices):
+            print("{} / {} frequencies loaded from disk".format(len(indices) - len(pending),
+                                                                len(indices)))
+        return pending
+    
+    def save_frequency(self, i, keys, p_total):
+        """
+        Save the solution of frequency index i in the result cache and in the
+        checkpoint store.
+        """
+        if keys is None:
+            return None
+        if self.cache is not None:
+            self.cache.put(keys[i], p_total)
+        if self.checkpoint is not None:
+            self.checkpoint.put(keys[i], p_total)
+        return None
+    
+    def get_checkpoint_store(self, checkpoint):
+        """
+        Return the checkpoint store. If checkpoint is True, the store is 
+        placed next to the mesh file, otherwise checkpoint is the directory.
+        """
+        import os
+        from electroacPy.acousticSim.storage import ResultStore
+        if checkpoint is True:
+            checkpoint = os.path.splitext(self.meshPath)[0] + "_checkpoint"
+        return ResultStore(checkpoint)
         
     
-    def getMicPressure(self, micPosition, individualSpeakers=False):
+    def init_mesh_arrays(self):
+        """
+        Initialize the surface pressure and velocity arrays. Pressures are 
+        stored as a contiguous coefficient array of shape (nFreq, Ns, nDOF), 
+        velocities are computed from the radiation coefficients. GridFunctions
+        are only created when an item is requested, e.g. p_mesh[f, rs].
+        """
+        if self.storage_precision == "single":
+            dtype = np.complex64
+        else:
+            dtype = np.complex128
+        self.p_mesh = gridFunctionArray(self.spaceP, len(self.frequency), 
+                                        self.Ns, dtype)       # separate drivers
+        self.u_mesh = velocityArray(self)                     # separate sources
+        self.p_total_mesh = totalArray(self.p_mesh)           # summed sources
+        self.u_total_mesh = totalArray(self.u_mesh)           # summed sources
+        return None
+    
+    def get_velocity(self, i, rs):
+        """
+        Return the velocity of radiator rs at frequency index i as a 
+        GridFunction.
+        """
+        return bempp.api.GridFunction(self.spaceU_freq[rs], 
+                                      coefficients=self.get_velocity_coefficients(i, rs))
+    
+    def get_velocity_coefficients(self, i, rs):
+        """
+        Return the velocity coefficients of radiator rs at frequency index i.
+        """
+        coeff_radSurf = self.coeff_radSurf[i, rs, :int(self.dof[rs])]
+        return -coeff_radSurf * self.correctionCoefficients[rs]
+    
+    def get_velocity_block(self, i):
+        """
+        Return the velocity of all radiators at frequency index i, stacked on
+        the union of radiating surfaces. Shape: (nDOF_union, Ns)
+        """
+        u_block = np.zeros([self.spaceU_all.global_dof_count, self.Ns], 
+                           dtype=complex)
+        for rs in range(self.Ns):
+            coeff_radSurf = self.coeff_radSurf[i, rs, :int(self.dof[rs])]
+            u_block[self.unionDOF[rs], rs] = (-coeff_radSurf * 
+                                              self.correctionCoefficients[rs])
+        return u_block
+    
+    def get_continuation_solver(self):
+        """
+        Return a frequency-continuation solver (warm starts and Krylov 
+        subspace recycling across frequencies) if solver="recycle", None 
+        otherwise.
+        """
+        if self.solver != "recycle":
+            return None
+        return FrequencyContinuationSolver(tol=self.tol, 
+                                           recycle=self.recycle_dim,
+                                           restart=self.recycle_dim + 20)
+    
+    def report_assembler(self):
+        """Print the assembler used for boundary and potential operators."""
+        if self.assembler == "fmm":
+            print("FMM assembler: expansion order {}, depth {}, ncrit {}".format(
+                self.fmm_parameters["expansion_order"], 
+                self.fmm_parameters["depth"],
+                self.fmm_parameters["ncrit"]))
+        elif self.assembler == "hmat":
+            print("H-matrix assembler: tolerance {}, leaf size {}".format(
+                self.hmat_parameters["tolerance"],
+                self.hmat_parameters["leaf_size"]))
+        return None
+    
+    def record_compression(self):
+        """
+        Start collecting the compression ratio of the H-matrices assembled 
+        in this process (from the bempp log). Returns None if the assembler 
+        is not "hmat".
+        """
+        if self.assembler != "hmat":
+            return None
+        handler = compressionHandler()
+        level = bempp.api.LOGGER.level
+        bempp.api.LOGGER.setLevel(min(level, bempp.api.LOG_LEVEL["info"]))
+        bempp.api.LOGGER.addHandler(handler)
+        return handler, level
+    
+    def report_compression(self, record):
+        """
+        Stop collecting compression ratios, store them in compression_ratio 
+        and print their range next to the H-matrix settings.
+        """
+        if record is None:
+            return None
+        handler, level = record
+        bempp.api.LOGGER.removeHandler(handler)
+        bempp.api.LOGGER.setLevel(level)
+        if len(handler.ratios) == 0:  # assembled by pool workers
+            return None
+        self.compression_ratio = np.array(handler.ratios)
+        print("H-matrix assembler: tolerance {}, leaf size {}, compression "
+              "ratio {:.1%} to {:.1%} of dense storage".format(
+                  self.hmat_parameters["tolerance"],
+                  self.hmat_parameters["leaf_size"],
+                  np.min(self.compression_ratio), 
+                  np.max(self.compression_ratio)))
+        return None
+    
+    def profile(self, stage, i):
+        """
+        Return a context recording the given stage ("solve" or "evaluation")
+        of frequency index i in the profiler (does nothing if the study is 
+        not profiled).
+        """
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.record(stage, i)
+    
+    def clear_assembly_cache(self):
+        """
+        Remove the FMM interfaces of the last frequency, so that memory does
+        not grow along the frequency sweep.
+        """
+        if self.assembler == "fmm":
+            bempp.api.clear_fmm_cache()
+        return None
+    
+    def get_pressure_block(self, i):
+        """
+        Return the pressure coefficients of all radiators at frequency index i.
+        Shape: (nDOF, Ns)
+        """
+        return self.p_mesh.coefficients[i].T.astype(complex)
+    
+    def store_solution(self, i, p_total):
+        """
+        Store the pressure coefficients p_total (nDOF, Ns) obtained at 
+        frequency index i.
+        """
+        self.p_mesh.coefficients[i] = p_total.T
+        return None
+        
+    def getMicPressure(self, micPosition, individualSpeakers=False, 
+                       max_memory=None, out=None):
         """
         Get the pressure received at the considered microphones.
 
@@ -293,6 +858,13 @@ class bem:
             If True, returns an array containing pressure received at each microphone from individual speakers.
             If False, returns the summed pressure received at each microphone from all speakers.
             Default is False.
+        max_memory : float, optional
+            Memory budget (MB) of the evaluation. Microphones are processed 
+            in chunks that fit the budget. The default is None (mic_memory 
+            parameter of the study, all microphones at once if not set).
+        out : numpy array, optional
+            Preallocated array (e.g. numpy.memmap) receiving the pressure of 
+            individual speakers. Shape: (nFreq, nMic, Ns)
 
         Returns
         -------
@@ -309,32 +881,986 @@ class bem:
         """
         micPosition = np.array(micPosition).T
         nMic = np.shape(micPosition)[1]
-
-        pressure_mic_array = np.zeros([len(self.frequency), nMic, self.Ns], dtype=complex)
-        pressure_mic = np.zeros([len(self.frequency), nMic], dtype=complex)
+        Nfft = len(self.frequency)
+        
+        if out is None:
+            pressure_mic_array = np.zeros([Nfft, nMic, self.Ns], dtype=complex)
+        elif np.shape(out) != (Nfft, nMic, self.Ns):
+            raise ValueError("'out' should be of shape {}.".format((Nfft, nMic, self.Ns)))
+        else:
+            pressure_mic_array = out
+        pressure_mic = np.zeros([Nfft, nMic], dtype=complex)
         omega = 2 * np.pi * self.frequency
         k = -omega / self.c_0
+        
+        if max_memory is None:
+            max_memory = self.mic_memory
+        chunk = get_mic_chunk_size(nMic, Nfft, self.Ns, max_memory, 
+                                   self.n_workers > 1)
 
         print("\n" + "Computing pressure at microphones")
-        for i in tqdm(range(len(k))):  # looping through frequencies
-            for rs in range(self.Ns):
-                # pressure received at microphones
-                pressure_mic_array[i, :, rs] = np.reshape(
-                    helmholtz_potential.double_layer(self.spaceP,
-                                              micPosition,
-                                              k[i]) * self.p_mesh[i, rs] \
-                    - 1j * omega[i] * self.rho_0 * \
-                    helmholtz_potential.single_layer(
-                        self.spaceU_freq[rs],
-                        micPosition, k[i]) * self.u_mesh[i, rs], nMic)
-                pressure_mic[i, :] += pressure_mic_array[i, :, rs]
+        self.report_assembler()
+        for start in range(0, nMic, chunk):
+            stop = min(start + chunk, nMic)
+            mics = np.ascontiguousarray(micPosition[:, start:stop])
+            if self.n_workers > 1:
+                from electroacPy.acousticSim import parallel
+                pressure_mic_array[:, start:stop] = parallel.mic_pressure(self, mics,
+                                                                          k, omega)
+            else:
+                for i in tqdm(range(len(k))):  # looping through frequencies
+                    with self.profile("evaluation", i):
+                        pressure_mic_array[i, start:stop] = mic_pressure_frequency(self.spaceP, 
+                                                                                   self.spaceU_all,
+                                                                                   mics, 
+                                                                                   k[i], omega[i],
+                                                                                   self.rho_0,
+                                                                                   self.get_pressure_block(i),
+                                                                                   self.get_velocity_block(i),
+                                                                                   self.planes,
+                                                                                   self.assembler,
+                                                                                   self.parameters)
+                    self.clear_assembly_cache()
+            pressure_mic[:, start:stop] = np.sum(pressure_mic_array[:, start:stop], 2)
+        if hasattr(pressure_mic_array, "flush"):
+            pressure_mic_array.flush()
+
+        if individualSpeakers is True:
+            out = (pressure_mic, pressure_mic_array)
+        elif individualSpeakers is False:
+            out = pressure_mic
+        return out
+
+
+
+    def getFarFieldPressure(self, directions, radius, origin=[0, 0, 0],
+                            individualSpeakers=False, pattern=False):
+        """
+        Get the pressure in the given directions, at a distance radius from 
+        origin, using the far-field approximation. The angular pattern is 
+        computed once per frequency, then propagated to the radius.
+
+        Parameters
+        ----------
+        directions : numpy array
+            Directions of observation (unit vectors). Shape: (nDir, 3)
+        radius : float
+            Distance from origin.
+        origin : list, optional
+            Centre of the observation sphere. The default is [0, 0, 0].
+        individualSpeakers : bool, optional
+            If True, also returns the pressure of individual speakers. 
+            Default is False.
+        pattern : bool, optional
+            If True, returns the far-field pattern without the exp(ikr)/r 
+            distance and phase term. Default is False.
+
+        Returns
+        -------
+        pressure_mic : numpy array
+            Pressure in the given directions. Shape: (nFreq, nDir)
 
+        """
+        directions = np.array(directions, dtype=float).T
+        norm = np.linalg.norm(directions, axis=0)
+        directions = directions / np.where(norm == 0, 1, norm)
+        origin = np.array(origin, dtype=float)
+        nDir = directions.shape[1]
+        omega = 2 * np.pi * self.frequency
+        k = -omega / self.c_0
+        self.check_far_field(radius, origin)
+
+        pressure_mic_array = np.zeros([len(k), nDir, self.Ns], dtype=complex)
+        print("\n" + "Computing far-field pressure")
+        for i in tqdm(range(len(k))):
+            with self.profile("evaluation", i):
+                pressure_mic_array[i] = far_field_frequency(self.spaceP,
+                                                            self.spaceU_all,
+                                                            directions, origin,
+                                                            k[i], omega[i],
+                                                            self.rho_0,
+                                                            self.get_pressure_block(i),
+                                                            self.get_velocity_block(i),
+                                                            self.planes)
+            if pattern is False:
+                pressure_mic_array[i] *= np.exp(1j * k[i] * radius) / radius
+        pressure_mic = np.sum(pressure_mic_array, 2)
+        
         if individualSpeakers is True:
             out = (pressure_mic, pressure_mic_array)
         elif individualSpeakers is False:
             out = pressure_mic
         return out
+    
+    def check_far_field(self, radius, origin=[0, 0, 0]):
+        """
+        Check that radius lies in the far field of the radiating system 
+        (mesh and image sources) seen from origin, at the highest frequency:
+        radius > 2*D**2/lambda and radius > 2*D, with D the diameter of the 
+        sphere enclosing the system. A warning is raised otherwise.
+
+        Returns
+        -------
+        bool
+            True if radius is in the far field.
 
+        """
+        vertices = self.grid_sim.vertices - np.reshape(origin, (3, 1))
+        if self.planes is not None:
+            for axis, offset in self.planes:
+                mirror = vertices.copy()
+                mirror[axis] = 2 * (offset - origin[axis]) - mirror[axis]
+                vertices = np.concatenate((vertices, mirror), axis=1)
+        D = 2 * np.max(np.linalg.norm(vertices, axis=0))
+        wavelength = self.c_0 / np.max(self.frequency)
+        r_far = max(2 * D**2 / wavelength, 2 * D)
+        if radius < r_far:
+            warnings.warn("Radius {} m is not in the far field of the system "
+                          "(> {:.2f} m at {} Hz): far-field results may be "
+                          "inaccurate.".format(radius, r_far, np.max(self.frequency)))
+            return False
+        return True
+
+
+#%% Surface data
+class gridFunctionArray:
+    def __init__(self, space, nFreq, Ns, dtype=np.complex128):
+        """
+        Coefficients of GridFunctions defined on the same space, for each 
+        frequency and radiator, stored in a contiguous array of shape 
+        (nFreq, Ns, nDOF). Items behave like the former object arrays of 
+        GridFunctions: p_mesh[f, rs] and p_mesh[f][rs] return a GridFunction.
+
+        Parameters
+        ----------
+        space : bempp space
+            Space of the GridFunctions.
+        nFreq : int
+            Number of frequencies.
+        Ns : int
+            Number of radiators.
+        dtype : numpy dtype, optional
+            np.complex128 (default) or np.complex64.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.space = space
+        self.coefficients = np.zeros([nFreq, Ns, space.global_dof_count], 
+                                     dtype=dtype)
+        
+    @property
+    def shape(self):
+        return self.coefficients.shape[:2]
+    
+    def __len__(self):
+        return self.coefficients.shape[0]
+    
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            i, rs = index
+            return bempp.api.GridFunction(self.space, 
+                                          coefficients=self.coefficients[i, rs].astype(complex))
+        return frequencyView(self, index)
+    
+    def __setitem__(self, index, value):
+        if isinstance(value, bempp.api.GridFunction):
+            value = value.coefficients
+        self.coefficients[index] = value
+        
+    def total(self, i):
+        """Return the sum of all radiators at frequency index i."""
+        return bempp.api.GridFunction(self.space, 
+                                      coefficients=np.sum(self.coefficients[i], 0).astype(complex))
+    
+
+class velocityArray:
+    def __init__(self, bemObj):
+        """
+        Velocities of each frequency and radiator, computed from the radiation
+        coefficients of bemObj when requested: u_mesh[f, rs] and u_mesh[f][rs] 
+        return a GridFunction.
+        """
+        self.bemObj = bemObj
+        
+    @property
+    def shape(self):
+        return (len(self.bemObj.frequency), self.bemObj.Ns)
+    
+    def __len__(self):
+        return len(self.bemObj.frequency)
+    
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            return self.bemObj.get_velocity(*index)
+        return frequencyView(self, index)
+    
+    def total(self, i):
+        """Return the sum of all radiators at frequency index i."""
+        return bempp.api.GridFunction(self.bemObj.spaceU_all, 
+                                      coefficients=np.sum(self.bemObj.get_velocity_block(i), 1))
+        
+
+class frequencyView:
+    def __init__(self, data, i):
+        """Radiators of a gridFunctionArray / velocityArray at frequency index i."""
+        self.data = data
+        self.i = i
+        
+    def __len__(self):
+        return self.data.shape[1]
+    
+    def __getitem__(self, rs):
+        return self.data[self.i, rs]
+    
+    def __iter__(self):
+        for rs in range(len(self)):
+            yield self.data[self.i, rs]
+            
+
+class totalArray:
+    def __init__(self, data):
+        """Sum of all radiators of a gridFunctionArray / velocityArray."""
+        self.data = data
+        
+    def __len__(self):
+        return len(self.data)
+    
+    def __getitem__(self, i):
+        return self.data.total(i)
+
+
+class compressionHandler(logging.Handler):
+    """Gather the compression ratios of H-matrices from bempp log records."""
+    
+    def __init__(self):
+        super().__init__(level=logging.NOTSET)
+        self.ratios = []
+    
+    def emit(self, record):
+        if hasattr(record, "compression_ratio"):
+            self.ratios.append(float(record.compression_ratio))
+        return None
+
+
+#%% Frequency solvers
+def solve_frequency(spaceP, identity, spaceU, u_block, k, omega, rho_0, 
+                    domain_operator, solver, tol, continuation=None, 
+                    wideband=None, planes=None, assembler="dense", 
+                    parameters=None, formulation="standard", coupling=None,
+                    solver_precision="double"):
+    """
+    Solve the BEM equation at a single frequency for a block of radiators.
+
+    Parameters
+    ----------
+    spaceP : bempp space
+        Pressure space (P1).
+    identity : BoundaryOperator
+        Identity operator on spaceP.
+    spaceU : bempp space
+        Velocity space (DP0) on the union of radiating surfaces.
+    u_block : numpy array
+        Velocity of each radiator on spaceU. Shape: (nDOF_union, Ns)
+    k : float
+        Wavenumber.
+    omega : float
+        Angular frequency.
+    rho_0 : float
+        Air density.
+    domain_operator : int
+        -1 for exterior, +1 for interior problems.
+    solver : str
+        "gmres", "lu" or "recycle".
+    tol : float
+        GMRES tolerance.
+    continuation : FrequencyContinuationSolver, optional
+        Solver carried from one frequency to the next. Used if 
+        solver="recycle".
+    wideband : tuple of WidebandOperator, optional
+        Interpolated (double_layer, single_layer) operators. If None, the 
+        operators are assembled at k.
+    planes : list of tuple, optional
+        Infinite baffles (axis, offset) handled with image sources.
+    assembler : str, optional
+        Assembler of the operators: "dense" (default), "fmm" or "hmat".
+    parameters : bempp parameters, optional
+        Assembly parameters (e.g. FMM settings). See get_assembly_parameters.
+    formulation : str, optional
+        "standard" (default) or "burton_miller" (exterior problems only).
+    coupling : complex, optional
+        Coupling parameter of the Burton-Miller formulation. The default is
+        None (1j / k).
+    solver_precision : str, optional
+        "double" (default) or "mixed" (single precision LU factors and 
+        iterative refinement in double precision) for solver="lu". Only the 
+        factorization is single precision: the operators are assembled in 
+        double precision and the matrix is kept for the residuals.
+
+    Returns
+    -------
+    p_total : numpy array
+        Pressure coefficients on spaceP. Shape: (nDOF, Ns)
+    iterations : numpy array
+        Number of iterations of each radiator (refinement steps for direct
+        solves).
+    residual : numpy array
+        Relative residual of each radiator for direct solves, nan for 
+        iterative solvers.
+
+    """
+    if wideband is None:
+        double_layer = get_double_layer(spaceP, k, planes, assembler, parameters)
+        single_layer = get_single_layer(spaceU, spaceP, k, planes, assembler, 
+                                        parameters)
+    else:
+        double_layer = wideband[0].at(k)
+        single_layer = wideband[1].at(k)
+    lhs = double_layer + 0.5 * identity * domain_operator
+    if formulation == "burton_miller":
+        lhs = burton_miller_lhs(lhs, spaceP, k, assembler, parameters, coupling)
+        single_layer = burton_miller_single_layer(single_layer, spaceU, spaceP,
+                                                  k, assembler, parameters, 
+                                                  coupling)
+    rhs = 1j * omega * rho_0 * (single_layer.weak_form() @ u_block)
+    
+    iterations = np.zeros(rhs.shape[1], dtype=int)
+    residual = np.full(rhs.shape[1], np.nan)
+    if solver == "lu":
+        # all radiators share the same lhs: one factorization
+        matrix = bempp.api.as_matrix(lhs.weak_form())
+        del lhs, double_layer  # only the dense matrix is used from here on
+        lu = factorize(matrix, solver_precision)
+        p_total, iterations[:], residual = refine_solve(matrix, lu, rhs, tol, 
+                                                        solver_precision)
+        return p_total, iterations, residual
+    
+    rhs_fun = [bempp.api.GridFunction(spaceP, projections=rhs[:, rs],
+                                      dual_space=spaceP) 
+               for rs in range(rhs.shape[1])]
+    p_total = np.zeros(rhs.shape, dtype=complex)
+    if solver == "recycle":
+        p_fun, _, iterations[:] = continuation.solve(lhs, rhs_fun, k,
+                                                     return_iteration_count=True)
+        for rs in range(rhs.shape[1]):
+            p_total[:, rs] = p_fun[rs].coefficients
+        return p_total, iterations, residual
+    
+    for rs in range(rhs.shape[1]):
+        p_fun, _, iterations[rs] = gmres(lhs, rhs_fun[rs], tol=tol, 
+                                         return_iteration_count=True)
+        p_total[:, rs] = p_fun.coefficients
+    return p_total, iterations, residual
+
+
+def solve_admittance_frequency(spaceP, identity, spaceU, u_block, admittance,
+                               k, omega, rho_0, domain_operator, solver, tol,
+                               planes=None, assembler="dense", parameters=None,
+                               formulation="standard", coupling=None,
+                               solver_precision="double"):
+    """
+    Solve the BEM equation with absorbing surfaces at a single frequency for 
+    a block of radiators. The impedance boundary matrix is assembled and 
+    factorized (solver="lu") or preconditioned (iterative solvers) once, 
+    then applied to all radiators.
+
+    Parameters
+    ----------
+    spaceP : bempp space
+        Pressure space (P1).
+    identity : BoundaryOperator
+        Identity operator on spaceP.
+    spaceU : bempp space
+        Velocity space (DP0) on the union of radiating surfaces.
+    u_block : numpy array
+        Velocity of each radiator on spaceU. Shape: (nDOF_union, Ns)
+    admittance : numpy array
+        Surface admittance coefficients on spaceP.
+    k : float
+        Wavenumber.
+    omega : float
+        Angular frequency.
+    rho_0 : float
+        Air density.
+    domain_operator : int
+        -1 for exterior, +1 for interior problems.
+    solver : str
+        "lu" for a direct solve, otherwise GMRES preconditioned by the 
+        inverse mass matrix of spaceP ("gmres" and "recycle").
+    tol : float
+        GMRES tolerance.
+    planes : list of tuple, optional
+        Infinite baffles (axis, offset) handled with image sources.
+    assembler : str, optional
+        Assembler of the operators: "dense" (default), "fmm" or "hmat".
+    parameters : bempp parameters, optional
+        Assembly parameters (e.g. FMM settings). See get_assembly_parameters.
+    formulation : str, optional
+        "standard" (default) or "burton_miller" (exterior problems only).
+    coupling : complex, optional
+        Coupling parameter of the Burton-Miller formulation. The default is
+        None (1j / k).
+    solver_precision : str, optional
+        "double" (default) or "mixed" (single precision LU factors and 
+        iterative refinement in double precision) for solver="lu". Only the 
+        factorization is single precision: the operators are assembled in 
+        double precision and the matrix is kept for the residuals.
+
+    Returns
+    -------
+    p_total : numpy array
+        Pressure coefficients on spaceP. Shape: (nDOF, Ns)
+    iterations : numpy array
+        Number of iterations of each radiator (refinement steps for direct
+        solves).
+    residual : numpy array
+        Relative residual of each radiator for direct solves, nan for 
+        iterative solvers.
+    timings : dict
+        Time (s) spent in "assembly", "factorization" and "solve".
+
+    """
+    
+    timings = {}
+    with bempp.api.Timer(enable_log=False) as timer:
+        double_layer = get_double_layer(spaceP, k, planes, assembler, parameters)
+        single_layer_Y = get_single_layer(spaceP, spaceP, k, planes, assembler,
+                                          parameters)
+        single_layer = get_single_layer(spaceU, spaceP, k, planes, assembler,
+                                        parameters)
+        lhs = double_layer + 0.5 * identity * domain_operator
+        if formulation == "burton_miller":
+            # the admittance term goes through the combined single layer
+            lhs = burton_miller_lhs(lhs, spaceP, k, assembler, parameters, 
+                                    coupling)
+            single_layer_Y = burton_miller_single_layer(single_layer_Y, spaceP,
+                                                        spaceP, k, assembler, 
+                                                        parameters, coupling)
+            single_layer = burton_miller_single_layer(single_layer, spaceU, 
+                                                      spaceP, k, assembler,
+                                                      parameters, coupling)
+        lhs = (lhs.weak_form()
+               - 1j * k * single_layer_Y.weak_form() * DiagonalOperator(admittance))
+        rhs = 1j * omega * rho_0 * (single_layer.weak_form() @ u_block)
+    timings["assembly"] = timer.interval
+    
+    iterations = np.zeros(rhs.shape[1], dtype=int)
+    residual = np.full(rhs.shape[1], np.nan)
+    if solver == "lu":
+        matrix = bempp.api.as_matrix(lhs)
+        del lhs, double_layer, single_layer_Y  # only the dense matrix is used from here on
+        with bempp.api.Timer(enable_log=False) as timer:
+            lu = factorize(matrix, solver_precision)
+        timings["factorization"] = timer.interval
+        with bempp.api.Timer(enable_log=False) as timer:
+            p_total, iterations[:], residual = refine_solve(matrix, lu, rhs, tol,
+                                                            solver_precision)
+        timings["solve"] = timer.interval
+        return p_total, iterations, residual, timings
+    
+    with bempp.api.Timer(enable_log=False) as timer:
+        preconditioner = spaceP.inverse_mass_matrix()  # cached by the space
+    timings["factorization"] = timer.interval
+    
+    p_total = np.zeros(rhs.shape, dtype=complex)
+    with bempp.api.Timer(enable_log=False) as timer:
+        for rs in range(rhs.shape[1]):
+            count = [0]
+            
+            def callback(residual):
+                count[0] += 1
+                bempp.api.log("GMRES Iteration {} with residual {}".format(count[0], residual),
+                              extra={"residual": residual})
+                
+            p_total[:, rs], _ = scipy_gmres(lhs, rhs[:, rs], rtol=tol, 
+                                            M=preconditioner,
+                                            callback=callback,
+                                            callback_type="pr_norm")
+            iterations[rs] = count[0]
+    timings["solve"] = timer.interval
+    return p_total, iterations, residual, timings
+
+
+def factorize(matrix, solver_precision="double"):
+    """
+    Return the LU factors of a dense matrix, computed in single precision 
+    (complex64) if solver_precision is "mixed". The single precision copy is
+    factorized in place, matrix is left unchanged.
+    """
+    if solver_precision == "mixed":
+        return lu_factor(matrix.astype(np.complex64), overwrite_a=True, 
+                         check_finite=False)
+    return lu_factor(matrix, check_finite=False)
+
+
+def refine_solve(matrix, lu, rhs, tol, solver_precision="double", 
+                 max_refinement=10):
+    """
+    Solve matrix @ x = rhs with the LU factors of matrix. With 
+    solver_precision="mixed", the single precision solution is improved by
+    iterative refinement: residuals are computed in double precision with 
+    matrix, corrections are solved with the single precision factors, until
+    the relative residual is below tol. The double precision matrix is 
+    needed for the residuals, so it stays in memory next to the factors.
+
+    Parameters
+    ----------
+    matrix : numpy array
+        Dense matrix in double precision.
+    lu : tuple
+        LU factors (see factorize).
+    rhs : numpy array
+        Right-hand sides. Shape: (nDOF, Ns)
+    tol : float
+        Target relative residual of the refinement.
+    solver_precision : str, optional
+        "double" (default) or "mixed".
+    max_refinement : int, optional
+        Maximum number of refinement steps. The default is 10.
+
+    Returns
+    -------
+    x : numpy array
+        Solution. Shape: (nDOF, Ns)
+    steps : int
+        Number of refinement steps.
+    residual : numpy array
+        Relative residual of each right-hand side.
+
+    """
+    norm = np.linalg.norm(rhs, axis=0)
+    norm[norm == 0] = 1
+    if solver_precision != "mixed":
+        x = lu_solve(lu, rhs)
+        return x, 0, np.linalg.norm(rhs - matrix @ x, axis=0) / norm
+    
+    x = lu_solve(lu, rhs.astype(np.complex64)).astype(complex)
+    steps = 0
+    while True:
+        r = rhs - matrix @ x
+        residual = np.linalg.norm(r, axis=0) / norm
+        if np.max(residual) <= tol or steps == max_refinement:
+            break
+        x += lu_solve(lu, r.astype(np.complex64))
+        steps += 1
+    return x, steps, residual
+
+
+def wideband_operators(spaceP, spaceU, k, tol, planes=None):
+    """
+    Build the wideband (interpolated in k) double layer and single layer 
+    operators over the range of wavenumbers k.
+
+    Parameters
+    ----------
+    spaceP : bempp space
+        Pressure space (P1).
+    spaceU : bempp space
+        Velocity space (DP0) on the union of radiating surfaces.
+    k : numpy array
+        Wavenumbers of the sweep.
+    tol : float
+        Target relative error of the interpolated operators.
+    planes : list of tuple, optional
+        Infinite baffles (axis, offset) handled with image sources.
+
+    Returns
+    -------
+    double_layer : WidebandOperator
+    single_layer : WidebandOperator
+
+    """
+    print("Wideband assembly (tol = {})".format(tol))
+    double_layer = bempp.api.WidebandOperator(lambda kk: get_double_layer(spaceP, kk, planes),
+                                              np.min(k), np.max(k), tol=tol)
+    single_layer = bempp.api.WidebandOperator(lambda kk: get_single_layer(spaceU, spaceP, 
+                                                                          kk, planes),
+                                              np.min(k), np.max(k), tol=tol)
+    return double_layer, single_layer
+
+
+def mic_pressure_frequency(spaceP, spaceU, micPosition, k, omega, rho_0,
+                           p_total, u_block, planes=None, assembler="dense",
+                           parameters=None):
+    """
+    Compute the pressure radiated by each radiator at the microphones, at a 
+    single frequency. Potentials are evaluated once for all radiators.
+
+    Parameters
+    ----------
+    spaceP : bempp space
+        Pressure space (P1).
+    spaceU : bempp space
+        Velocity space (DP0) on the union of radiating surfaces.
+    micPosition : numpy array
+        Microphones positions. Shape: (3, nMic)
+    k : float
+        Wavenumber.
+    omega : float
+        Angular frequency.
+    rho_0 : float
+        Air density.
+    p_total : numpy array
+        Pressure coefficients of each radiator. Shape: (nDOF, Ns)
+    u_block : numpy array
+        Velocity of each radiator on spaceU. Shape: (nDOF_union, Ns)
+    planes : list of tuple, optional
+        Infinite baffles (axis, offset) handled with image sources.
+    assembler : str, optional
+        Assembler of the operators: "dense" (default), "fmm" or "hmat".
+    parameters : bempp parameters, optional
+        Assembly parameters (e.g. FMM settings). See get_assembly_parameters.
+
+    Returns
+    -------
+    pressure_mic : numpy array
+        Pressure at microphones. Shape: (nMic, Ns)
+
+    """
+    double_layer = get_double_layer_potential(spaceP, micPosition, k, planes,
+                                              assembler, parameters)
+    single_layer = get_single_layer_potential(spaceU, micPosition, k, planes,
+                                              assembler, parameters)
+    pressure_mic = (double_layer.evaluate_block(p_total)[0] - 
+                    1j * omega * rho_0 * single_layer.evaluate_block(u_block)[0])
+    return pressure_mic
+
+
+def get_mic_chunk_size(nMic, Nfft, Ns, max_memory=None, parallel=False):
+    """
+    Return the number of microphones evaluated at once so that the working 
+    memory of the evaluation stays below max_memory (MB).
+
+    Parameters
+    ----------
+    nMic : int
+        Total number of microphones.
+    Nfft : int
+        Number of frequencies.
+    Ns : int
+        Number of radiators.
+    max_memory : float, optional
+        Memory budget in MB. The default is None (no limit).
+    parallel : bool, optional
+        True if microphones are evaluated by the process pool, which gathers
+        all frequencies of a chunk before returning them.
+
+    Returns
+    -------
+    chunk : int
+        Number of microphones per chunk.
+
+    """
+    if max_memory is None:
+        return max(nMic, 1)
+    # positions + double layer, single layer and summed potentials
+    mic_bytes = 3 * 8 + 3 * Ns * 16
+    if parallel is True:
+        mic_bytes += Nfft * Ns * 16
+    return int(min(max(nMic, 1), max(1, max_memory * 1024**2 // mic_bytes)))
+
+
+def far_field_frequency(spaceP, spaceU, directions, origin, k, omega, rho_0,
+                        p_total, u_block, planes=None):
+    """
+    Compute the far-field pattern of each radiator, at a single frequency. The
+    pressure at a distance r from origin is pattern * exp(1j*k*r) / r.
+
+    Parameters
+    ----------
+    spaceP : bempp space
+        Pressure space (P1).
+    spaceU : bempp space
+        Velocity space (DP0) on the union of radiating surfaces.
+    directions : numpy array
+        Directions of observation (unit vectors). Shape: (3, nDir)
+    origin : numpy array
+        Phase origin of the pattern.
+    k : float
+        Wavenumber.
+    omega : float
+        Angular frequency.
+    rho_0 : float
+        Air density.
+    p_total : numpy array
+        Pressure coefficients of each radiator. Shape: (nDOF, Ns)
+    u_block : numpy array
+        Velocity of each radiator on spaceU. Shape: (nDOF_union, Ns)
+    planes : list of tuple, optional
+        Infinite baffles (axis, offset) handled with image sources. The 
+        pattern of an image is the pattern of the mesh in the mirrored 
+        direction, with the phase of the image position.
+
+    Returns
+    -------
+    pattern : numpy array
+        Far-field pattern. Shape: (nDir, Ns)
+
+    """
+    from bempp.api.operators.far_field import helmholtz as helmholtz_far_field
+    
+    if planes is None:
+        planes = []
+    nDir = directions.shape[1]
+    pattern = np.zeros([nDir, p_total.shape[1]], dtype=complex)
+    for image in range(2**len(planes)):
+        mirrored = directions.copy()
+        image_phase = np.zeros(nDir)
+        for n, (axis, offset) in enumerate(planes):
+            if (image >> n) & 1:
+                mirrored[axis] = -mirrored[axis]
+                image_phase += 2 * offset * directions[axis]
+        double_layer = helmholtz_far_field.double_layer(spaceP, mirrored, k)
+        single_layer = helmholtz_far_field.single_layer(spaceU, mirrored, k)
+        pattern += (np.exp(-1j * k * image_phase)[:, None] * 
+                    (double_layer.evaluate_block(p_total)[0] - 
+                     1j * omega * rho_0 * single_layer.evaluate_block(u_block)[0]))
+    # move the phase origin
+    pattern *= np.exp(1j * k * (origin @ directions))[:, None]
+    return pattern
+
+
+#%% Operators
+def get_double_layer(spaceP, k, planes=None, assembler="dense", parameters=None):
+    """
+    Return the Helmholtz double layer on spaceP. Infinite baffles given in 
+    planes, as (axis, offset) tuples, are handled with image sources.
+    """
+    if planes is None:
+        return helmholtz.double_layer(spaceP, spaceP, spaceP, k, 
+                                      parameters=parameters, assembler=assembler)
+    return helmholtz.double_layer_halfspace(spaceP, spaceP, spaceP, k, planes,
+                                            parameters=parameters, 
+                                            assembler=assembler)
+
+
+def get_single_layer(spaceU, spaceP, k, planes=None, assembler="dense", 
+                     parameters=None):
+    """
+    Return the Helmholtz single layer from spaceU to spaceP. Infinite baffles 
+    given in planes, as (axis, offset) tuples, are handled with image sources.
+    """
+    if planes is None:
+        return helmholtz.single_layer(spaceU, spaceP, spaceP, k, 
+                                      parameters=parameters, assembler=assembler)
+    return helmholtz.single_layer_halfspace(spaceU, spaceP, spaceP, k, planes,
+                                            parameters=parameters, 
+                                            assembler=assembler)
+
+
+def get_double_layer_potential(spaceP, points, k, planes=None, 
+                               assembler="dense", parameters=None):
+    """Return the Helmholtz double layer potential at points."""
+    assembler = get_potential_assembler(assembler)
+    if planes is None:
+        return helmholtz_potential.double_layer(spaceP, points, k, 
+                                                parameters=parameters,
+                                                assembler=assembler)
+    return helmholtz_potential.double_layer_halfspace(spaceP, points, k, planes,
+                                                      parameters=parameters,
+                                                      assembler=assembler)
+
+
+def get_single_layer_potential(spaceU, points, k, planes=None, 
+                               assembler="dense", parameters=None):
+    """Return the Helmholtz single layer potential at points."""
+    assembler = get_potential_assembler(assembler)
+    if planes is None:
+        return helmholtz_potential.single_layer(spaceU, points, k, 
+                                                parameters=parameters,
+                                                assembler=assembler)
+    return helmholtz_potential.single_layer_halfspace(spaceU, points, k, planes,
+                                                      parameters=parameters,
+                                                      assembler=assembler)
+
+
+def burton_miller_lhs(lhs, spaceP, k, assembler="dense", parameters=None,
+                      coupling=None):
+    """
+    Return the left-hand side of the Burton-Miller formulation. The exterior
+    equation (K - I/2) p = V dp/dn is combined with its normal derivative
+    W p = -(I/2 + K') dp/dn:
+    
+        (K - I/2 + a W) p = (V - a (I/2 + K')) dp/dn
+    
+    which is uniquely solvable at the interior eigenfrequencies of closed
+    bodies. lhs is K - I/2 on spaceP, a is the coupling parameter (default
+    1j / k).
+    """
+    if coupling is None:
+        coupling = 1j / k
+    hypersingular = helmholtz.hypersingular(spaceP, spaceP, spaceP, k, 
+                                            parameters=parameters, 
+                                            assembler=assembler)
+    return lhs + coupling * hypersingular
+
+
+def burton_miller_single_layer(single_layer, spaceU, spaceP, k, 
+                               assembler="dense", parameters=None, 
+                               coupling=None):
+    """
+    Return the right-hand side operator of the Burton-Miller formulation,
+    V - a (I/2 + K') from spaceU to spaceP (see burton_miller_lhs). 
+    single_layer is V.
+    """
+    if coupling is None:
+        coupling = 1j / k
+    identity = sparse.identity(spaceU, spaceP, spaceP)
+    adjoint_double_layer = helmholtz.adjoint_double_layer(spaceU, spaceP, spaceP,
+                                                          k, parameters=parameters,
+                                                          assembler=assembler)
+    return single_layer - coupling * (0.5 * identity + adjoint_double_layer)
+
+
+def get_potential_assembler(assembler):
+    """
+    Return the assembler of potential operators. H-matrices only compress
+    boundary operators: potentials are then evaluated with dense assembly.
+    """
+    if assembler == "hmat":
+        return "dense"
+    return assembler
+
+
+def get_fmm_parameters(fmm_parameters=None):
+    """
+    Return the FMM settings (expansion_order, depth, ncrit) as a dict. Missing
+    entries are taken from bempp global parameters.
+    """
+    default = bempp.api.GLOBAL_PARAMETERS.fmm
+    out = {"expansion_order": default.expansion_order,
+           "depth": default.depth,
+           "ncrit": default.ncrit}
+    if fmm_parameters is not None:
+        for key in fmm_parameters:
+            if key not in out:
+                raise ValueError("'fmm_parameters' key '{}' not understood. Try "
+                                 "'expansion_order', 'depth' or 'ncrit'.".format(key))
+            out[key] = int(fmm_parameters[key])
+    return out
+
+
+def get_hmat_parameters(hmat_parameters=None):
+    """
+    Return the H-matrix settings (tolerance, leaf_size) as a dict. Missing
+    entries are taken from bempp global parameters.
+    """
+    default = bempp.api.GLOBAL_PARAMETERS.hmat
+    out = {"tolerance": default.tolerance,
+           "leaf_size": default.leaf_size}
+    if hmat_parameters is not None:
+        for key in hmat_parameters:
+            if key not in out:
+                raise ValueError("'hmat_parameters' key '{}' not understood. Try "
+                                 "'tolerance' or 'leaf_size'.".format(key))
+            out[key] = type(out[key])(hmat_parameters[key])
+    return out
+
+
+def get_assembly_parameters(assembler, fmm_parameters, hmat_parameters=None):
+    """
+    Return a copy of bempp global parameters holding the given FMM or 
+    H-matrix settings, None (global parameters) for dense assembly.
+    """
+    import copy
+    
+    if assembler == "fmm":
+        settings, group = fmm_parameters, "fmm"
+    elif assembler == "hmat":
+        settings, group = hmat_parameters, "hmat"
+    else:
+        return None
+    parameters = copy.deepcopy(bempp.api.GLOBAL_PARAMETERS)
+    for key, value in settings.items():
+        setattr(getattr(parameters, group), key, value)
+    return parameters
+
+
+def get_transfer_matrix(space_from, space_to, n_candidates=8):
+    """
+    Return the sparse matrix interpolating P1 coefficients of space_from at
+    the vertices of space_to. Each vertex is projected on the closest of the
+    n_candidates elements of space_from with the nearest centroids.
+    Shape: (space_to.global_dof_count, space_from.global_dof_count)
+    """
+    from scipy.spatial import cKDTree
+    from scipy.sparse import coo_matrix
+    
+    grid = space_from.grid
+    points = space_to.grid.vertices.T
+    n_candidates = min(n_candidates, grid.number_of_elements)
+    _, candidates = cKDTree(grid.centroids).query(points, k=n_candidates)
+    candidates = candidates.reshape(len(points), -1)
+    corners = grid.vertices[:, grid.elements]  # (xyz, corner, element)
+    
+    distance = np.full(len(points), np.inf)
+    elements = np.zeros(len(points), dtype=int)
+    weights = np.zeros((len(points), 3))
+    for c in range(n_candidates):
+        element = candidates[:, c]
+        lam = get_barycentric_coordinates(points, corners[:, 0, element].T,
+                                          corners[:, 1, element].T,
+                                          corners[:, 2, element].T)
+        projected = np.einsum("nj,xjn->nx", lam, corners[:, :, element])
+        d = np.linalg.norm(points - projected, axis=1)
+        closer = d < distance
+        distance[closer] = d[closer]
+        elements[closer] = element[closer]
+        weights[closer] = lam[closer]
+    
+    # global dof of each vertex of space_to
+    to_dofs = np.full(space_to.grid.number_of_vertices, -1)
+    support = space_to.support_elements
+    for i in range(3):
+        to_dofs[space_to.grid.elements[i, support]] = space_to.local2global[support, i]
+    
+    rows = np.repeat(to_dofs, 3)
+    cols = space_from.local2global[elements].ravel()
+    values = (weights * space_from.local_multipliers[elements]).ravel()
+    keep = rows >= 0
+    return coo_matrix((values[keep], (rows[keep], cols[keep])),
+                      shape=(space_to.global_dof_count, 
+                             space_from.global_dof_count)).tocsr()
+
+
+def get_barycentric_coordinates(points, a, b, c):
+    """
+    Return the barycentric coordinates, in triangles (a, b, c), of the 
+    projection of points on the triangle planes. Coordinates are clipped to
+    the triangle. Shape: (nPoints, 3)
+    """
+    e1 = b - a
+    e2 = c - a
+    r = points - a
+    d11 = np.sum(e1 * e1, axis=1)
+    d12 = np.sum(e1 * e2, axis=1)
+    d22 = np.sum(e2 * e2, axis=1)
+    r1 = np.sum(r * e1, axis=1)
+    r2 = np.sum(r * e2, axis=1)
+    det = d11 * d22 - d12**2
+    lam1 = (d22 * r1 - d12 * r2) / det
+    lam2 = (d11 * r2 - d12 * r1) / det
+    lam = np.clip(np.stack([1 - lam1 - lam2, lam1, lam2], axis=1), 0, None)
+    return lam / np.sum(lam, axis=1, keepdims=True)
+
+
+def get_image_planes(boundary_conditions):
+    """
+    Return the infinite baffles of boundary_conditions as a list of 
+    (axis, offset) tuples, or None if there is no baffle.
+    """
+    planes = []
+    if boundary_conditions is not None:
+        for item in boundary_conditions:
+            boundary = boundary_conditions[item]
+            if boundary["type"] == "infinite_baffle":
+                axis = ["x", "y", "z"].index(item.lower())
+                planes.append((axis, float(boundary["offset"])))
+    if len(planes) == 0:
+        return None
+    return planes
 
 
 # %%useful functions
@@ -11,6 +11,8 @@ import pyvista
 import os
 import electroacPy
 from ..general import plot as gplot
+from .synthesis import (get_element_coefficients, get_radiator_lookup,
+                        get_radiator_weights)
 directory_path = os.path.abspath(electroacPy.__file__)
 
 pi = np.pi
@@ -64,23 +66,31 @@ class evaluations:
         self.frequency = bemObject.frequency
         self.setup = {}
         
+        # per-frequency profiling, shared with the bem object (None if the 
+        # study is not profiled)
+        self.profiler = bemObject.profiler
+        
         # ref to system
         self.referenceStudy = None
+        
+        # memory-mapped pressure files written by solve()
+        self.memmap_files = []
     
     
     def polarRadiation(self, evaluationName, minAngle: float, maxAngle: float,
                        step: float, on_axis: str, direction: str, 
                        radius: float = 5, offset: list = [0, 0, 0], **kwargs):
         
+        far_field = kwargs.get("far_field", False)
         if evaluationName not in self.setup:
             self.setup[evaluationName] = PolarRadiation(minAngle, maxAngle, 
                                                          step, on_axis, direction,
-                                                         radius, offset)
+                                                         radius, offset, far_field)
         elif evaluationName in self.setup and "overwrite" in kwargs:
             self.setup.pop(evaluationName)
             self.setup[evaluationName] = PolarRadiation(minAngle, maxAngle, 
                                                          step, on_axis, direction,
-                                                         radius, offset)
+                                                         radius, offset, far_field)
         else:
              print("evaluation {} already exists. You can overwrite it using  \
                    the 'overwrite' flag".format(evaluationName))   
@@ -131,12 +141,15 @@ class evaluations:
         
     def sphericalRadiation(self, evaluationName, nMic, 
                            radius, offset=[0, 0, 0], **kwargs):
+        far_field = kwargs.get("far_field", False)
         if evaluationName not in self.setup:
-            self.setup[evaluationName] = SphericalRadiation(nMic, radius, offset)
+            self.setup[evaluationName] = SphericalRadiation(nMic, radius, offset,
+                                                            far_field)
 
         elif evaluationName in self.setup and "overwrite" in kwargs:
             self.setup.pop(evaluationName)
-            self.setup[evaluationName] = SphericalRadiation(nMic, radius, offset)
+            self.setup[evaluationName] = SphericalRadiation(nMic, radius, offset,
+                                                            far_field)
 
         else:
              print("evaluation {} already exists. You can overwrite it using \
@@ -154,7 +167,29 @@ class evaluations:
              print("evaluation {} already exists. You can overwrite it using \
                    the 'overwrite' flag".format(evaluationName))  
     
-    def solve(self, evaluation_name="all"):
+    def solve(self, evaluation_name="all", max_memory=None, memmap=None):
+        """
+        Compute the pressure at the microphones of the given evaluations.
+
+        Parameters
+        ----------
+        evaluation_name : str or list, optional
+            Evaluations to compute. The default is "all" (evaluations not 
+            computed yet).
+        max_memory : float, optional
+            Memory budget (MB): microphones are evaluated in chunks that fit
+            the budget. The default is None (mic_memory parameter of the bem 
+            object).
+        memmap : str, optional
+            Directory where the pressure of individual speakers is written as
+            a memory-mapped .npy file, instead of being held in memory. The 
+            default is None (mic_memmap parameter of the bem object).
+
+        Returns
+        -------
+        None.
+
+        """
         if evaluation_name == "all":
             obs_to_compute = [] #list(self.setup.keys())
             for key in self.setup:
@@ -169,6 +204,21 @@ class evaluations:
         else:
             raise ValueError("evaluation_name should be a key in setup.")
         
+        # far-field evaluations: angular pattern computed once per frequency
+        for obs in list(obs_to_compute):
+            setup = self.setup[obs]
+            if getattr(setup, "far_field", False) is not False:
+                directions = (setup.xMic - np.array(setup.offset)) / setup.radius
+                _, setup.pMic = self.bemObject.getFarFieldPressure(directions,
+                                                                   setup.radius,
+                                                                   setup.offset,
+                                                                   individualSpeakers=True,
+                                                                   pattern=setup.far_field == "pattern")
+                setup.isComputed = True
+                obs_to_compute.remove(obs)
+        if len(obs_to_compute) == 0:
+            return None
+        
         # group microphones to compute in one step (faster for large numbers
         # of microphones)
         mic2compute = np.empty([0, 3])
@@ -179,8 +229,24 @@ class evaluations:
             if setup.isComputed is False:
                 mic2compute = np.concatenate((mic2compute, xMic))
         
+        if memmap is None:
+            memmap = self.bemObject.mic_memmap
+        out = None
+        if memmap is not None:
+            import tempfile
+            os.makedirs(memmap, exist_ok=True)
+            fd, path = tempfile.mkstemp(suffix=".npy", prefix="pMic_", dir=memmap)
+            os.close(fd)
+            self.memmap_files.append(path)
+            out = np.lib.format.open_memmap(path, mode="w+", dtype=complex,
+                                            shape=(len(self.frequency), 
+                                                   len(mic2compute),
+                                                   self.bemObject.Ns))
+        
         _, pMic = self.bemObject.getMicPressure(mic2compute, 
-                                                individualSpeakers=True)
+                                                individualSpeakers=True,
+                                                max_memory=max_memory,
+                                                out=out)
         
         # ungroup microphones and store within each setup
         current_index = 0
@@ -190,6 +256,30 @@ class evaluations:
             setup.pMic = pMic[:, current_index:current_index+nMic, :]
             setup.isComputed = True
             current_index += nMic
+        self.release_memmap()
+    
+    def release_memmap(self):
+        """
+        Remove the memory-mapped pressure files written by solve() that no 
+        evaluation uses anymore (evaluations solved again, overwritten or 
+        deleted). Files still mapped elsewhere (Windows) are removed on a 
+        later call.
+        """
+        used = []
+        for setup in self.setup.values():
+            filename = getattr(setup.pMic, "filename", None)
+            if filename is not None:
+                used.append(os.path.abspath(filename))
+        for path in list(self.memmap_files):
+            if os.path.abspath(path) in used:
+                continue
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+                self.memmap_files.remove(path)
+            except OSError:
+                pass
+        return None
 
     def plot_system(self):
         mesh = pyvista.read(self.bemObject.meshPath)
@@ -316,18 +406,8 @@ class evaluations:
         else:
             element2plot = radiatingElement
         
-        if processing is not None:
-            elementCoeff = np.ones([len(self.frequency), len(element2plot)], 
-                                   dtype=complex)
-            pp = processing
-            for name in pp.TF:
-                for idx, element in enumerate(element2plot):
-                    if element in pp.TF[name]["radiatingElement"]:
-                        elementCoeff[:, idx] *= pp.TF[name]["H"]
-                        
-        else:
-            elementCoeff = np.ones([len(self.frequency), len(element2plot)], 
-                                   dtype=complex)
+        elementCoeff = get_element_coefficients(processing, element2plot, 
+                                                len(self.frequency))
         
         # Sort evaluations by type -> this could def be better, but it works sooo...
         polar, polarName = [], []
@@ -429,8 +509,8 @@ def getPressure(pmic, radiatingElement, element2plot, coefficients):
 
     Parameters
     ----------
-    pmic : numpy array
-        pressure returned by one evaluation.
+    pmic : numpy array or list of numpy array
+        pressure returned by one evaluation. Shape: (nFreq, nMic, nRad)
     radiatingElement : list of int
         radiatingElement of the BEM object. Used to associate pMic to the 
         correct coefficients
@@ -438,31 +518,21 @@ def getPressure(pmic, radiatingElement, element2plot, coefficients):
         specific radiating element to plot.
     coefficients : numpy array
         coefficients to apply to corresponding radiating surfaces.
+        Shape: (nFreq, len(element2plot))
 
     Returns
     -------
-    pmic_out : TYPE
-        DESCRIPTION.
+    pmic_out : numpy array or list of numpy array
+        weighted sum of the pressure of element2plot. Shape: (nFreq, nMic)
 
     """
+    # radiator weights are built once, then contracted over the radiator axis
+    lookup = get_radiator_lookup(radiatingElement)
+    weights = get_radiator_weights(lookup, len(lookup), element2plot, 
+                                   coefficients)
     if isinstance(pmic, list):
-        pmic_out = []
-        for p in range(len(pmic)):
-            nFreq, nMic, nRad = pmic[p].shape
-            pmic_tmp = np.zeros([nFreq, nMic], dtype=complex)
-            for i, e in enumerate(element2plot):
-                for mic in range(nMic):
-                    radE = np.argwhere(e == np.array(radiatingElement))[0][0]
-                    pmic_tmp[:, mic] += pmic[p][:, mic, radE] * coefficients[:, i]
-            pmic_out.append(pmic_tmp)
-    else:      
-        nFreq, nMic, nRad = pmic.shape
-        pmic_out = np.zeros([nFreq, nMic], dtype=complex)
-        for i, e in enumerate(element2plot):
-            for mic in range(nMic):
-                radE = np.argwhere(e == np.array(radiatingElement))[0][0]
-                pmic_out[:, mic] += pmic[:, mic, radE] * coefficients[:, i]
-    return pmic_out
+        return [np.einsum("fmr,fr->fm", p, weights) for p in pmic]
+    return np.einsum("fmr,fr->fm", pmic, weights)
             
 
 #%% Evaluation classes
@@ -473,7 +543,8 @@ class PolarRadiation:
                  on_axis: str,
                  direction: str,
                  radius: float = 5,
-                 offset: list = [0, 0, 0]):
+                 offset: list = [0, 0, 0],
+                 far_field=False):
         self.minAngle = minAngle
         self.maxAngle = maxAngle
         self.step = step
@@ -481,6 +552,7 @@ class PolarRadiation:
         self.direction = direction
         self.radius = radius
         self.offset = offset
+        self.far_field = far_field
         
         from electroacPy.general.geometry import create_circular_array
         self.theta = np.arange(minAngle, maxAngle+step, step)
@@ -575,9 +647,10 @@ class BoundingBox:
         
         
 class SphericalRadiation:
-    def __init__(self, nMic, radius, offset):
+    def __init__(self, nMic, radius, offset, far_field=False):
         self.radius = radius
         self.offset = offset
+        self.far_field = far_field
         
         from electroacPy.general.geometry import create_spherical_array
         self.xMic = create_spherical_array(nMic, radius, offset)
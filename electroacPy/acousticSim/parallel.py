@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Frequency-parallel evaluation of BEM studies.
+
+Frequencies are independent from each other: they are spread across the
+bempp process pool (bempp.api.utils.pool). Each worker receives a copy of the
+simulation grid and builds its own function spaces once per study; the
+results are written in the shared memory buffer of the pool at the index of
+their frequency, so that the output does not depend on the number of workers.
+
+@author: tom
+"""
+import uuid
+import numpy as np
+from bempp.api.utils import pool
+
+# default size of the shared memory buffer (MB) when the pool is created here
+MAX_BUFFER_SIZE = 1024
+MIN_BUFFER_SIZE = 100
+
+
+def get_pool(n_workers, nbytes):
+    """
+    Return the number of workers and buffer size (bytes) of the process pool.
+    The pool is created if it is not initialised yet.
+
+    Parameters
+    ----------
+    n_workers : int
+        Requested number of workers.
+    nbytes : int
+        Size of the results to hold in the shared buffer.
+
+    Returns
+    -------
+    nworkers : int
+        Number of workers of the pool.
+    buffer_size : int
+        Size of the shared buffer in bytes.
+
+    """
+    if not pool.is_initialised():
+        size = int(np.ceil(nbytes / 1024**2))
+        size = min(max(size, MIN_BUFFER_SIZE), MAX_BUFFER_SIZE)
+        pool.create_pool(n_workers, buffer_size=size)
+    return pool.number_of_workers(), len(pool._BUFFER)
+
+
+def scatter_study(bemObj):
+    """
+    Copy the study context (grid and function spaces) on every worker. The
+    context is only copied once per bem object.
+
+    Parameters
+    ----------
+    bemObj : bem object
+        Study to copy.
+
+    Returns
+    -------
+    key : str
+        Key of the study context on the workers.
+
+    """
+    if bemObj.poolKey is not None:
+        return bemObj.poolKey
+
+    grid = bemObj.grid_sim
+    array_proxies = pool.to_buffer(grid.vertices, grid.elements,
+                                   grid.domain_indices)
+    key = "electroacPy_" + str(uuid.uuid4())
+    segments = [int(e) for e in bemObj.radiatingElement]
+    options = {"recycle_dim": bemObj.recycle_dim, 
+               "wideband": bemObj.wideband,
+               "wideband_tol": bemObj.wideband_tol,
+               "planes": bemObj.planes,
+               "assembler": bemObj.assembler,
+               "fmm_parameters": bemObj.fmm_parameters,
+               "hmat_parameters": bemObj.hmat_parameters,
+               "formulation": bemObj.formulation,
+               "coupling": bemObj.coupling,
+               "solver_precision": bemObj.solver_precision}
+    pool.execute(_init_study_worker, key, grid.id, array_proxies, segments,
+                 options)
+    bemObj.poolKey = key
+    return key
+
+
+def release_study(bemObj):
+    """Remove the study context from the workers."""
+    if bemObj.poolKey is not None and pool.is_initialised():
+        pool.remove_key(bemObj.poolKey)
+    bemObj.poolKey = None
+    return None
+
+
+def solve(bemObj, k, omega, domain_operator, indices=None, callback=None):
+    """
+    Solve the BEM system at the given frequencies using the process pool.
+
+    Parameters
+    ----------
+    bemObj : bem object
+        Study to solve.
+    k : numpy array
+        Wavenumbers.
+    omega : numpy array
+        Angular frequencies.
+    domain_operator : int
+        -1 for exterior, +1 for interior problems.
+    indices : list of int, optional
+        Frequency indices to solve. The default is None (all frequencies).
+    callback : callable, optional
+        Called as callback(i, p_total, (iterations, residual)) for each 
+        frequency index i as soon as its batch is solved.
+
+    Returns
+    -------
+    p_total : numpy array
+        Pressure coefficients of each radiator on spaceP.
+        Shape: (len(indices), nDOF, Ns)
+    iterations : numpy array
+        Iterations of each radiator. Shape: (len(indices), Ns)
+    residual : numpy array
+        Relative residual of each radiator (nan for iterative solvers). 
+        Shape: (len(indices), Ns)
+
+    """
+    if indices is None:
+        indices = list(range(len(k)))
+    Nfft = len(indices)
+    nDOF = bemObj.spaceP.global_dof_count
+    shape = (nDOF, bemObj.Ns)
+
+    def args(j):
+        i = indices[j]
+        return (k[i], omega[i], bemObj.get_velocity_block(i), bemObj.rho_0,
+                domain_operator, bemObj.solver, bemObj.tol)
+    
+    on_batch = None
+    if callback is not None:
+        def on_batch(batch, result, info):
+            for j in batch:
+                callback(indices[j], result[j], info[j])
+
+    # frequency continuation and wideband interpolation need neighbouring 
+    # frequencies on each worker
+    contiguous = bemObj.solver == "recycle" or bemObj.wideband is True
+    p_total, info = _run(bemObj, _solve_worker, args, Nfft, shape, contiguous,
+                         on_batch)
+    iterations = np.array([it for it, _ in info], dtype=int)
+    residual = np.array([res for _, res in info], dtype=float)
+    return p_total, iterations, residual
+
+
+def mic_pressure(bemObj, micPosition, k, omega):
+    """
+    Compute the pressure of each radiator at microphones, at all frequencies,
+    using the process pool.
+
+    Parameters
+    ----------
+    bemObj : bem object
+        Solved study.
+    micPosition : numpy array
+        Microphones positions. Shape: (3, nMic)
+    k : numpy array
+        Wavenumbers.
+    omega : numpy array
+        Angular frequencies.
+
+    Returns
+    -------
+    pressure_mic : numpy array
+        Pressure at microphones. Shape: (nFreq, nMic, Ns)
+
+    """
+    Nfft = len(k)
+    shape = (micPosition.shape[1], bemObj.Ns)
+
+    # microphones are sent once to each worker, not with every frequency
+    get_pool(bemObj.n_workers, Nfft * int(np.prod(shape)) * 
+             np.dtype(np.complex128).itemsize)
+    key = scatter_study(bemObj)
+    pool.execute(_set_context_worker, key, "micPosition", micPosition)
+
+    def args(i):
+        return (k[i], omega[i], bemObj.rho_0,
+                bemObj.get_pressure_block(i), bemObj.get_velocity_block(i))
+
+    try:
+        pressure_mic, _ = _run(bemObj, _mic_pressure_worker, args, Nfft, shape)
+    finally:
+        pool.execute(_set_context_worker, key, "micPosition", None)
+    return pressure_mic
+
+
+def _run(bemObj, worker_fun, args, Nfft, shape, contiguous=False, 
+         on_batch=None):
+    """
+    Distribute the frequencies across workers and gather the results in
+    frequency order. Frequencies are processed in batches that fit in the
+    shared buffer. Frequencies are dealt round-robin, or in contiguous blocks
+    if contiguous is True.
+
+    Worker functions write their results in the shared buffer and return a
+    list of (slot, info) tuples, gathered in the returned info list. If given,
+    on_batch(indices, result, info) is called after each batch.
+    """
+    from tqdm import tqdm
+
+    itemsize = np.dtype(np.complex128).itemsize
+    freq_bytes = int(np.prod(shape)) * itemsize
+    nworkers, buffer_size = get_pool(bemObj.n_workers, Nfft * freq_bytes)
+    key = scatter_study(bemObj)
+
+    nBatch = buffer_size // freq_bytes
+    if nBatch == 0:
+        raise MemoryError("Shared buffer of the pool ({} MB) too small for a "
+                          "single frequency ({} MB).".format(buffer_size / 1024**2,
+                                                             freq_bytes / 1024**2))
+    if bemObj.checkpoint is not None:
+        # keep batches short so that solutions reach the disk early
+        nBatch = min(nBatch, nworkers)
+
+    result = np.zeros([Nfft, *shape], dtype=complex)
+    info = [None] * Nfft
+    for start in tqdm(range(0, Nfft, nBatch)):
+        indices = np.arange(start, min(start + nBatch, Nfft))
+        if contiguous:
+            slots_list = np.array_split(np.arange(len(indices)), nworkers)
+        else:
+            slots_list = [np.arange(len(indices))[w::nworkers] 
+                          for w in range(nworkers)]
+        jobs = []
+        for slots in slots_list:  # one job per worker
+            jobs.append((key, slots, shape,
+                         [args(indices[s]) for s in slots]))
+        for worker_info in pool.starmap(worker_fun, jobs):
+            for s, value in worker_info:
+                info[indices[s]] = value
+        buffer = pool.as_array(np.complex128, 0, (len(indices), *shape))
+        result[indices] = buffer
+        if on_batch is not None:
+            on_batch(indices, result, info)
+    return result, info
+
+
+#%% worker functions
+def _init_study_worker(key, grid_id, array_proxies, segments, options):
+    """Build the grid and function spaces of a study on the worker."""
+    import numba
+    import bempp.api
+    from bempp.api.grid.grid import Grid
+    from bempp.api.operators.boundary import sparse
+
+    vertices, elements, domain_indices = pool.from_buffer(array_proxies)
+    if pool.has_key(grid_id):  # grid already on worker
+        grid = pool.get_data(grid_id)
+    else:
+        grid = Grid(vertices.copy(), elements.copy(), domain_indices.copy(),
+                    grid_id)
+        pool.insert_data(grid_id, grid)
+
+    from electroacPy.acousticSim.bem import get_assembly_parameters
+    
+    spaceP = bempp.api.function_space(grid, "P", 1)
+    identity = sparse.identity(spaceP, spaceP, spaceP)
+    spaceU = [bempp.api.function_space(grid, "DP", 0, segments=[s])
+              for s in segments]
+    spaceU_all = bempp.api.function_space(grid, "DP", 0,
+                                          segments=[int(e) for e in np.unique(segments)])
+    pool.insert_data(key, {"spaceP": spaceP, "identity": identity,
+                           "spaceU": spaceU, "spaceU_all": spaceU_all,
+                           "parameters": get_assembly_parameters(options["assembler"],
+                                                                 options["fmm_parameters"],
+                                                                 options["hmat_parameters"]),
+                           **options})
+
+    # share the cores between workers
+    numba.set_num_threads(max(1, numba.config.NUMBA_NUM_THREADS //
+                              pool.nworkers()))
+    return None
+
+
+def _set_context_worker(key, name, value):
+    """Set an entry of the study context on the worker."""
+    pool.get_data(key)[name] = value
+    return None
+
+
+def _solve_worker(key, slots, shape, args):
+    """Solve the frequencies assigned to the worker."""
+    from electroacPy.acousticSim.bem import solve_frequency, wideband_operators
+    from bempp.api.linalg import FrequencyContinuationSolver
+
+    ctx = pool.get_data(key)
+    buffer = pool.as_array(np.complex128, 0, (np.max(slots, initial=-1) + 1,
+                                               *shape))
+    info = []
+    continuation = None
+    wideband = None
+    if ctx["wideband"] is True and len(args) > 0:
+        # interpolate over the frequencies of this worker only
+        wideband = wideband_operators(ctx["spaceP"], ctx["spaceU_all"],
+                                      np.array([arg[0] for arg in args]),
+                                      ctx["wideband_tol"], ctx["planes"])
+    for s, (k, omega, u_block, rho_0, domain_operator, solver, tol) in zip(slots, args):
+        if solver == "recycle" and continuation is None:
+            continuation = FrequencyContinuationSolver(tol=tol, 
+                                                       recycle=ctx["recycle_dim"],
+                                                       restart=ctx["recycle_dim"] + 20)
+        buffer[s], iterations, residual = solve_frequency(ctx["spaceP"], 
+                                                          ctx["identity"],
+                                                          ctx["spaceU_all"], 
+                                                          u_block, k, omega, 
+                                                          rho_0, domain_operator,
+                                                          solver, tol, 
+                                                          continuation, wideband, 
+                                                          ctx["planes"],
+                                                          ctx["assembler"], 
+                                                          ctx["parameters"],
+                                                          ctx["formulation"],
+                                                          ctx["coupling"],
+                                                          ctx["solver_precision"])
+        _clear_assembly_cache(ctx)
+        info.append((s, (iterations, residual)))
+    return info
+
+
+def _mic_pressure_worker(key, slots, shape, args):
+    """Compute the microphone pressure at the frequencies assigned to the worker."""
+    from electroacPy.acousticSim.bem import mic_pressure_frequency
+
+    ctx = pool.get_data(key)
+    buffer = pool.as_array(np.complex128, 0, (np.max(slots, initial=-1) + 1,
+                                               *shape))
+    for s, (k, omega, rho_0, p_total, u_block) in zip(slots, args):
+        buffer[s] = mic_pressure_frequency(ctx["spaceP"], ctx["spaceU_all"],
+                                           ctx["micPosition"], k, omega, rho_0,
+                                           p_total, u_block,
+                                           ctx["planes"], ctx["assembler"],
+                                           ctx["parameters"])
+        _clear_assembly_cache(ctx)
+    return [(s, None) for s in slots]
+
+
+def _clear_assembly_cache(ctx):
+    """Remove the FMM interfaces of the last frequency."""
+    if ctx["assembler"] == "fmm":
+        import bempp.api
+        bempp.api.clear_fmm_cache()
+    return None
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-frequency instrumentation of BEM studies.
+
+The profiler listens to the bempp logger while a frequency is solved or
+evaluated: bempp timers (bempp.api.Timer) report the time spent in the
+regular and singular parts of the assembly, GMRES reports its residual at
+each iteration. Timers are counted exclusively (time of nested timers is
+removed from their parent), so that stages do not overlap.
+
+Peak memory is measured with tracemalloc, which follows numpy allocations
+(dense matrices, LU factors, Krylov bases) but not the internal buffers of
+numba or OpenCL.
+
+@author: tom
+"""
+import json
+import logging
+import tracemalloc
+from contextlib import contextmanager
+import numpy as np
+import bempp.api
+
+# bempp timers counted in each assembly column (message before the first ":")
+REGULAR_OPERATIONS = ["Regular assembler", "H-matrix assembler",
+                      "Wideband operator construction", "Initialising Exafmm",
+                      "Evaluating Fmm", "Calling ExaFMM"]
+SINGULAR_OPERATIONS = ["Singular assembler", "Singular Corrections Evaluator"]
+
+# columns of the profiling table
+COLUMNS = ["frequency", "assembly_regular", "assembly_singular", "solve",
+           "iterations", "residual", "evaluation", "peak_memory"]
+
+
+class Profiler:
+    def __init__(self, frequency, memory=True):
+        """
+        Collect per-frequency timings, iterations, residuals and memory of a
+        bem study.
+
+        Parameters
+        ----------
+        frequency : numpy array
+            Frequencies of the study.
+        memory : bool, optional
+            Measure the peak memory of each frequency with tracemalloc (slows
+            down python allocations). The default is True.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.frequency = np.asarray(frequency, dtype=float)
+        self.memory = memory
+        self.rows = {}
+
+    def row(self, i):
+        """Return the record of frequency index i, created if needed."""
+        if i not in self.rows:
+            self.rows[i] = {"frequency": float(self.frequency[i]),
+                            "assembly_regular": 0., "assembly_singular": 0.,
+                            "solve": np.nan, "iterations": None,
+                            "residual": np.nan, "evaluation": np.nan,
+                            "peak_memory": np.nan, "residual_history": []}
+        return self.rows[i]
+
+    @contextmanager
+    def record(self, stage, i):
+        """
+        Record the "solve" or "evaluation" stage of frequency index i. Time
+        spent in bempp assembly timers is counted in the assembly columns,
+        the rest in the column of the stage. Several records of the same
+        stage add up (e.g. microphone chunks).
+        """
+        row = self.row(i)
+        handler = _RecordHandler()
+        level = bempp.api.LOGGER.level
+        bempp.api.LOGGER.setLevel(min(level, bempp.api.LOG_LEVEL["timing"]))
+        bempp.api.LOGGER.addHandler(handler)
+        tracing = False
+        if self.memory:
+            tracing = not tracemalloc.is_tracing()
+            if tracing:
+                tracemalloc.start()
+            elif hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        with bempp.api.Timer(enable_log=False) as timer:
+            try:
+                yield row
+            finally:
+                bempp.api.LOGGER.removeHandler(handler)
+                bempp.api.LOGGER.setLevel(level)
+
+        assembly = 0
+        for operation, interval in handler.intervals.items():
+            if operation in REGULAR_OPERATIONS:
+                row["assembly_regular"] += interval
+                assembly += interval
+            elif operation in SINGULAR_OPERATIONS:
+                row["assembly_singular"] += interval
+                assembly += interval
+        row[stage] = np.nansum([row[stage], timer.interval - assembly])
+        row["residual_history"].extend(handler.residuals)
+        if self.memory:
+            peak = (tracemalloc.get_traced_memory()[1] - start_memory) / 1024**2
+            row["peak_memory"] = np.nanmax([row["peak_memory"], peak])
+            if tracing:
+                tracemalloc.stop()
+
+    def set_solution(self, indices, iterations, error):
+        """
+        Store the iterations (sum over radiators) and relative residual
+        (maximum over radiators) of the given frequency indices.
+        """
+        for i in indices:
+            row = self.row(i)
+            row["iterations"] = int(np.sum(iterations[i]))
+            if not np.all(np.isnan(error[i])):
+                row["residual"] = float(np.nanmax(error[i]))
+        return None
+
+    def table(self):
+        """
+        Return the profiling table (pandas DataFrame), one row per recorded
+        frequency index. Times in s, peak memory in MB.
+        """
+        import pandas as pd
+
+        indices = sorted(self.rows)
+        data = [[self.rows[i][c] for c in COLUMNS + ["residual_history"]]
+                for i in indices]
+        return pd.DataFrame(data, index=pd.Index(indices, name="index"),
+                            columns=COLUMNS + ["residual_history"])
+
+    def summary(self):
+        """Print the total time of each stage."""
+        table = self.table()
+        print("Profiling of {} frequencies".format(len(table)))
+        for column in ["assembly_regular", "assembly_singular", "solve",
+                       "evaluation"]:
+            print("  {:<18} {:10.3f} s".format(column, np.nansum(table[column])))
+        if self.memory and len(table) > 0:
+            print("  {:<18} {:10.1f} MB".format("peak_memory",
+                                                np.nanmax(table["peak_memory"])))
+        return None
+
+    def to_json(self, path):
+        """Export the table, residual histories included, to a .json file."""
+        out = []
+        for i in sorted(self.rows):
+            row = {"index": int(i)}
+            for key, value in self.rows[i].items():
+                if isinstance(value, list):
+                    value = [float(v) for v in value]
+                elif value is not None and np.isnan(value):
+                    value = None
+                row[key] = value
+            out.append(row)
+        with open(path, "w") as f:
+            json.dump(out, f, indent=2)
+        return None
+
+    def to_csv(self, path):
+        """Export the table to a .csv file (without residual histories)."""
+        self.table()[COLUMNS].to_csv(path)
+        return None
+
+
+class _RecordHandler(logging.Handler):
+    """Gather bempp timer intervals and GMRES residuals from log records."""
+
+    def __init__(self):
+        super().__init__(level=logging.NOTSET)
+        self.intervals = {}
+        self.residuals = []
+        self._stack = []
+
+    def emit(self, record):
+        if hasattr(record, "residual"):
+            self.residuals.append(float(record.residual))
+        if not hasattr(record, "operation"):
+            return None
+        if record.interval is None:  # timer started
+            self._stack.append(0.)
+            return None
+        nested = self._stack.pop() if len(self._stack) > 0 else 0.
+        if len(self._stack) > 0:
+            self._stack[-1] += record.interval
+        operation = record.operation.split(":")[0].rstrip(".")
+        self.intervals[operation] = (self.intervals.get(operation, 0.) +
+                                     record.interval - nested)
+        return None
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+On-disk storage of BEM surface solutions.
+
+Each solved frequency is stored as a single chunk (.npy file of shape
+(nDOF, Ns)) named after a content hash of everything the solution depends
+on: mesh, radiating elements, velocity, boundary conditions, medium, solver
+settings and frequency. Identical frequencies are then found again whatever
+the study they belong to.
+
+@author: tom
+"""
+import os
+import hashlib
+import numpy as np
+
+# default location of the result cache
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache",
+                                 "electroacPy", "bem")
+
+
+class ResultStore:
+    def __init__(self, directory, max_size=None):
+        """
+        Directory of per-frequency solution chunks, indexed by key.
+
+        Parameters
+        ----------
+        directory : str
+            Path of the store. Created if it does not exist.
+        max_size : float, optional
+            Maximum size of the store in MB. When exceeded, least recently
+            used chunks are removed. The default is None (no limit).
+
+        Returns
+        -------
+        None.
+
+        """
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def has(self, key):
+        return os.path.isfile(self.path(key))
+
+    def get(self, key):
+        """
+        Return the chunk stored under key, None if it does not exist.
+        """
+        path = self.path(key)
+        try:
+            data = np.load(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None    # missing or partially written chunk
+        os.utime(path)     # mark as recently used
+        return data
+
+    def put(self, key, data):
+        """
+        Store data under key. The chunk is written to a temporary file and
+        renamed, so that an interrupted write never leaves a corrupted chunk.
+        """
+        path = self.path(key)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, data)
+        os.replace(tmp, path)
+        if self.max_size is not None:
+            self.evict()
+        return None
+
+    def size(self):
+        """Return the size of the store in MB."""
+        return sum(os.path.getsize(p) for _, p in self._chunks()) / 1024**2
+
+    def evict(self):
+        """Remove least recently used chunks until the store fits max_size."""
+        chunks = sorted(self._chunks())
+        total = sum(os.path.getsize(p) for _, p in chunks)
+        max_bytes = self.max_size * 1024**2
+        for _, p in chunks:
+            if total <= max_bytes:
+                break
+            total -= os.path.getsize(p)
+            os.remove(p)
+        return None
+
+    def clear(self):
+        """Remove every chunk of the store."""
+        for _, p in self._chunks():
+            os.remove(p)
+        return None
+
+    def _chunks(self):
+        """List (last use, path) of the chunks."""
+        out = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npy"):
+                p = os.path.join(self.directory, name)
+                out.append((os.path.getmtime(p), p))
+        return out
+
+
+#%% content hash
+def hash_study(bemObj):
+    """
+    Return the hash of the frequency-independent inputs of a bem study.
+
+    Parameters
+    ----------
+    bemObj : bem object
+        Study to hash.
+
+    Returns
+    -------
+    key : str
+        Hexadecimal digest.
+
+    """
+    h = hashlib.sha256()
+    with open(bemObj.meshPath, "rb") as f:
+        h.update(f.read())
+    if bemObj.assembler == "fmm":
+        assembly = [bemObj.assembler, bemObj.fmm_parameters]
+    elif bemObj.assembler == "hmat":
+        assembly = [bemObj.assembler, bemObj.hmat_parameters]
+    else:
+        assembly = None  # dense: keys of former caches stay valid
+    for item in [bemObj.radiatingElement, bemObj.boundary_conditions,
+                 bemObj.direction, bemObj.c_0, bemObj.rho_0, bemObj.domain,
+                 bemObj.tol, bemObj.solver, bemObj.image_source,
+                 bemObj.wideband, bemObj.wideband_tol]:
+        _update(h, item)
+    if assembly is not None:
+        _update(h, assembly)
+    if bemObj.formulation != "standard":
+        _update(h, [bemObj.formulation, bemObj.coupling])
+    if bemObj.solver_precision != "double":
+        _update(h, bemObj.solver_precision)
+    return h.hexdigest()
+
+
+def hash_frequency(study_key, frequency, velocity, admittance=None):
+    """
+    Return the hash of a single frequency of a study.
+
+    Parameters
+    ----------
+    study_key : str
+        Hash of the study (see hash_study).
+    frequency : float
+        Frequency.
+    velocity : numpy array
+        Velocity block of the radiators at this frequency.
+    admittance : numpy array, optional
+        Surface admittance at this frequency.
+
+    Returns
+    -------
+    key : str
+        Hexadecimal digest.
+
+    """
+    h = hashlib.sha256(study_key.encode())
+    for item in [float(frequency), velocity, admittance]:
+        _update(h, item)
+    return h.hexdigest()
+
+
+def _update(h, obj):
+    """Feed a (nested) python / numpy object to hash h."""
+    if isinstance(obj, dict):
+        h.update(b"dict")
+        for key in sorted(obj, key=str):
+            _update(h, str(key))
+            _update(h, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        h.update(b"list")
+        for item in obj:
+            _update(h, item)
+    elif isinstance(obj, np.ndarray):
+        h.update(str(obj.dtype).encode() + str(obj.shape).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    else:
+        h.update(repr(obj).encode())
+    return None
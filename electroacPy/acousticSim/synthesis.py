@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Re-synthesis of evaluation responses from BEM unit responses.
+
+BEM radiators are solved with a unit velocity: the pressure of an evaluation,
+pMic (nFreq, nMic, nRad), is a transfer tensor from radiator velocities to
+microphones. Driver, port and filter transfer functions only weight the
+radiators, so any new design is a single contraction of this tensor and no
+BEM computation is needed.
+
+@author: tom
+"""
+import numpy as np
+
+
+class synthesisEngine:
+    def __init__(self, pMic, radiatingElement):
+        """
+        Combine the unit responses of an evaluation with radiator weights.
+
+        Parameters
+        ----------
+        pMic : numpy array
+            Pressure of each radiator at the microphones, for unit velocity.
+            Shape: (nFreq, nMic, nRad)
+        radiatingElement : list of int
+            Radiating element of each radiator (last axis of pMic).
+
+        Returns
+        -------
+        None.
+
+        """
+        self.pMic = pMic
+        self.H = np.asarray(pMic)  # memory-mapped results are read once
+        self.nFreq, self.nMic, self.nRad = self.H.shape
+        self.radiatingElement = [int(e) for e in radiatingElement]
+        self.lookup = get_radiator_lookup(self.radiatingElement)
+
+    def radiator_index(self, element2plot):
+        """Return the radiator index (last axis of pMic) of each element."""
+        return get_radiator_index(self.lookup, element2plot)
+
+    def weights(self, element2plot, coefficients):
+        """
+        Return the weights of all radiators (nFreq, nRad) given the
+        coefficients (nFreq, len(element2plot)) of some elements. Other
+        radiators have a zero weight.
+        """
+        return get_radiator_weights(self.lookup, self.nRad, element2plot,
+                                    coefficients)
+
+    def response(self, element2plot, coefficients):
+        """
+        Return the pressure at the microphones (nFreq, nMic) of the elements
+        weighted by coefficients (nFreq, len(element2plot)).
+        """
+        C = self.weights(element2plot, coefficients)
+        return np.einsum("fmr,fr->fm", self.H, C)
+
+    def responses(self, weights):
+        """
+        Return the pressure at the microphones for a batch of radiator
+        weights.
+
+        Parameters
+        ----------
+        weights : numpy array
+            Weights of all radiators for each variant.
+            Shape: (nVariant, nFreq, nRad)
+
+        Returns
+        -------
+        pressure : numpy array
+            Shape: (nVariant, nFreq, nMic)
+
+        """
+        return np.einsum("fmr,vfr->vfm", self.H, weights, optimize=True)
+
+    def variants(self, element2plot, coefficients, H, elements):
+        """
+        Return the pressure at the microphones of design variants that change
+        the transfer function of some elements only (e.g. a crossover
+        filter or a port).
+
+        Parameters
+        ----------
+        element2plot : list of int
+            Elements of the reference design.
+        coefficients : numpy array
+            Coefficients of the reference design.
+            Shape: (nFreq, len(element2plot))
+        H : numpy array
+            Transfer function of each variant, multiplying the reference
+            coefficients of elements. Shape: (nVariant, nFreq)
+        elements : list of int
+            Elements affected by H.
+
+        Returns
+        -------
+        pressure : numpy array
+            Shape: (nVariant, nFreq, nMic)
+
+        Notes
+        -----
+        The response of the affected elements is computed once, variants
+        then cost one multiply-add per frequency and microphone.
+
+        """
+        C = self.weights(element2plot, coefficients)
+        selected = np.zeros(self.nRad, dtype=bool)
+        selected[self.radiator_index(elements)] = True
+        base = np.einsum("fmr,fr->fm", self.H, C)
+        part = np.einsum("fmr,fr->fm", self.H[:, :, selected], C[:, selected])
+        return base[None] + (np.asarray(H)[:, :, None] - 1) * part[None]
+
+
+def get_radiator_lookup(radiatingElement):
+    """Return the radiator index of each radiating element (dict)."""
+    return {int(e): j for j, e in enumerate(radiatingElement)}
+
+
+def get_radiator_index(lookup, element2plot):
+    """Return the radiator index of each element of element2plot."""
+    try:
+        return np.array([lookup[int(e)] for e in np.atleast_1d(element2plot)],
+                        dtype=int)
+    except KeyError as error:
+        raise ValueError("Radiating element {} not in study.".format(error))
+
+
+def get_radiator_weights(lookup, nRad, element2plot, coefficients):
+    """
+    Scatter the coefficients (nFreq, len(element2plot)) of some elements on
+    all radiators. Returns the weights (nFreq, nRad), zero for radiators not
+    in element2plot. Elements given twice add up.
+    """
+    coefficients = np.asarray(coefficients)
+    C = np.zeros([coefficients.shape[0], nRad], dtype=complex)
+    np.add.at(C.T, get_radiator_index(lookup, element2plot), coefficients.T)
+    return C
+
+
+def get_element_coefficients(processing, element2plot, nFreq,
+                             bypass_xover=False):
+    """
+    Return the product of the transfer functions of a postProcess object
+    applied on each element.
+
+    Parameters
+    ----------
+    processing : postProcess object or None
+        Transfer functions and the radiating elements they apply on.
+    element2plot : list of int
+        Elements.
+    nFreq : int
+        Number of frequencies.
+    bypass_xover : bool, optional
+        If True, filter stages ("filter_stage_" transfer functions) are not
+        applied. The default is False.
+
+    Returns
+    -------
+    elementCoeff : numpy array
+        Shape: (nFreq, len(element2plot))
+
+    """
+    elementCoeff = np.ones([nFreq, len(element2plot)], dtype=complex)
+    if processing is None:
+        return elementCoeff
+    element2plot = np.asarray(element2plot)
+    for name in processing.TF:
+        if bypass_xover is True and name[:12] == "filter_stage":
+            continue
+        mask = np.isin(element2plot, processing.TF[name]["radiatingElement"])
+        elementCoeff[:, mask] *= np.asarray(processing.TF[name]["H"])[:, None]
+    return elementCoeff
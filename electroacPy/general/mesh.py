@@ -26,26 +26,13 @@ class CAD:
 
         """
         
-        gmsh.initialize()
-        gmsh.option.setNumber("General.Terminal", 1)
-        gmsh.option.setNumber("Geometry.OCCScaling", scaling)
-        gmsh.option.setNumber("Mesh.Algorithm", meshAlgo)
-        gmsh.option.setNumber("Mesh.MeshSizeMin", minSize)
-        gmsh.option.setNumber("Mesh.MeshSizeMax", maxSize)
-        gmsh.option.setNumber("Mesh.Optimize", 1)
-        gmsh.option.setNumber("Mesh.QualityType", 2)
-        gmsh.option.setNumber("Mesh.MshFileVersion", 2.2)
-
-        gmsh.merge(file)
-        n = gmsh.model.getDimension()
-        s = gmsh.model.getEntities(n)
-        l = gmsh.model.geo.addSurfaceLoop([s[i][1] for i in range(len(s))])
+        load_geometry(file, minSize, maxSize, scaling, meshAlgo)
 
         self.file = file
         self.minSize  = minSize
         self.maxSize  = maxSize
         self.scaling  = scaling
-        self.meshAlgo = 6
+        self.meshAlgo = meshAlgo
         self.entities = gmsh.model.get_entities()
         self.surface_list = get_tags_by_dimension(self.entities, 2)
         # self.ungrouped_surface = copy(self.surface_list)
@@ -151,6 +138,46 @@ class CAD:
         gmsh.finalize()
         return None
 
+    def meshLadder(self, filename, factors, order=2, excludeRemaining=False, 
+                   reverseNormals=False):
+        """
+        Mesh the geometry several times, with the mesh size of every group
+        multiplied by each factor. Physical groups are the same in every mesh,
+        so that the meshes can be used as a mesh ladder of a BEM study 
+        (mesh_ladder argument).
+
+        Parameters
+        ----------
+        filename : str
+            Base name of the meshes. Each mesh is written to 
+            filename + "_x{factor}.msh".
+        factors : list of float
+            Mesh size factors, e.g. [2, 4, 8] for meshes 2, 4 and 8 times 
+            coarser.
+        order, excludeRemaining, reverseNormals :
+            See mesh().
+
+        Returns
+        -------
+        paths : list of str
+            Path of each mesh.
+
+        """
+        groups = self.physical_groups
+        paths = []
+        for factor in factors:
+            if gmsh.isInitialized():
+                gmsh.finalize()
+            load_geometry(self.file, self.minSize * factor, self.maxSize * factor,
+                          self.scaling, self.meshAlgo)
+            self.physical_groups = [dict(group, meshSize=group["meshSize"] * factor)
+                                    for group in groups]
+            name = filename + "_x{}".format(factor)
+            self.mesh(name, order, excludeRemaining, reverseNormals)
+            paths.append(name + ".msh")
+        self.physical_groups = groups
+        return paths
+
     def export2stl(self, fileName):
         gmsh.write(fileName + ".stl")
         return None
@@ -167,6 +194,24 @@ class CAD:
 
 
 # Useful function
+def load_geometry(file, minSize, maxSize, scaling, meshAlgo):
+    """Initialize gmsh with the mesh options and load the geometry file."""
+    gmsh.initialize()
+    gmsh.option.setNumber("General.Terminal", 1)
+    gmsh.option.setNumber("Geometry.OCCScaling", scaling)
+    gmsh.option.setNumber("Mesh.Algorithm", meshAlgo)
+    gmsh.option.setNumber("Mesh.MeshSizeMin", minSize)
+    gmsh.option.setNumber("Mesh.MeshSizeMax", maxSize)
+    gmsh.option.setNumber("Mesh.Optimize", 1)
+    gmsh.option.setNumber("Mesh.QualityType", 2)
+    gmsh.option.setNumber("Mesh.MshFileVersion", 2.2)
+
+    gmsh.merge(file)
+    n = gmsh.model.getDimension()
+    s = gmsh.model.getEntities(n)
+    gmsh.model.geo.addSurfaceLoop([s[i][1] for i in range(len(s))])
+    return None
+
 def get_tags_by_dimension(tag_list, target_dimension):
     tags = [tag for dim, tag in tag_list if dim == target_dimension]
     return tags
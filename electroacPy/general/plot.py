@@ -13,25 +13,25 @@ import pyvista
 
 #%% helper
 def sumPressureArray(bemObj, radiatingSurface, radiationCoeff=None):
-    p_mesh = bemObj.p_mesh
+    """
+    Return the surface pressure coefficients (nFreq, nDOF) of the given 
+    radiating surfaces, weighted by radiationCoeff (nFreq, nSurface).
+    """
+    from electroacPy.acousticSim.synthesis import (get_radiator_lookup, 
+                                                   get_radiator_weights)
     radSurf_system = bemObj.radiatingElement
     if isinstance(radiatingSurface, str):
         if radiatingSurface == 'all':
             radiatingSurface = radSurf_system
-    else:
-        radiatingSurface = np.array(radiatingSurface)
+    radiatingSurface = np.atleast_1d(radiatingSurface)
 
-    pressureCoeff = np.zeros([len(bemObj.frequency), 
-                              bemObj.spaceP.grid_dof_count], dtype='complex')
     if radiationCoeff is None:
         radiationCoeff = np.ones([len(bemObj.frequency), 
                                   len(radiatingSurface)], dtype=complex)
-    for f in range(len(bemObj.frequency)):
-        for j in range(len(radiatingSurface)):
-            ind_surface = np.argwhere(radSurf_system == radiatingSurface[j])[0][0]
-            pressureCoeff[f, :] += (p_mesh[f][ind_surface].coefficients * 
-                                    radiationCoeff[f, j])
-    return pressureCoeff
+    lookup = get_radiator_lookup(radSurf_system)
+    weights = get_radiator_weights(lookup, bemObj.Ns, radiatingSurface, 
+                                   radiationCoeff)
+    return np.einsum("frd,fr->fd", bemObj.p_mesh.coefficients, weights)
 
 
 # %%2D plots
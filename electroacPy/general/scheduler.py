@@ -0,0 +1,179 @@
+"""
+Dependency-aware task scheduler.
+
+Tasks are the nodes of a directed acyclic graph: a task runs once all its
+dependencies are done. Tasks are flagged dirty when their result is missing or
+out of date, and dirtiness propagates to every task depending on them, so that
+only the out-of-date part of the graph is computed again. Independent tasks
+run concurrently in a thread pool, within a global budget of CPU cores and
+memory.
+
+@author: tom
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class taskGraph:
+    def __init__(self):
+        """
+        Empty graph of tasks.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.task = {}
+        self.order = []     # insertion order, used to start tasks in a stable order
+
+    def add(self, name, fun, dependencies=[], dirty=True, cpu=1, memory=0,
+            exclusive=False):
+        """
+        Add a task to the graph.
+
+        Parameters
+        ----------
+        name : hashable
+            Name of the task.
+        fun : callable
+            Function called without argument to run the task.
+        dependencies : list, optional
+            Tasks to complete before this one. The default is [].
+        dirty : bool, optional
+            If True, the task has to run. The default is True.
+        cpu : int, optional
+            Number of cores used by the task. The default is 1.
+        memory : float, optional
+            Estimated peak memory of the task (MB). The default is 0.
+        exclusive : bool, optional
+            If True, the task never runs alongside another task (e.g. tasks
+            using the process pool of bempp). The default is False.
+
+        Returns
+        -------
+        None.
+
+        """
+        for dep in dependencies:
+            if dep not in self.task:
+                raise KeyError("Dependency '{}' of task '{}' not in graph.".format(dep, name))
+        if name not in self.task:
+            self.order.append(name)
+        self.task[name] = {"fun": fun, "dependencies": list(dependencies),
+                           "dirty": dirty, "cpu": max(1, int(cpu)),
+                           "memory": memory, "exclusive": exclusive}
+        return None
+
+    def dependents(self, name):
+        """Return all tasks depending (directly or not) on task name."""
+        out = []
+        stack = [name]
+        while len(stack) > 0:
+            current = stack.pop()
+            for other in self.order:
+                if current in self.task[other]["dependencies"] and other not in out:
+                    out.append(other)
+                    stack.append(other)
+        return out
+
+    def invalidate(self, name):
+        """Flag task name and all tasks depending on it as dirty."""
+        self.task[name]["dirty"] = True
+        for other in self.dependents(name):
+            self.task[other]["dirty"] = True
+        return None
+
+    def propagate(self):
+        """Flag as dirty all tasks depending on a dirty task."""
+        for name in self.order:
+            if self.task[name]["dirty"] is True:
+                self.invalidate(name)
+        return None
+
+    def pending(self):
+        """Return the dirty tasks, in insertion order."""
+        return [name for name in self.order if self.task[name]["dirty"] is True]
+
+    def run(self, n_workers=1, max_cpu=None, max_memory=None):
+        """
+        Run the dirty tasks. A task starts when its dependencies are done and
+        when the running tasks leave enough cores and memory for it. A task
+        larger than the budget runs alone.
+
+        Parameters
+        ----------
+        n_workers : int, optional
+            Maximum number of tasks running at the same time. The default is
+            1 (tasks run one after another, in insertion order).
+        max_cpu : int, optional
+            Cores shared by running tasks. The default is None (os.cpu_count()).
+        max_memory : float, optional
+            Memory shared by running tasks (MB). The default is None (no limit).
+
+        Returns
+        -------
+        done : list
+            Tasks run, in completion order.
+
+        Notes
+        -----
+        If a task raises an error, no new task starts; running tasks are
+        completed and the error is raised again. Failed tasks and their
+        dependents stay dirty.
+
+        """
+        self.propagate()
+        if max_cpu is None:
+            max_cpu = os.cpu_count() or 1
+        pending = self.pending()
+        done = []
+        running = {}
+        error = None
+
+        def ready(name):
+            return all(self.task[dep]["dirty"] is False
+                       for dep in self.task[name]["dependencies"])
+
+        def fits(name):
+            task = self.task[name]
+            if len(running) == 0:
+                return True
+            if len(running) >= n_workers or task["exclusive"] is True:
+                return False
+            if any(self.task[r]["exclusive"] is True for r in running.values()):
+                return False
+            cpu = sum(self.task[r]["cpu"] for r in running.values())
+            if cpu + task["cpu"] > max_cpu:
+                return False
+            if max_memory is not None:
+                memory = sum(self.task[r]["memory"] for r in running.values())
+                if memory + task["memory"] > max_memory:
+                    return False
+            return True
+
+        with ThreadPoolExecutor(max_workers=max(1, n_workers)) as executor:
+            while len(pending) > 0 or len(running) > 0:
+                if error is None:
+                    for name in list(pending):
+                        if ready(name) and fits(name):
+                            pending.remove(name)
+                            running[executor.submit(self.task[name]["fun"])] = name
+                if len(running) == 0:
+                    if error is None:
+                        raise RuntimeError("Tasks {} cannot run: cyclic "
+                                           "dependencies.".format(pending))
+                    break
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        if error is None:
+                            error = future.exception()
+                    else:
+                        self.task[name]["dirty"] = False
+                        done.append(name)
+        if error is not None:
+            raise error
+        return done
@@ -1,9 +1,31 @@
 """
 Save and Load projects
+
+Projects are saved in a folder: lumped element data in LEM.npz, meshes, and
+a store directory holding the acoustic studies and evaluations:
+
+    store/manifest.json          format version, studies and their metadata
+    store/acs_<study>/p_mesh.npy surface pressure (nFreq, Ns, nDOF)
+    store/acs_<study>/objects.pkl python inputs of the study (kwargs, velocity),
+                                 paths relative to the project
+    store/evs_<study>/setup.pkl  evaluations of the study (without results)
+    store/evs_<study>/<j>_pMic.npy, <j>_xMic.npy
+                                 pressure (nFreq, nMic, Ns) and microphones 
+                                 (nMic, 3) of the j-th evaluation
+
+Studies and evaluations are only rebuilt when they are first accessed (the 
+meshes and function spaces of a study when its solver data are first used), 
+and surface and microphone pressures are memory-mapped (copy-on-write): 
+frequencies are read from disk when requested, computed evaluations are not
+computed again. Projects saved as .npz archives (acs_<study>.npz)
+are still loaded.
 """
 import numpy as np
 import os
-from shutil import copy2
+import json
+import pickle
+from copy import copy
+from shutil import copy2, copytree
 from os.path import join
 from numpy import asanyarray as array
 from electroacPy import loudspeakerSystem
@@ -11,13 +33,29 @@ from electroacPy.acousticSim.bem import bem
 from electroacPy.acousticSim.evaluations import evaluations as evs
 import bempp.api
 
+# on-disk format of the project store
+STORE_FORMAT = "electroacPy-store"
+STORE_VERSION = 1
+
+# kwargs of bem studies holding directories of the machine running the study
+PATH_KWARGS = ["cache", "checkpoint", "mic_memmap"]
+
+
 def save(projectPath, loudspeakerSystem):
     """
     Save loudspeaker system simulation in project folder.
 
-    :param loudspeakerSystem:
-    :return:
-    *.npz archive
+    Parameters
+    ----------
+    projectPath : str
+        Path of the project folder. Created if it does not exist.
+    loudspeakerSystem : loudspeakerSystem object
+        System to save.
+
+    Returns
+    -------
+    None.
+
     """
 
     if not os.path.exists(projectPath):
@@ -39,42 +77,212 @@ def save(projectPath, loudspeakerSystem):
              c=sim.c,
              rho=sim.rho)
 
-    # Save evaluations / bem
+    # Save BEM studies and evaluations
+    store = join(projectPath, "store")
+    os.makedirs(store, exist_ok=True)
+    manifest = {"format": STORE_FORMAT, "version": STORE_VERSION, 
+                "studies": {}}
     for study in sim.acoustic_study:
-        if bool(sim.evaluation) is True:
-            obsTmp = sim.evaluation[study]
-            # pressureArrayObs, nMic = storePressureMicResults(obsTmp)
-            np.savez(join(projectPath, 'evs_{}'.format(study)),
-                     frequency            = obsTmp.frequency,
-                     setup                = obsTmp.setup,
-                     referenceStudy       = obsTmp.referenceStudy,)
+        if isinstance(sim.acoustic_study, lazyDict) and not sim.acoustic_study.is_loaded(study):
+            # not accessed since loading: copy from the source project
+            entry = copyStudy(sim.acoustic_study.sources[study], store, 
+                              projectPath, study)
         else:
+            entry = saveStudy(store, projectPath, study, 
+                              sim.acoustic_study[study])
+        
+        entry["evaluation"] = study in sim.evaluation
+        if entry["evaluation"] is False:
             pass
+        elif isinstance(sim.evaluation, lazyDict) and not sim.evaluation.is_loaded(study):
+            source = sim.evaluation.sources[study]
+            if os.path.abspath(source) != os.path.abspath(store):
+                copytree(join(source, "evs_{}".format(study)),
+                         join(store, "evs_{}".format(study)), dirs_exist_ok=True)
+            # entry of a study accessed since loading is rewritten: keep the
+            # description of the evaluation arrays
+            entry["evaluations"] = sim.acoustic_study.sources[study][1].get("evaluations", {})
+        else:
+            entry["evaluations"] = saveEvaluation(store, study, 
+                                                  sim.evaluation[study])
+        manifest["studies"][study] = entry
+    
+    tmp = join(store, "manifest.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, join(store, "manifest.json"))
+    return None
+
+
+def saveStudy(store, projectPath, name, study):
+    """
+    Write a bem study in the store. Returns its manifest entry.
+    """
+    directory = join(store, "acs_{}".format(name))
+    os.makedirs(directory, exist_ok=True)
+    mesh_filename = copyMesh(study.meshPath, projectPath)
+    
+    if study.isBuilt is False:
+        # solver data never used since loading: pressure as stored
+        pressure = study.storedPressure
+    else:
+        pressure = study.p_mesh.coefficients
+    arrays = {"p_mesh": writeArray(directory, "p_mesh", pressure)}
+    writeObject(directory, "objects", {"kwargs": saveKwargs(study.kwargs, 
+                                                            projectPath, name),
+                                       "velocity": study.velocity,
+                                       "LEM_enclosures": study.LEM_enclosures,
+                                       "radiator": study.radiator})
+    return {"mesh_filename": mesh_filename,
+            "radiatingElement": [int(e) for e in study.radiatingElement],
+            "domain": study.domain,
+            "isComputed": bool(study.isComputed),
+            "c_0": float(study.c_0),
+            "rho_0": float(study.rho_0),
+            "arrays": arrays}
+
+
+def copyMesh(meshPath, projectPath):
+    """
+    Copy a mesh file in the project folder, unless it is already there. 
+    Returns its file name.
+    """
+    mesh_filename = os.path.basename(meshPath)
+    if not os.path.exists(join(projectPath, mesh_filename)) or \
+            not os.path.samefile(meshPath, join(projectPath, mesh_filename)):
+        copy2(meshPath, projectPath)
+    return mesh_filename
+
+
+def saveKwargs(kwargs, projectPath, name):
+    """
+    Return the kwargs of a study with paths relative to the project: meshes
+    of the mesh ladder are copied in the project folder, directories (cache,
+    checkpoint, mic_memmap) outside of the project are not saved.
+    """
+    kwargs = dict(kwargs)
+    if kwargs.get("mesh_ladder") is not None:
+        kwargs["mesh_ladder"] = [copyMesh(path, projectPath) 
+                                 for path in kwargs["mesh_ladder"]]
+    for key in PATH_KWARGS:
+        if not isinstance(kwargs.get(key), str):
+            continue
+        try:
+            path = os.path.relpath(os.path.abspath(kwargs[key]), 
+                                   os.path.abspath(projectPath))
+        except ValueError:  # other drive (Windows)
+            path = os.pardir
+        if path.split(os.sep)[0] == os.pardir:
+            print("Study '{}': {} directory {} is outside of the project, "
+                  "not saved.".format(name, key, kwargs[key]))
+            del kwargs[key]
+        else:
+            kwargs[key] = path
+    return kwargs
+
+
+def loadKwargs(kwargs, pathToProject):
+    """
+    Return the kwargs of a study with the paths of saveKwargs joined to the
+    project folder (absolute paths of former projects are kept).
+    """
+    kwargs = dict(kwargs)
+    if kwargs.get("mesh_ladder") is not None:
+        kwargs["mesh_ladder"] = [join(pathToProject, path) 
+                                 for path in kwargs["mesh_ladder"]]
+    for key in PATH_KWARGS:
+        if isinstance(kwargs.get(key), str):
+            kwargs[key] = join(pathToProject, kwargs[key])
+    return kwargs
+
+
+def copyStudy(source, store, projectPath, name):
+    """
+    Copy a study of another store, without loading it. Returns its manifest 
+    entry.
+    """
+    source_store, entry = source
+    if os.path.abspath(source_store) != os.path.abspath(store):
+        copytree(join(source_store, "acs_{}".format(name)),
+                 join(store, "acs_{}".format(name)), dirs_exist_ok=True)
+        source_project = os.path.dirname(source_store)
+        ladder = readObject(join(source_store, "acs_{}".format(name)), 
+                            "objects")["kwargs"].get("mesh_ladder") or []
+        for filename in [entry["mesh_filename"]] + list(ladder):
+            if not os.path.exists(join(projectPath, os.path.basename(filename))):
+                copy2(join(source_project, filename), projectPath)
+    return dict(entry)
+
 
-        # BEM studies
-        studyTmp = sim.acoustic_study[study]
-        pressureArrayAcs = storePressureMeshResults(studyTmp)
-        copy2(studyTmp.meshPath, projectPath)
-        mesh_filename = os.path.basename(studyTmp.meshPath)
-        # EXTERIOR
-        np.savez(join(projectPath, 'acs_{}'.format(study)),
-                 meshPath             = studyTmp.meshPath,
-                 mesh_filename        = mesh_filename,
-                 radiatingElement     = studyTmp.radiatingElement,
-                 velocity             = array(studyTmp.velocity, dtype=object),
-                 isComputed           = studyTmp.isComputed,
-                 coeff_radSurf        = studyTmp.coeff_radSurf,
-                 vertices             = studyTmp.vertices,
-                 domain               = studyTmp.domain,
-                 kwargs               = studyTmp.kwargs,
-                 pressureArrayAcs     = pressureArrayAcs,
-                 LEM_enclosures       = studyTmp.LEM_enclosures,
-                 radiator             = studyTmp.radiator,
-                 c_0                  = studyTmp.c_0,
-                 rho_0                = studyTmp.rho_0
-                 )
+def saveEvaluation(store, name, evaluation):
+    """
+    Write the evaluations of a study in the store. Microphone pressures and
+    positions are written as arrays, the setups without them. Returns the 
+    manifest entry of each evaluation.
+    """
+    directory = join(store, "evs_{}".format(name))
+    os.makedirs(directory, exist_ok=True)
+    writeArray(directory, "frequency", np.asarray(evaluation.frequency))
+    setup = {}
+    entries = {}
+    for j, key in enumerate(evaluation.setup):
+        setup[key], entries[key] = storePressureMicResults(directory, j, 
+                                                           evaluation.setup[key])
+    writeObject(directory, "setup", {"setup": setup,
+                                     "referenceStudy": evaluation.referenceStudy})
+    return entries
+
+
+def writeArray(directory, name, data):
+    """
+    Write an array as .npy through a temporary file. Returns its description.
+
+    A file memory-mapped by a loaded project cannot be replaced on Windows: 
+    the array is then written under a new name (<name>.<n>.npy), given in 
+    the description. Former versions are removed once they are released.
+    """
+    data = np.asarray(data)
+    path = join(directory, name + ".npy")
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, data)
+    filename = name + ".npy"
+    try:
+        os.replace(path + ".tmp", path)
+    except PermissionError:
+        n = 1
+        while os.path.exists(join(directory, "{}.{}.npy".format(name, n))):
+            n += 1
+        filename = "{}.{}.npy".format(name, n)
+        os.replace(path + ".tmp", join(directory, filename))
+    
+    # remove former versions (still memory-mapped ones are kept)
+    for file in os.listdir(directory):
+        version = file[len(name) + 1:-4]
+        if file != filename and (file == name + ".npy" or 
+                                 (file.startswith(name + ".") and 
+                                  file.endswith(".npy") and version.isdigit())):
+            try:
+                os.remove(join(directory, file))
+            except OSError:
+                pass
+    return {"file": filename, "shape": list(data.shape), 
+            "dtype": str(data.dtype)}
+
+
+def writeObject(directory, name, obj):
+    """Pickle python objects that have no array representation."""
+    path = join(directory, name + ".pkl")
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(obj, f)
+    os.replace(path + ".tmp", path)
     return None
 
+
+def readObject(directory, name):
+    with open(join(directory, name + ".pkl"), "rb") as f:
+        return pickle.load(f)
+
+
 def load(pathToProject):
     """
     Load loudspeaker simulation project from directory path.
@@ -105,6 +313,126 @@ def load(pathToProject):
         LS.c   = 343
         LS.rho = 1.22
 
+    store = join(pathToProject, "store")
+    if not os.path.isfile(join(store, "manifest.json")):
+        return loadLegacy(LS, pathToProject)
+    
+    with open(join(store, "manifest.json")) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != STORE_FORMAT or manifest["version"] > STORE_VERSION:
+        raise ValueError("Project store format not supported: {} version {}.".format(
+            manifest.get("format"), manifest.get("version")))
+    
+    studies = {}
+    evaluations = {}
+    for study, entry in manifest["studies"].items():
+        studies[study] = (lambda study=study, entry=entry: 
+                          loadStudy(store, pathToProject, study, entry, LS.frequency))
+        if entry["evaluation"] is True:
+            evaluations[study] = (lambda study=study, entry=entry: 
+                                  loadEvaluation(store, study, LS.acoustic_study[study],
+                                                 entry.get("evaluations", {})))
+    LS.acoustic_study = lazyDict(studies, {s: (store, e) for s, e in manifest["studies"].items()})
+    LS.evaluation = lazyDict(evaluations, {s: store for s in evaluations})
+    return LS
+
+
+def loadStudy(store, pathToProject, name, entry, frequency):
+    """
+    Rebuild a bem study from the store. Its meshes and function spaces are 
+    only built when its solver data are first used (see bem.deferred), the 
+    surface pressure is memory-mapped.
+    """
+    directory = join(store, "acs_{}".format(name))
+    objects = readObject(directory, "objects")
+    physics_acs = bem.deferred(join(pathToProject, entry["mesh_filename"]),
+                               entry["radiatingElement"],
+                               objects["velocity"],
+                               frequency,
+                               domain=entry["domain"],
+                               c_0=entry["c_0"],
+                               rho_0=entry["rho_0"],
+                               **loadKwargs(objects["kwargs"], pathToProject))
+    physics_acs.isComputed     = entry["isComputed"]
+    physics_acs.LEM_enclosures = objects["LEM_enclosures"]
+    physics_acs.radiator       = objects["radiator"]
+    
+    # copy-on-write: solving again does not modify the file
+    physics_acs.storedPressure = np.load(join(directory, 
+                                              entry["arrays"]["p_mesh"]["file"]), 
+                                         mmap_mode="c")
+    return physics_acs
+
+
+def loadEvaluation(store, name, bemObject, entries):
+    """
+    Rebuild the evaluations of a study from the store. Computed microphone 
+    pressures are memory-mapped.
+    """
+    directory = join(store, "evs_{}".format(name))
+    data = readObject(directory, "setup")
+    physics_evs = evs(bemObject)
+    for key in entries:
+        loadPressureMicResults(directory, data["setup"][key], entries[key])
+    physics_evs.setup = data["setup"]
+    physics_evs.frequency = np.load(join(directory, "frequency.npy"))
+    physics_evs.referenceStudy = data["referenceStudy"]
+    return physics_evs
+
+
+class lazyDict(dict):
+    def __init__(self, loaders, sources=None):
+        """
+        Dictionary whose values are built by loaders (functions without 
+        arguments) when first accessed.
+
+        Parameters
+        ----------
+        loaders : dict
+            Loader of each key.
+        sources : dict, optional
+            Location of each key in the project store (used by save to copy
+            values that were never loaded).
+
+        Returns
+        -------
+        None.
+
+        """
+        super().__init__({key: None for key in loaders})
+        self.loaders = dict(loaders)
+        self.sources = {} if sources is None else dict(sources)
+    
+    def is_loaded(self, key):
+        return key not in self.loaders
+    
+    def __getitem__(self, key):
+        if key in self.loaders:
+            dict.__setitem__(self, key, self.loaders.pop(key)())
+        return dict.__getitem__(self, key)
+    
+    def __setitem__(self, key, value):
+        self.loaders.pop(key, None)
+        dict.__setitem__(self, key, value)
+    
+    def __delitem__(self, key):
+        self.loaders.pop(key, None)
+        dict.__delitem__(self, key)
+    
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+    
+    def values(self):
+        return [self[key] for key in self]
+    
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+
+def loadLegacy(LS, pathToProject):
+    """Load the studies and evaluations of a project saved as .npz archives."""
     # import studies and evaluations
     file_list  = os.listdir(pathToProject)
     acs_files  = [file for file in file_list if file.startswith('acs')]
@@ -159,69 +487,46 @@ def load(pathToProject):
     return LS
 
 
-def storePressureMicResults(evaluation):
-    obs = evaluation
-    nObs = len(obs.setup)
-    Nfft = len(obs.bemObject.frequency)  # number of frequency bins
-    nRad = obs.bemObject.Ns              # number of radiating surfaces
-    nMic = np.zeros(nObs)                # number of microphone for each radSurf
-    for i in range(nObs):
-        nMic[i] = obs.xMic[i].shape[0]
-    maxMic = int(np.max(nMic))
-
-    pressureMicrophone = np.zeros([nObs, Nfft, maxMic, nRad], dtype=complex)
-    for obsTmp in range(nObs):
-        for freq in range(Nfft):
-            for rad in range(nRad):
-                pressureMicrophone[obsTmp, freq, :int(nMic[obsTmp]), rad] = obs.pMicArray[obsTmp][freq, :, rad]
-    return pressureMicrophone, nMic
+def storePressureMicResults(directory, j, setup):
+    """
+    Write the microphone positions and pressure (if computed) of the j-th 
+    evaluation of a study. Returns a copy of the setup without them and its
+    manifest entry.
+    """
+    entry = {"type": setup.type, "nMic": int(setup.nMic), 
+             "isComputed": bool(setup.isComputed and setup.pMic is not None),
+             "arrays": {"xMic": writeArray(directory, "{}_xMic".format(j), 
+                                           setup.xMic)}}
+    if entry["isComputed"] is True:
+        entry["arrays"]["pMic"] = writeArray(directory, "{}_pMic".format(j), 
+                                             setup.pMic)
+    
+    setup = copy(setup)
+    setup.pMic = None
+    setup.xMic = None
+    return setup, entry
 
 def storePressureMeshResults(acoustic_study):
-    study = acoustic_study
-    Nfft = len(study.frequency)
-    nRad = study.Ns
-    nVert = study.vertices
-    nCoeff = study.spaceP.grid_dof_count
-    
-    # store pressure
-    pressureMesh = np.zeros([Nfft, nRad, nCoeff], dtype=complex)
-    for freq in range(Nfft):
-        for rad in range(nRad):
-            pressureMesh[freq, rad, :] = study.p_mesh[freq, rad].coefficients
-    return pressureMesh
+    # surface pressure is stored as a contiguous (Nfft, nRad, nCoeff) array
+    return acoustic_study.p_mesh.coefficients
 
 def loadPressureMeshResults(obj, pressureMesh):
-    Nfft  = np.shape(pressureMesh)[0]
-    nRad  = np.shape(pressureMesh)[1]
-    nVert = np.shape(pressureMesh)[2]
-
-    for f in range(Nfft):
-        for rs in range(nRad):
-            obj.p_mesh[f, rs] = bempp.api.GridFunction(obj.spaceP, coefficients=pressureMesh[f, rs, :])
-            dofCount = obj.spaceU_freq[rs].grid_dof_count
-            coeff_radSurf = np.ones(dofCount, dtype=complex) * obj.coeff_radSurf[f, rs, :dofCount]
-            spaceU = bempp.api.function_space(obj.grid_sim, "DP", 0,
-                                              segments=[obj.radiatingElement[rs]])
-            u_total = bempp.api.GridFunction(spaceU, coefficients=-coeff_radSurf)
-            obj.u_mesh[f, rs] = u_total
-
-        # print('SHAPE: ', np.sum(pressureMesh[f, :, :], 0).shape)
-        obj.p_total_mesh[f] = bempp.api.GridFunction(obj.spaceP,
-                                                     coefficients=np.sum(pressureMesh[f, :, :], 0))
-
+    # velocities and summed pressures are computed from p_mesh when requested
+    obj.p_mesh.coefficients[:] = pressureMesh
     return None
 
 
-def loadPressureMicResults(obj, pressureMic, nMic):
-    nObs   = np.shape(pressureMic)[0]
-    Nfft   = np.shape(pressureMic)[1]
-    maxMic = np.shape(pressureMic)[2]
-    nRad   = np.shape(pressureMic)[3]
-    pMic = []
-    pMicArray = []
-    for i in range(nObs):
-        pMicArray.append(pressureMic[i, :, :int(nMic[i]), :])
-        pMic.append(np.sum(pressureMic[i, :, :int(nMic[i]), :], 2))
-    obj.pMic = pMic
-    obj.pMicArray = pMicArray
+def loadPressureMicResults(directory, setup, entry):
+    """
+    Restore the microphone positions and pressure of an evaluation setup. The
+    pressure is memory-mapped (copy-on-write).
+    """
+    arrays = entry["arrays"]
+    setup.xMic = np.load(join(directory, arrays["xMic"]["file"]))
+    if entry["isComputed"] is True:
+        setup.pMic = np.load(join(directory, arrays["pMic"]["file"]), 
+                             mmap_mode="c")
+    else:
+        setup.pMic = None
+    setup.isComputed = entry["isComputed"]
     return None
@@ -14,8 +14,8 @@ Created on Tue Oct  3 16:03:02 2023
 # Exterior acoustic sim
 from electroacPy.acousticSim.bem import bem
 from electroacPy.acousticSim.evaluations import evaluations as evs_bem
-from electroacPy.acousticSim.evaluations import getPressure
 from electroacPy.acousticSim.postProcessing import postProcess as pp
+from electroacPy.acousticSim.synthesis import synthesisEngine, get_element_coefficients
 
 # Lumped element
 from electroacPy.speakerSim.electroAcousticDriver import electroAcousticDriver, loadLPM
@@ -29,8 +29,10 @@ from electroacPy.measurements.laserVibrometry import laserVibrometry as laser_v
 from electroacPy.global_ import air
 from electroacPy.general.freqop import freq_log10
 from electroacPy.general.gain import dB
+from electroacPy.general.scheduler import taskGraph
 
 # external libraries
+import warnings
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -55,6 +57,8 @@ class loudspeakerSystem:
         self.acoustic_study = {}
         self.evaluation     = {}
         self.results        = {}
+        self.synthesis      = {}    # re-synthesis engines of evaluations
+        self.exports        = {}    # exports written by run()
 
         # help
         self.radiator_id    = {}
@@ -350,7 +354,17 @@ class loudspeakerSystem:
                       vibrometry_points=vibrometry_points, **kwargs)
         physics.radiator = acoustic_radiator
         self.acoustic_study[name] = physics
-        self.evaluation[name] = evs_bem(physics)
+        evaluation = evs_bem(physics)
+        if name in self.evaluation:
+            # study redefined (e.g. new mesh): keep its evaluations, to be 
+            # computed again by run()
+            for setup in self.evaluation[name].setup.values():
+                setup.isComputed = False
+                setup.pMic = None
+            evaluation.setup = self.evaluation[name].setup
+            for key in [k for k in self.synthesis if k[0] == name]:
+                self.synthesis.pop(key)
+        self.evaluation[name] = evaluation
         self.evaluation[name].referenceStudy = name
         return None
 
@@ -366,12 +380,16 @@ class loudspeakerSystem:
                            on_axis: str,
                            direction: str,
                            radius: float = 5,
-                           offset: list = [0, 0, 0]):
+                           offset: list = [0, 0, 0],
+                           **kwargs):
         """
         Add a circular microphone array to given study.
 
         :param reference_study:
         :param evaluation_name:
+        :param far_field: if True, pressure is computed from the far-field 
+        pattern of the system ("pattern" for the pattern without distance and
+        phase term)
         :return:
         """
         if isinstance(reference_study, list):
@@ -383,7 +401,8 @@ class loudspeakerSystem:
                                                                     on_axis,
                                                                     direction,
                                                                     radius,
-                                                                    offset)
+                                                                    offset,
+                                                                    **kwargs)
         else:
             self.evaluation[reference_study].polarRadiation(evaluation_name,
                                                                 min_angle,
@@ -392,7 +411,8 @@ class loudspeakerSystem:
                                                                 on_axis,
                                                                 direction,
                                                                 radius,
-                                                                offset)
+                                                                offset,
+                                                                **kwargs)
         return None
 
     def evaluation_pressureField(self,
@@ -484,15 +504,18 @@ class loudspeakerSystem:
                                        evaluation_name: str,
                                        nMic: float,
                                        radius: float = 1.8,
-                                       offset: list = [0, 0, 0]):
+                                       offset: list = [0, 0, 0],
+                                       **kwargs):
 
         if isinstance(reference_study, list):
             for i in range(len(reference_study)):
                 self.evaluation[reference_study[i]].sphericalRadiation(evaluation_name,
-                                                                 nMic, radius, offset)
+                                                                 nMic, radius, offset,
+                                                                 **kwargs)
         else:
             self.evaluation[reference_study].sphericalRadiation(evaluation_name,
-                                                          nMic, radius, offset)
+                                                          nMic, radius, offset,
+                                                          **kwargs)
         return None
 
     
@@ -511,23 +534,108 @@ class loudspeakerSystem:
 
     ## ===================
     # %% run / plot / info
-    def run(self):
+    def run(self, resume=False, n_workers=1, max_memory=None, max_cpu=None):
         """
-        Run all defined studies
+        Run all defined studies, evaluations and exports that are not 
+        up-to-date.
 
-        """
+        Studies, evaluations and exports are tasks of a dependency graph: 
+        evaluations of a study run once the study is solved, exports once 
+        their evaluation is computed. A task runs if its results are missing
+        or if a task it depends on runs, so redefining one study (e.g. with a 
+        new mesh) only computes this study, its evaluations and exports again.
+
+        Parameters
+        ----------
+        resume : bool, optional
+            If True, BEM studies load the frequencies already saved in their
+            checkpoint store instead of solving them again. 
+            The default is False.
+        n_workers : int, optional
+            Maximum number of tasks running at the same time: independent 
+            studies, and evaluations of solved studies, run concurrently and 
+            share the cores. The default is 1 (one task after another).
+        max_memory : float, optional
+            Memory budget (MB) shared by running tasks, from the estimated 
+            peak memory of each task. The default is None (no limit).
+        max_cpu : int, optional
+            Cores shared by running tasks. A study or evaluation uses as many
+            cores as the processes of its study (n_workers of the study), 
+            exports use one. The default is None (all cores).
 
+        Returns
+        -------
+        None.
+
+        Notes
+        -----
+        Studies using the process pool (n_workers > 1 in the study) or 
+        profiling run alone. Concurrent tasks need a thread-safe numba 
+        threading layer (NUMBA_THREADING_LAYER set to "tbb" or "omp"), 
+        otherwise tasks run one after another. Numba assembly kernels hold 
+        the GIL: concurrent tasks mostly overlap the linear algebra of 
+        solvers and evaluations (numpy/scipy), not the assembly.
+
+        """
+        if n_workers > 1 and numba_thread_safe() is False:
+            warnings.warn("The numba threading layer is not thread-safe: "
+                          "tasks run one after another. Set "
+                          "NUMBA_THREADING_LAYER to 'tbb' or 'omp' to run "
+                          "them concurrently.")
+            n_workers = 1
+        
+        graph = taskGraph()
         for study in self.acoustic_study:
-            if self.acoustic_study[study].isComputed is False:
-                self.acoustic_study[study].solve()
-            else:
-                None
+            physics = self.acoustic_study[study]
+            dirty = physics.isComputed is False
+            # up-to-date studies loaded from a project are not built
+            graph.add(("study", study),
+                      lambda physics=physics: physics.solve(resume=resume),
+                      dirty=dirty,
+                      cpu=physics.n_workers,
+                      memory=get_study_memory(physics) if dirty else 0,
+                      exclusive=physics.n_workers > 1 or physics.profiler is not None)
             
         for obs in self.evaluation:
-            if bool(self.evaluation[obs].setup) is True:
-                self.evaluation[obs].solve()
-            else:
+            evaluation = self.evaluation[obs]
+            if bool(evaluation.setup) is False:
                 print("No evaluation to compute for study {}.".format(obs))
+                continue
+            if self.acoustic_study[obs].isComputed is False:
+                # evaluations of a study solved again are out-of-date
+                for setup in evaluation.setup.values():
+                    setup.isComputed = False
+            dirty = any(setup.isComputed is False 
+                        for setup in evaluation.setup.values())
+            graph.add(("evaluation", obs), 
+                      lambda obs=obs: self.solve_evaluation(obs),
+                      dependencies=[("study", obs)],
+                      dirty=dirty,
+                      cpu=evaluation.bemObject.n_workers,
+                      memory=get_evaluation_memory(evaluation) if dirty else 0,
+                      exclusive=(evaluation.bemObject.n_workers > 1 or 
+                                 evaluation.profiler is not None))
+        
+        for name, export in self.exports.items():
+            dependencies = [("evaluation", s) for s in export["studies"] 
+                            if ("evaluation", s) in graph.task]
+            graph.add(("export", name), 
+                      lambda export=export: self.write_export(export),
+                      dependencies=dependencies, 
+                      dirty=export["written"] is False)
+        
+        graph.run(n_workers=n_workers, max_cpu=max_cpu, max_memory=max_memory)
+        return None
+    
+    def solve_evaluation(self, study):
+        """
+        Compute the evaluations of study that are not computed. Evaluations of 
+        a study are computed together (one potential operator assembly per 
+        frequency).
+        """
+        self.evaluation[study].solve()
+        for key in [k for k in self.synthesis if k[0] == study]:
+            self.synthesis.pop(key)
         return None
 
     ## PLOT
@@ -661,33 +769,47 @@ class loudspeakerSystem:
             radiatingElement = [radiatingElement]
 
         _  = updateResults(self, studyName, bypass_xover)
+        elementCoeff = get_element_coefficients(self.results[studyName], 
+                                                radiatingElement, 
+                                                len(self.frequency), 
+                                                bypass_xover)
+        engine = self.get_synthesis(studyName, evaluationName)
+        return engine.response(radiatingElement, elementCoeff)
+    
+    def get_synthesis(self, studyName, evaluationName):
+        """
+        Return the re-synthesis engine of an evaluation: the pressure of each
+        radiator at the microphones, for unit velocity, combined with 
+        driver, port and filter transfer functions without BEM computation.
+        The engine is rebuilt when the evaluation is computed again.
+
+        Parameters
+        ----------
+        studyName : str
+            Study of the evaluation.
+        evaluationName : str
+            Evaluation.
+
+        Returns
+        -------
+        engine : synthesisEngine object
+            See electroacPy.acousticSim.synthesis.
+
+        """
         pmic = self.evaluation[studyName].setup[evaluationName].pMic
-        
-        if self.results[studyName] is not None:
-            elementCoeff = np.ones([len(self.frequency), len(radiatingElement)], 
-                                   dtype=complex)
-            pp = self.results[studyName]
-            for name in pp.TF:
-                if bypass_xover is False:
-                    for idx, element in enumerate(radiatingElement):
-                        if element in pp.TF[name]["radiatingElement"]:
-                            elementCoeff[:, idx] *= pp.TF[name]["H"]
-                elif bypass_xover is True and name[:12] != "filter_stage":
-                    for idx, element in enumerate(radiatingElement):
-                        if element in pp.TF[name]["radiatingElement"]:
-                            elementCoeff[:, idx] *= pp.TF[name]["H"]
-        else:
-            elementCoeff = np.ones([len(self.frequency), len(radiatingElement)], 
-                                   dtype=complex)
-        
-        out = getPressure(pmic, self.acoustic_study[studyName].radiatingElement,
-                                radiatingElement, elementCoeff)
-        return out
+        if pmic is None:
+            raise ValueError("Evaluation '{}' of study '{}' is not computed.".format(
+                evaluationName, studyName))
+        key = (studyName, evaluationName)
+        if key not in self.synthesis or self.synthesis[key].pMic is not pmic:
+            self.synthesis[key] = synthesisEngine(pmic, 
+                                                  self.acoustic_study[studyName].radiatingElement)
+        return self.synthesis[key]
     
     
     def export_directivity(self, folder_name, file_name,
                            study, evaluation, radiatingElement=[], 
-                           bypass_xover=False):
+                           bypass_xover=False, on_run=False):
         """
         Export directivity results.
 
@@ -703,6 +825,10 @@ class loudspeakerSystem:
             extract specific element.
         bypass_xover : bool, 
             if True, will export filtered response.
+        on_run : bool, optional
+            If True, the export is also written by run() each time the 
+            evaluation is computed again. If the evaluation is not computed 
+            yet, the export is only written by run(). The default is False.
 
         Returns
         -------
@@ -711,6 +837,16 @@ class loudspeakerSystem:
         """
         from electroacPy.general.acoustics import export_directivity
         
+        if on_run is True:
+            self.exports[(folder_name, file_name)] = {
+                "method": "export_directivity", "studies": [study], 
+                "args": (folder_name, file_name, study, evaluation, 
+                         radiatingElement, bypass_xover), 
+                "written": False}
+            if self.evaluation[study].setup[evaluation].isComputed is False:
+                return None
+            self.exports[(folder_name, file_name)]["written"] = True
+        
         pmic = self.get_pMic(study, evaluation, radiatingElement, bypass_xover)
         theta = self.evaluation[study].setup[evaluation].theta
         frequency = self.frequency
@@ -737,10 +873,61 @@ class loudspeakerSystem:
             self.enclosure[objName].exportZe(folder_name, file_name + ".txt")
         elif objName in self.driver:
             self.driver[objName].exportZe(folder_name, file_name + ".txt")
+    
+    def write_export(self, export):
+        """Write an export registered with on_run=True."""
+        getattr(self, export["method"])(*export["args"])
+        export["written"] = True
+        return None
 
         
         
 
+## task helpers
+def numba_thread_safe():
+    """
+    Return True if numba parallel kernels can be launched from several 
+    threads: tbb or omp threading layer (the workqueue layer aborts the 
+    interpreter on concurrent launches).
+    """
+    try:
+        import numba
+    except ImportError:
+        return True
+    try:
+        layer = numba.threading_layer()   # layer in use
+    except ValueError:                    # no parallel kernel launched yet
+        layer = numba.config.THREADING_LAYER
+    return layer in ["tbb", "omp", "safe", "threadsafe"]
+
+def get_study_memory(bemObj):
+    """
+    Estimated peak memory (MB) of solving a bem study: one dense operator 
+    and its factors (dense assembler only) and the pressure on the mesh.
+    """
+    nDOF = bemObj.spaceP.global_dof_count
+    nFreq = len(bemObj.frequency)
+    memory = nFreq * bemObj.Ns * nDOF * 16
+    if bemObj.assembler == "dense":
+        memory += 2 * nDOF**2 * 16
+    return memory / 1024**2
+
+def get_evaluation_memory(evaluation):
+    """
+    Estimated peak memory (MB) of computing the evaluations of a study that
+    are not computed: the pressure at microphones and the potential 
+    operators (limited by the mic_memory budget of the study, if given).
+    """
+    bemObj = evaluation.bemObject
+    nMic = sum(setup.nMic for setup in evaluation.setup.values() 
+               if setup.isComputed is False)
+    nDOF = bemObj.spaceP.global_dof_count
+    memory = len(bemObj.frequency) * nMic * bemObj.Ns * 16 / 1024**2
+    if bemObj.mic_memory is not None:
+        return memory + bemObj.mic_memory
+    return memory + 2 * nMic * nDOF * 16 / 1024**2
+
+
 def create_polarRadiation_dataframe(data_array, angle_array, freq_array):
     import pandas as pd
 
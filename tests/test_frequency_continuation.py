@@ -0,0 +1,64 @@
+"""Regression tests of the frequency continuation (GCRO-DR) solver."""
+import pytest
+
+np = pytest.importorskip("numpy")
+bempp = pytest.importorskip("bempp.api")
+
+
+def sphere_grid(level):
+    """
+    Regular sphere: octahedron refined level times (8 * 4**level elements).
+    Built inline, the grid data of bempp.api.shapes.regular_sphere is not
+    shipped.
+    """
+    vertices = [[1, 0, 0], [0, 1, 0], [-1, 0, 0], [0, -1, 0], [0, 0, 1], [0, 0, -1]]
+    elements = [[0, 1, 4], [1, 2, 4], [2, 3, 4], [3, 0, 4],
+                [1, 0, 5], [2, 1, 5], [3, 2, 5], [0, 3, 5]]
+    vertices = [np.array(v, dtype="float64") for v in vertices]
+    for _ in range(level):
+        midpoints = {}
+
+        def midpoint(a, b):
+            key = (min(a, b), max(a, b))
+            if key not in midpoints:
+                point = vertices[a] + vertices[b]
+                vertices.append(point / np.linalg.norm(point))
+                midpoints[key] = len(vertices) - 1
+            return midpoints[key]
+
+        refined = []
+        for a, b, c in elements:
+            ab, bc, ca = midpoint(a, b), midpoint(b, c), midpoint(c, a)
+            refined += [[a, ab, ca], [ab, b, bc], [ca, bc, c], [ab, bc, ca]]
+        elements = refined
+    return bempp.Grid(np.array(vertices).T, np.array(elements, dtype="uint32").T)
+
+
+def test_frequency_continuation_matches_direct_solve():
+    """Recycled solves over several right-hand sides and wavenumbers."""
+    from bempp.api.linalg import FrequencyContinuationSolver
+    from bempp.api.operators.boundary import helmholtz, sparse
+    from scipy.linalg import solve
+
+    grid = sphere_grid(2)
+    space = bempp.function_space(grid, "P", 1)
+    identity = sparse.identity(space, space, space)
+    rng = np.random.default_rng(0)
+    rhs = [bempp.GridFunction(space, coefficients=rng.standard_normal(space.global_dof_count)
+                              + 1j * rng.standard_normal(space.global_dof_count))
+           for _ in range(3)]
+
+    # small restart and recycle dimensions: several cycles per solve
+    solver = FrequencyContinuationSolver(tol=1e-8, restart=12, recycle=4)
+    for k in [1.0, 1.2, 1.4, 1.6]:
+        A = 0.5 * identity - helmholtz.double_layer(space, space, space, k)
+        solutions, infos = solver.solve(A, rhs, k)
+        matrix = bempp.as_matrix(A.weak_form())
+        for b, x, info in zip(rhs, solutions, infos):
+            projections = b.projections(space)
+            reference = solve(matrix, projections)
+            assert info == 0
+            assert (np.linalg.norm(matrix @ x.coefficients - projections)
+                    <= 1e-8 * np.linalg.norm(projections) * 1.01)
+            assert (np.linalg.norm(x.coefficients - reference)
+                    <= 1e-5 * np.linalg.norm(reference))